@@ -0,0 +1,60 @@
+import importlib
+import time
+
+
+# subsystems the mission controller can run, each imported lazily by the process that runs it
+# a backend may define prepare_spare, run by a spare process before it takes over, for the part of its prepare phase
+# that doesn't need the hardware the running process holds
+BACKENDS = {
+    'data': ('data.data_rw', 'DataRW'),
+    'cv': ('cv.cv_detect', 'CVDetect'),
+    'controls': ('controls.controls_system', 'ControlsSystem'),
+}
+
+
+def register_backend(name, module_name, class_name):
+    """Register a subsystem backend by the module and class that implement it."""
+    BACKENDS[name] = (module_name, class_name)
+
+
+def load_backend(name, profiler=None):
+    """Import and construct a subsystem backend in the calling process."""
+    if name not in BACKENDS:
+        raise ValueError('Unknown subsystem: %s, choose from %s' % (name, sorted(BACKENDS)))
+    module_name, class_name = BACKENDS[name]
+
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    imported = time.perf_counter()
+    backend = getattr(module, class_name)()
+    constructed = time.perf_counter()
+
+    if profiler is not None:
+        profiler.record(name, 'import', imported - start)
+        profiler.record(name, 'construct', constructed - imported)
+    return backend
+
+
+class StartupProfiler:
+    def __init__(self, process_manager):
+        # seconds spent in each startup stage of each subsystem, shared across processes
+        self.timings = process_manager.dict()
+
+    def record(self, name, stage, seconds):
+        """Record the time a subsystem spent in a startup stage."""
+        self.timings[(name, stage)] = seconds
+
+    def measure(self, name, stage, function, *args):
+        """Call a function and record its run time as a startup stage of a subsystem."""
+        start = time.perf_counter()
+        result = function(*args)
+        self.record(name, stage, time.perf_counter() - start)
+        return result
+
+    def report(self):
+        """Print the startup cost of each subsystem by stage."""
+        timings = dict(self.timings)
+        for name in sorted(set(name for name, _ in timings)):
+            stages = ['%s %.3fs' % (stage, seconds) for (subsystem, stage), seconds in timings.items()
+                      if subsystem == name]
+            print('%s startup: %s' % (name, ', '.join(stages)))
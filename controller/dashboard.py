@@ -0,0 +1,158 @@
+import curses
+import sys
+
+import numpy as np
+
+from data.imu_buffer import ImuBuffer
+from .scheduler import PeriodicScheduler
+
+
+class Dashboard:
+    """Live view of a practice run, read from the shared state at a fixed rate so the mission loops never print."""
+
+    def __init__(self, heartbeats, throttle, imu_buffer=None, altitude=None, phase=None, prediction=None, rate=4.0,
+                 idle_rate=1.0, stages=None):
+        self.heartbeats = heartbeats
+        self.throttle = throttle
+        self.imu_buffer = imu_buffer
+        self.altitude = altitude
+        self.phase = phase
+        self.prediction = prediction
+        self.stages = stages
+
+        # refresh rate in Hz, lowered to the idle rate while the governor has practice output turned off
+        self.rate = rate
+        self.idle_rate = idle_rate
+
+        # next IMU sample to read, the latest one, and the minimum and maximum of each channel so far
+        self.next_sample = 0
+        self.latest = None
+        self.minimum = np.full(len(ImuBuffer.COLUMNS) - 1, np.inf)
+        self.maximum = np.full(len(ImuBuffer.COLUMNS) - 1, -np.inf)
+
+        # counts at the last refresh, to turn into rates
+        self.last_refresh = None
+        self.last_index = None
+        self.imu_rate = 0.0
+        self.detection_rate = 0.0
+
+    def update(self, now):
+        """Read the shared state since the last refresh."""
+        elapsed = now - self.last_refresh if self.last_refresh is not None else None
+        self.last_refresh = now
+
+        if self.imu_buffer is not None:
+            rows, end = self.imu_buffer.read(self.next_sample)
+            if len(rows):
+                self.latest = rows[-1]
+                self.minimum = np.minimum(self.minimum, rows[:, 1:].min(axis=0))
+                self.maximum = np.maximum(self.maximum, rows[:, 1:].max(axis=0))
+            if elapsed:
+                self.imu_rate = (end - self.next_sample) / elapsed
+            self.next_sample = end
+
+        if self.prediction is not None:
+            index = self.prediction['prediction']['index']
+            if elapsed and self.last_index is not None:
+                self.detection_rate = (index - self.last_index) / elapsed
+            self.last_index = index
+
+    def lines(self, now, mission_start, time_total):
+        """Text of the view, one string per line."""
+        lines = ['BX-4 practice  %5.1fs / %ds  governor level %d%s' % (
+            now - mission_start, time_total, self.throttle.level.value,
+            '' if self.throttle.setting('practice_output') else ', dashboard slowed')]
+        if self.phase is not None:
+            lines[0] += '  phase %s' % self.phase.phase()
+
+        # each subsystem's loop rate from its heartbeats, and how long since its last one
+        lines.append('')
+        lines.append('%-10s %10s %10s %10s' % ('Loop', 'Rate Hz', 'Period ms', 'Last ms'))
+        for name in self.heartbeats.names:
+            heartbeat = self.heartbeats.slot(name)
+            period = heartbeat.period()
+            last = heartbeat.last()
+            lines.append('%-10s %10.1f %10.2f %10s' % (name, 1.0 / period if period else 0.0, period * 1000,
+                                                       '%.1f' % ((now - last) * 1000) if last else '-'))
+
+        # where each loop's time goes, as a moving average of each of its stages
+        if self.stages is not None:
+            for name in self.stages.names:
+                lines.append('%-10s %s' % (name, '  '.join('%s %.2fms' % (stage, seconds * 1000)
+                                                           for stage, seconds in self.stages.slot(name).averages())))
+
+        # latest IMU sample with each channel's range so far
+        if self.imu_buffer is not None:
+            lines.append('')
+            lines.append('IMU %.1f Hz, %d samples' % (self.imu_rate, self.next_sample))
+            lines.append('%-10s %10s %10s %10s' % ('Channel', 'Latest', 'Min', 'Max'))
+            if self.latest is not None:
+                for column, name in enumerate(ImuBuffer.COLUMNS[1:]):
+                    lines.append('%-10s %10.3f %10.3f %10.3f' % (name, self.latest[column + 1], self.minimum[column],
+                                                                 self.maximum[column]))
+
+        if self.altitude is not None:
+            state = self.altitude.read()
+            apogee = state['apogee']
+            lines.append('')
+            lines.append('Altitude %.1fm, velocity %.1fm/s%s%s' % (
+                state['altitude'] - state['ground'], state['velocity'], ', launched' if state['launched'] else '',
+                ', apogee %.1fm' % (apogee['altitude'] - state['ground']) if apogee is not None else ''))
+
+        # latest detection and how old its frame is
+        if self.prediction is not None:
+            detection = self.prediction['prediction']
+            lines.append('')
+            if detection['xmin'] is None:
+                lines.append('Detections %.1f Hz, latest: none' % self.detection_rate)
+            else:
+                lines.append('Detections %.1f Hz, latest: x %d y %d w %d h %d, %.1fms old' % (
+                    self.detection_rate, detection['xmin'], detection['ymin'], detection['width'],
+                    detection['height'], (now - detection['timestamp']) * 1000))
+
+            # payload attitude estimated by the controls
+            attitude = self.prediction.get('attitude')
+            if attitude is not None:
+                lines.append('Attitude %s, rates %s rad/s' % (np.round(attitude['quaternion'], 3).tolist(),
+                                                             np.round(attitude['rates'], 3).tolist()))
+        return lines
+
+    def draw(self, screen, lines):
+        """Redraw the whole screen, over anything the subsystems printed in between."""
+        height, width = screen.getmaxyx()
+        screen.erase()
+        for row, line in enumerate(lines[:height - 1]):
+            screen.addnstr(row, 0, line, width - 1)
+        screen.redrawwin()
+        screen.refresh()
+
+    def loop(self, screen, mission_start, time_total):
+        """Refresh until just before the mission ends, leaving the terminal to the subsystems' final reports."""
+        scheduler = PeriodicScheduler(self.rate if screen is not None else self.idle_rate)
+        while True:
+            tick = scheduler.wait()
+            if tick + scheduler.period - mission_start > time_total:
+                break
+
+            # refresh less often if the governor turned practice output off
+            if screen is not None:
+                rate = self.rate if self.throttle.setting('practice_output') else self.idle_rate
+                if rate != scheduler.rate:
+                    scheduler.set_rate(rate)
+
+            self.update(tick)
+            lines = self.lines(tick, mission_start, time_total)
+            if screen is None:
+                print('\n'.join(lines) + '\n', flush=True)
+            else:
+                self.draw(screen, lines)
+
+    def run(self, mission_start, time_total):
+        """Show the view until the mission ends, with curses on a terminal and as plain text otherwise."""
+        if sys.stdout.isatty():
+            try:
+                curses.wrapper(self.loop, mission_start, time_total)
+                return
+            except curses.error:
+                pass
+        self.loop(None, mission_start, time_total)
@@ -0,0 +1,125 @@
+import multiprocessing
+import time
+
+
+# non-critical rates at each pressure level, the IMU and controls always run at full rate
+LEVELS = [
+    {'cv_frame_skip': 1, 'log_decimation': 1, 'practice_output': True},
+    {'cv_frame_skip': 2, 'log_decimation': 2, 'practice_output': True},
+    {'cv_frame_skip': 3, 'log_decimation': 4, 'practice_output': False},
+    {'cv_frame_skip': 5, 'log_decimation': 8, 'practice_output': False},
+]
+
+
+class Throttle:
+    def __init__(self):
+        # current pressure level in shared memory, set by the governor and read by every subsystem
+        self.level = multiprocessing.RawValue('i', 0)
+
+    def setting(self, name):
+        """Current value of a non-critical rate setting."""
+        return LEVELS[self.level.value][name]
+
+
+class Governor:
+    def __init__(self, throttle, heartbeats, deadlines=None, temperature_high=75.0, temperature_low=68.0,
+                 interval=0.5, hold=2.0,
+                 temperature_filepath='/sys/class/thermal/thermal_zone0/temp',
+                 frequency_filepath='/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq',
+                 max_frequency_filepath='/sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_max_freq'):
+        self.throttle = throttle
+        self.heartbeats = heartbeats
+
+        # longest allowed loop period of each critical subsystem in seconds
+        self.deadlines = {'data': 0.05, 'controls': 0.02} if deadlines is None else deadlines
+
+        # SoC temperatures in Celsius to throttle above and recover below
+        self.temperature_high = temperature_high
+        self.temperature_low = temperature_low
+
+        # seconds between checks, and the least time to stay at a level before changing again
+        self.interval = interval
+        self.hold = hold
+
+        self.temperature_filepath = temperature_filepath
+        self.frequency_filepath = frequency_filepath
+        self.max_frequency = self.read_sysfs(max_frequency_filepath)
+
+        # every change of level with the time, readings, and reason
+        self.decisions = []
+        self.last_check = 0.0
+        self.last_change = 0.0
+
+    def read_sysfs(self, filepath):
+        """Read an integer from sysfs, None if it isn't available on this machine."""
+        try:
+            with open(filepath, 'r') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def temperature(self):
+        """SoC temperature in Celsius."""
+        millidegrees = self.read_sysfs(self.temperature_filepath)
+        return None if millidegrees is None else millidegrees / 1000.0
+
+    def frequency(self):
+        """Current CPU frequency in kHz."""
+        return self.read_sysfs(self.frequency_filepath)
+
+    def missed_deadlines(self):
+        """Critical subsystems whose average loop period is longer than their deadline."""
+        missed = []
+        for name, deadline in self.deadlines.items():
+            if name in self.heartbeats.names and self.heartbeats.slot(name).period() > deadline:
+                missed.append(name)
+        return missed
+
+    def update(self, now=None):
+        """Check the SoC and loop timings and raise or lower the pressure level."""
+        now = time.perf_counter() if now is None else now
+        if now - self.last_check < self.interval:
+            return
+        self.last_check = now
+
+        temperature = self.temperature()
+        frequency = self.frequency()
+        missed = self.missed_deadlines()
+
+        # reasons to shed load
+        reasons = []
+        if temperature is not None and temperature >= self.temperature_high:
+            reasons.append('temperature')
+        # a lowered frequency on a warm SoC is throttling rather than the cpufreq governor idling
+        warm = temperature is not None and temperature > self.temperature_low
+        if warm and frequency is not None and self.max_frequency is not None and frequency < self.max_frequency:
+            reasons.append('frequency')
+        if missed:
+            reasons.append('deadline ' + '/'.join(missed))
+
+        # wait out the hold time so the level doesn't oscillate
+        level = self.throttle.level.value
+        if now - self.last_change < self.hold:
+            return
+        if reasons and level < len(LEVELS) - 1:
+            self.change(now, level + 1, '; '.join(reasons), temperature, frequency)
+        elif not reasons and level > 0 and (temperature is None or temperature <= self.temperature_low):
+            self.change(now, level - 1, 'recovered', temperature, frequency)
+
+    def change(self, now, level, reason, temperature, frequency):
+        """Set a new pressure level and record the decision."""
+        self.throttle.level.value = level
+        self.last_change = now
+        self.decisions.append((now, level, reason, temperature, frequency))
+
+    def report(self):
+        """One line per change of level."""
+        return '\n'.join('governor level %d: %s (temperature %s, frequency %s)' % decision[1:]
+                         for decision in self.decisions)
+
+    def save(self, filepath):
+        """Write the governor's decisions to a CSV file."""
+        with open(filepath, 'w') as file:
+            file.write('Time,Level,Reason,Temperature,Frequency\n')
+            for now, level, reason, temperature, frequency in self.decisions:
+                file.write('%f,%d,%s,%s,%s\n' % (now, level, reason, temperature, frequency))
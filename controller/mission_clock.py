@@ -0,0 +1,65 @@
+import multiprocessing
+import time
+
+
+class MissionClock:
+    def __init__(self, process_manager, parties, prepare_timeout=60, armed=False):
+        # every subsystem plus the mission controller waits on the barrier
+        self.ready_barrier = multiprocessing.Barrier(parties + 1)
+        self.start_event = multiprocessing.Event()
+        self.prepared_event = multiprocessing.Event()
+        self.mission_start = multiprocessing.Value('d', 0.0)
+        self.prepare_timeout = prepare_timeout
+
+        # time from the start of the prepare phase until each subsystem was ready
+        self.prepare_start = time.perf_counter()
+        self.time_to_ready = process_manager.dict()
+
+        # when armed, the mission clock starts at the launch detected by the flight data capture
+        self.armed = armed
+        self.launch_event = multiprocessing.Event()
+        self.launch_time = multiprocessing.Value('d', 0.0)
+
+        # whether this process already reported ready, each process has its own copy
+        self.arrived = False
+
+    def ready(self, name):
+        """Report a subsystem as ready and block until the shared mission clock starts."""
+        # subsystems restarted during the mission join the clock that's already running
+        if self.start_event.is_set():
+            return self.mission_start.value
+
+        if not self.arrived:
+            self.arrive(name)
+        self.start_event.wait()
+        return self.mission_start.value
+
+    def arrive(self, name):
+        """Report a subsystem as ready without waiting for the mission clock, to watch for launch."""
+        # subsystems restarted on the pad come back after the barrier was passed
+        if not self.prepared_event.is_set():
+            self.time_to_ready[name] = time.perf_counter() - self.prepare_start
+            self.ready_barrier.wait(self.prepare_timeout)
+        self.arrived = True
+
+    def launch(self, launch_time):
+        """Start the armed mission clock at the detected launch."""
+        self.launch_time.value = launch_time
+        self.launch_event.set()
+
+    def start(self, poll=None, poll_interval=0.1):
+        """Wait for every subsystem to be ready, then start the shared mission clock, at launch if armed.
+
+        While armed, poll is called every poll_interval seconds until launch, to check on the subsystem watching for it.
+        """
+        self.ready_barrier.wait(self.prepare_timeout)
+        self.prepared_event.set()
+        if self.armed:
+            while not self.launch_event.wait(poll_interval):
+                if poll is not None:
+                    poll()
+            self.mission_start.value = self.launch_time.value
+        else:
+            self.mission_start.value = time.perf_counter()
+        self.start_event.set()
+        return self.mission_start.value
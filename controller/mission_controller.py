@@ -1,17 +1,26 @@
 import multiprocessing
 import os
-import time
+import threading
+from datetime import datetime
 
-from data import data_rw
-from cv import cv_detect
-from controls import controls_system
+from data.altitude import AltitudeState
+from data.profiles import PhaseState
+from data.imu_buffer import ImuBuffer
+from .backends import load_backend, StartupProfiler
+from .dashboard import Dashboard
+from .governor import Governor, Throttle
+from .mission_clock import MissionClock
+from .stages import StageTimes
+from .supervisor import Heartbeats, Supervisor
 
 
 class MissionController:
     def __init__(self, time_total=20, data_dirpath=os.path.abspath('./data/output/IMU/'),
                  model_filepath=os.path.abspath('./cv/efficientdet-lite2-rocket-quant_edgetpu.tflite'),
                  labels_filepath=os.path.abspath('./cv/rocket-labels.txt'), camera_width=448, camera_height=448,
-                 threshold=0.25):
+                 threshold=0.25, prepare_timeout=60, subsystems=('cv', 'controls', 'data'), profile_startup=False,
+                 heartbeat_timeout=1.0, max_restarts=5, spares=('cv',), armed=False, log_format='csv',
+                 dashboard_rate=4.0):
         # variables related to computer vision
         self.time_total = time_total
         self.data_dirpath = data_dirpath
@@ -21,26 +30,86 @@ class MissionController:
         self.camera_height = camera_height
         self.threshold = threshold
 
-        # objects that run flight data capture, computer vision, and controls
-        self.data = data_rw.DataRW()
-        self.detect = cv_detect.CVDetect()
-        self.controls = controls_system.ControlsSystem()
+        # longest time any subsystem may take to prepare before the mission is aborted
+        self.prepare_timeout = prepare_timeout
+
+        # flight data capture, computer vision, and controls to run, each loaded lazily in its own process
+        self.subsystems = subsystems
+
+        # restart failed subsystems, from a spare process with the backend already imported if there is one
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_restarts = max_restarts
+        self.spares = [name for name in spares if name in subsystems]
+
+        # wait on the pad for the flight data capture to detect launch, and start the mission clock then
+        if armed and 'data' not in subsystems:
+            raise ValueError('An armed run needs the data subsystem to detect launch')
+        self.armed = armed
+
+        # flight data as CSV text or a block compressed log
+        self.log_format = log_format
+
+        # refresh rate in Hz of the live view of a practice run, which reads the shared state in its own process
+        self.dashboard_rate = dashboard_rate
 
         # run multiple processes and share memory across them
         self.process_manager = multiprocessing.Manager()
 
-    def execute_collecting_data(self, mission_start, run):
+        # measure import and init time of each subsystem if requested
+        self.profiler = StartupProfiler(self.process_manager) if profile_startup else None
+
+    def execute_collecting_data(self, clock, heartbeat, throttle, imu_buffer, altitude, phase, stages, run,
+                                takeover=None):
         """Data capture."""
-        self.data.rw(mission_start, self.time_total, self.data_dirpath, run)
+        data = self.load('data', takeover)
+        self.measure_prepare('data', data.prepare)
+
+        # when armed, watch for launch at a low rate and keep the samples from just before it
+        pre_trigger = None
+        if self.armed and not clock.launch_event.is_set():
+            clock.arrive('data')
+            launch_time, pre_trigger = data.arm(run, heartbeat)
+            clock.launch(launch_time)
 
-    def execute_object_detection(self, mission_start, prediction, run):
+        mission_start = clock.ready('data')
+        data.rw(mission_start, self.time_total, self.data_dirpath, run, heartbeat, imu_buffer, throttle, altitude,
+                pre_trigger, phase, self.log_format, stages)
+
+    def execute_object_detection(self, clock, heartbeat, throttle, prediction, phase, stages, run, takeover=None):
         """Computer vision."""
-        self.detect.cv(mission_start, self.time_total, self.camera_width, self.camera_height, self.model_filepath,
-                       self.labels_filepath, self.threshold, prediction, run)
+        detect = self.load('cv', takeover, self.labels_filepath)
+        self.measure_prepare('cv', detect.prepare, self.camera_width, self.camera_height, self.model_filepath,
+                             self.labels_filepath, self.threshold)
+        mission_start = clock.ready('cv')
+        detect.cv(mission_start, self.time_total, self.camera_width, self.camera_height, self.model_filepath,
+                  self.labels_filepath, self.threshold, prediction, run, heartbeat, throttle, phase, stages)
 
-    def execute_controls_systems(self, mission_start, prediction, run):
+    def execute_controls_systems(self, clock, heartbeat, throttle, imu_buffer, prediction, run, takeover=None):
         """Controls."""
-        self.controls.controls(mission_start, self.time_total, prediction, run)
+        controls = self.load('controls', takeover)
+        self.measure_prepare('controls', controls.prepare)
+        mission_start = clock.ready('controls')
+        controls.controls(mission_start, self.time_total, prediction, run, heartbeat, imu_buffer)
+
+    def load(self, name, takeover=None, *spare_args):
+        """Load a subsystem's backend, and if it's a spare, prepare what it can and wait to take over from a failure.
+
+        A spare runs its backend's prepare_spare, if it has one, before it can be promoted. The rest of the prepare
+        phase needs hardware the running process holds, so it runs once the spare takes over.
+        """
+        backend = load_backend(name, self.profiler)
+        if takeover is not None:
+            prepare_spare = getattr(backend, 'prepare_spare', None)
+            if prepare_spare is not None:
+                prepare_spare(*spare_args)
+            takeover.wait()
+        return backend
+
+    def measure_prepare(self, name, prepare, *args):
+        """Run a subsystem's prepare phase, timing it if startup profiling is on."""
+        if self.profiler is not None:
+            return self.profiler.measure(name, 'prepare', prepare, *args)
+        return prepare(*args)
 
     def execute_mission(self, run):
         """BX-4 Mission."""
@@ -52,24 +121,122 @@ class MissionController:
                 "ymin": None,
                 "width": None,
                 "height": None,
-                "index": -1
-            }
+                "index": -1,
+                "timestamp": None
+            },
+            'fused': None,
+            'attitude': None
         })
 
-        # synchronize mission time across multiple processes
-        mission_start = time.perf_counter()
+        # recent IMU samples in shared memory, stamped on the mission clock
+        imu_buffer = ImuBuffer()
+
+        # altitude, vertical velocity, and apogee in shared memory, updated at the IMU rate
+        altitude = AltitudeState()
+
+        # flight phase detected by data capture, which sets the sensor and camera rates
+        phase = PhaseState()
+
+        # synchronize mission time across multiple processes once every subsystem is prepared
+        clock = MissionClock(self.process_manager, len(self.subsystems), self.prepare_timeout, self.armed)
+
+        # heartbeats in shared memory let the supervisor detect subsystems that died or hung
+        heartbeats = Heartbeats(self.subsystems)
+
+        # time each stage of the computer vision and data capture loops for the dashboard
+        stages = StageTimes(self.subsystems)
+
+        # lower non-critical rates under thermal or load pressure so the IMU and controls keep their deadlines
+        throttle = Throttle()
+        governor = Governor(throttle, heartbeats)
+
+        # prepare the chosen computer vision, controls, and data capture for multiprocessing
+        targets = {
+            'cv': (self.execute_object_detection, (prediction, phase, stages.slot('cv'), run,)),
+            'controls': (self.execute_controls_systems, (imu_buffer, prediction, run,)),
+            'data': (self.execute_collecting_data, (imu_buffer, altitude, phase, stages.slot('data'), run,)),
+        }
+
+        def start_process(name, takeover=None):
+            target, args = targets[name]
+            process = multiprocessing.Process(target=target,
+                                              args=(clock, heartbeats.slot(name), throttle) + args + (takeover,))
+            process.start()
+            return process
+
+        def start_spare(name):
+            takeover = multiprocessing.Event()
+            return start_process(name, takeover), takeover
+
+        def restart(name):
+            # promote the pre-warmed spare and warm a new one, or re-initialize from scratch without a spare
+            if name in spares:
+                process, takeover = spares.pop(name)
+                takeover.set()
+                spares[name] = start_spare(name)
+                return process
+            return start_process(name)
+
+        def stop():
+            for process in processes.values():
+                process.terminate()
+                process.join()
+
+        # start computer vision, controls, and data capture processes so they can prepare
+        processes = {name: start_process(name) for name in self.subsystems}
+        spares = {}
+        supervisor = Supervisor(heartbeats, self.heartbeat_timeout, self.max_restarts)
+
+        # start the mission clock once every subsystem is ready, or at launch if armed, abort if one never gets ready
+        # while armed, restart the flight data capture if it dies or hangs on the pad, abort once it's out of restarts
+        if self.armed and run == 'practice':
+            print('armed, the mission starts at launch')
+        try:
+            mission_start = clock.start(lambda: supervisor.watch(processes, restart, ['data']))
+        except threading.BrokenBarrierError:
+            stop()
+            raise RuntimeError('Subsystems not ready after %ds, ready: %s' %
+                               (self.prepare_timeout, sorted(clock.time_to_ready.keys())))
+        except RuntimeError:
+            stop()
+            raise
+
+        # report how long each subsystem took to get ready
+        self.time_to_ready = dict(clock.time_to_ready)
+        for name, seconds in sorted(self.time_to_ready.items()):
+            print('%s ready in %.3fs' % (name, seconds))
+        if self.profiler is not None:
+            self.profiler.report()
+
+        # show the shared state live in a practice run, from its own process so terminal output never slows the loops
+        dashboard = None
+        if run == 'practice' and self.dashboard_rate:
+            view = Dashboard(heartbeats, throttle, imu_buffer, altitude, phase, prediction, self.dashboard_rate,
+                             stages=stages)
+            dashboard = multiprocessing.Process(target=view.run, args=(mission_start, self.time_total))
+            dashboard.start()
+
+        # pre-warm spares once the mission is running so they don't slow down the prepare phase
+        spares = {name: start_spare(name) for name in self.spares}
 
-        # prepare computer vision, controls, and data capture for multiprocessing
-        cv_process = multiprocessing.Process(target=self.execute_object_detection, args=(mission_start, prediction, run,))
-        controls_process = multiprocessing.Process(target=self.execute_controls_systems, args=(mission_start, prediction, run,))
-        data_process = multiprocessing.Process(target=self.execute_collecting_data, args=(mission_start, run,))
+        # supervise computer vision, controls, and data capture until completion
+        # the shared prediction, including its index, lives in the manager so restarted subsystems carry it over
+        supervisor.supervise(processes, restart, mission_start + self.time_total, governor)
+        self.recoveries = supervisor.recoveries
+        if dashboard is not None:
+            dashboard.join(1.0)
+            if dashboard.is_alive():
+                dashboard.terminate()
+                dashboard.join()
 
-        # start computer vision, controls, and data capture processes
-        cv_process.start()
-        controls_process.start()
-        data_process.start()
+        # keep the governor's decisions with the flight data, and list them once the dashboard is gone if practice run
+        if governor.decisions:
+            date = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+            governor.save(os.path.join(self.data_dirpath, date + '_governor.csv'))
+            if run == 'practice':
+                print(governor.report())
 
-        # join computer vision, controls, and data capture processes after completion
-        cv_process.join()
-        controls_process.join()
-        data_process.join()
+        # stop spares that were never needed
+        for process, _ in spares.values():
+            process.terminate()
+            process.join()
@@ -0,0 +1,136 @@
+import math
+import time
+
+
+class PeriodicScheduler:
+    def __init__(self, rate, policy='skip', max_catch_up=5, clock=time.perf_counter, sleep=time.sleep):
+        if policy not in ('skip', 'catch_up'):
+            raise ValueError('Unknown overrun policy: %s, choose from skip or catch_up' % policy)
+
+        # declared rate in Hz and what to do about releases missed by an overrun
+        # skip: drop the missed releases and stay on the original grid of deadlines
+        # catch_up: run the missed releases back to back, up to max_catch_up of them, then skip the rest
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+
+        # monotonic clock and sleep, replaceable to run on a virtual clock
+        self.clock = clock
+        self.sleep = sleep
+
+        self.deadline = None
+        self.last_release = None
+
+        # release lateness (jitter), period, and work time statistics, and overrun accounting
+        self.releases = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_mean = 0.0
+        self.jitter_m2 = 0.0
+        self.jitter_max = 0.0
+        self.period_mean = 0.0
+        self.period_max = 0.0
+        self.work_mean = 0.0
+        self.work_max = 0.0
+
+    def start(self, now=None):
+        """Set the first deadline, released right away."""
+        self.deadline = self.clock() if now is None else now
+
+    def set_rate(self, rate):
+        """Change the rate, the next deadline moving to one new period after the last release."""
+        self.rate = rate
+        self.period = 1.0 / rate
+        if self.last_release is not None:
+            self.deadline = self.last_release + self.period
+
+    def wait(self):
+        """Sleep until the next absolute deadline and return the release time.
+
+        Deadlines are kept on a fixed grid so sleep overshoot never accumulates into drift.
+        """
+        now = self.clock()
+        if self.deadline is None:
+            self.start(now)
+
+        # time spent working since the last release
+        if self.last_release is not None:
+            work = now - self.last_release
+            self.work_mean += (work - self.work_mean) / self.releases
+            self.work_max = max(self.work_max, work)
+
+        # sleep until the deadline, or release right away after an overrun
+        if now < self.deadline:
+            self.sleep(self.deadline - now)
+        else:
+            self.overrun(now)
+        return self.release(self.clock())
+
+    def poll(self, now=None):
+        """Release without sleeping if the next deadline is less than half a period away, for a loop paced by
+        something else, such as a camera's frames.
+
+        Returns the release time, or None if it's too early and this turn of the loop should be dropped.
+        """
+        now = self.clock() if now is None else now
+        if self.deadline is None:
+            self.start(now)
+        if now <= self.deadline - self.period / 2:
+            return None
+
+        # only a release missed altogether is an overrun, the pacing itself drifts around the deadlines
+        if now >= self.deadline + self.period / 2:
+            self.overrun(now)
+        return self.release(now)
+
+    def overrun(self, now):
+        """Account for releases missed by the time now is past the deadline."""
+        if self.last_release is None or now < self.deadline:
+            return
+        self.overruns += 1
+        missed = int(math.floor((now - self.deadline) / self.period))
+        if missed and (self.policy == 'skip' or missed > self.max_catch_up):
+            self.skipped += missed
+            self.deadline += missed * self.period
+
+    def release(self, release):
+        """Record a release at the given time and move on to the next deadline."""
+        # release statistics
+        self.releases += 1
+        jitter = release - self.deadline
+        delta = jitter - self.jitter_mean
+        self.jitter_mean += delta / self.releases
+        self.jitter_m2 += delta * (jitter - self.jitter_mean)
+        self.jitter_max = max(self.jitter_max, jitter)
+        if self.last_release is not None:
+            period = release - self.last_release
+            self.period_mean += (period - self.period_mean) / (self.releases - 1)
+            self.period_max = max(self.period_max, period)
+
+        self.last_release = release
+        self.deadline += self.period
+        return release
+
+    def stats(self):
+        """Timing statistics of the releases so far, times in seconds."""
+        return {
+            'rate': self.rate,
+            'releases': self.releases,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'jitter_mean': self.jitter_mean,
+            'jitter_std': math.sqrt(self.jitter_m2 / self.releases) if self.releases else 0.0,
+            'jitter_max': self.jitter_max,
+            'period_mean': self.period_mean,
+            'period_max': self.period_max,
+            'work_mean': self.work_mean,
+            'work_max': self.work_max
+        }
+
+    def report(self, name):
+        """One line summary of the timing statistics."""
+        return ('%s: ' % name + '%(releases)d releases at %(rate)g Hz, period %(period_mean).4fs mean '
+                '%(period_max).4fs max, jitter %(jitter_mean).5fs mean %(jitter_std).5fs std %(jitter_max).5fs max, '
+                'work %(work_mean).4fs mean %(work_max).4fs max, %(overruns)d overruns, %(skipped)d skipped'
+                % self.stats())
@@ -0,0 +1,41 @@
+import multiprocessing
+
+
+# stages of each subsystem's loop that are timed, in the order they run
+STAGES = {
+    'cv': ('capture', 'preprocess', 'inference'),
+    'data': ('read', 'fuse', 'write'),
+}
+
+
+class StageTimer:
+    def __init__(self, times, offset, stages):
+        self.times = times
+        self.offset = offset
+        self.stages = stages
+
+    def record(self, stage, seconds):
+        """Add the time a stage of the loop took to its moving average."""
+        index = self.offset + self.stages.index(stage)
+        average = self.times[index]
+        self.times[index] = seconds if average == 0 else 0.9 * average + 0.1 * seconds
+
+    def averages(self):
+        """Moving average in seconds of each stage's time, 0 until it has run, as (stage, seconds) in loop order."""
+        return [(stage, self.times[self.offset + index]) for index, stage in enumerate(self.stages)]
+
+
+class StageTimes:
+    def __init__(self, names):
+        # one moving average per stage of each timed subsystem in shared memory, written without a lock by one process
+        self.names = [name for name in names if name in STAGES]
+        self.offsets = {}
+        for name in self.names:
+            self.offsets[name] = sum(len(STAGES[other]) for other in self.offsets)
+        self.times = multiprocessing.RawArray('d', sum(len(STAGES[name]) for name in self.names))
+
+    def slot(self, name):
+        """Stage times of a single subsystem, None if its stages aren't timed."""
+        if name not in self.offsets:
+            return None
+        return StageTimer(self.times, self.offsets[name], STAGES[name])
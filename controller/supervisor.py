@@ -0,0 +1,139 @@
+import multiprocessing
+import time
+
+
+class Heartbeat:
+    def __init__(self, beats, periods, index):
+        self.beats = beats
+        self.periods = periods
+        self.index = index
+
+    def beat(self):
+        """Mark the subsystem as alive at the current time and update its average loop period."""
+        now = time.perf_counter()
+        last = self.beats[self.index]
+        if last > 0:
+            period = self.periods[self.index]
+            self.periods[self.index] = now - last if period == 0 else 0.9 * period + 0.1 * (now - last)
+        self.beats[self.index] = now
+
+    def reset(self):
+        """Clear the last heartbeat until the subsystem's loop is running again."""
+        self.beats[self.index] = 0.0
+        self.periods[self.index] = 0.0
+
+    def last(self):
+        """Time of the last heartbeat, 0 if the subsystem's loop hasn't started."""
+        return self.beats[self.index]
+
+    def period(self):
+        """Moving average of the time between heartbeats, 0 until there have been two."""
+        return self.periods[self.index]
+
+
+class Heartbeats:
+    def __init__(self, names):
+        # one heartbeat time and loop period per subsystem in shared memory, written without a lock by one process each
+        self.names = list(names)
+        self.beats = multiprocessing.RawArray('d', len(self.names))
+        self.periods = multiprocessing.RawArray('d', len(self.names))
+
+    def slot(self, name):
+        """Heartbeat of a single subsystem."""
+        return Heartbeat(self.beats, self.periods, self.names.index(name))
+
+
+class Supervisor:
+    def __init__(self, heartbeats, heartbeat_timeout=1.0, max_restarts=5, poll_interval=0.01, shutdown_timeout=10):
+        self.heartbeats = heartbeats
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_restarts = max_restarts
+        self.poll_interval = poll_interval
+
+        # longest time a subsystem may keep running after the mission ends
+        self.shutdown_timeout = shutdown_timeout
+
+        # restarts and time-to-recovery of each subsystem
+        self.restarts = {name: 0 for name in heartbeats.names}
+        self.recoveries = []
+
+    def failed(self, name, process, now):
+        """Check if a subsystem's process died or stopped sending heartbeats."""
+        if not process.is_alive():
+            return process.exitcode != 0
+        last = self.heartbeats.slot(name).last()
+        return last > 0 and now - last > self.heartbeat_timeout
+
+    def replace(self, name, processes, restart):
+        """Stop a failed subsystem's process and start its replacement."""
+        process = processes[name]
+        if process.is_alive():
+            print('%s stopped sending heartbeats, restarting' % name)
+            process.terminate()
+        else:
+            print('%s failed with exit code %s, restarting' % (name, process.exitcode))
+        process.join()
+        self.heartbeats.slot(name).reset()
+        self.restarts[name] += 1
+        processes[name] = restart(name)
+
+    def watch(self, processes, restart, names):
+        """Restart the named subsystems if they fail before the mission starts, raising once one is out of restarts.
+
+        They have nothing to finish before the mission, so exiting at all counts as a failure.
+        """
+        now = time.perf_counter()
+        for name in names:
+            process = processes[name]
+            if process.is_alive() and not self.failed(name, process, now):
+                continue
+            if self.restarts[name] >= self.max_restarts:
+                process.terminate()
+                process.join()
+                raise RuntimeError('%s failed before the mission started after %d restarts'
+                                   % (name, self.restarts[name]))
+            self.replace(name, processes, restart)
+
+    def supervise(self, processes, restart, mission_end, governor=None):
+        """Watch the subsystem processes until the mission ends, restarting any that fail."""
+        # subsystems waiting on their replacement's first heartbeat, with the time the failure was detected
+        recovering = {}
+
+        while True:
+            now = time.perf_counter()
+
+            for name, process in list(processes.items()):
+                # log time-to-recovery once a replacement's loop is running
+                if name in recovering and self.heartbeats.slot(name).last() > recovering[name]:
+                    recovery = self.heartbeats.slot(name).last() - recovering.pop(name)
+                    self.recoveries.append((name, recovery))
+                    print('%s recovered in %.1fms' % (name, recovery * 1000))
+
+                # restart failed subsystems while there's mission time left
+                if now >= mission_end or not self.failed(name, process, now):
+                    continue
+                if self.restarts[name] >= self.max_restarts:
+                    continue
+                self.replace(name, processes, restart)
+                recovering[name] = now
+
+            # adapt non-critical rates to thermal and load pressure
+            if governor is not None:
+                governor.update(now)
+
+            # finished once every subsystem has exited
+            if not any(process.is_alive() for process in processes.values()):
+                break
+
+            # stop subsystems that hang past the end of the mission
+            if now > mission_end + self.shutdown_timeout:
+                for name, process in processes.items():
+                    if process.is_alive():
+                        print('%s still running after the mission, stopping' % name)
+                        process.terminate()
+                break
+
+            time.sleep(self.poll_interval)
+
+        for process in processes.values():
+            process.join()
@@ -0,0 +1,219 @@
+import argparse
+import math
+import threading
+import time
+
+import numpy as np
+
+from controller.scheduler import PeriodicScheduler
+from .actuators import Actuator, SimulatedGimbal
+
+AXES = ('pan', 'tilt')
+
+
+class Driver:
+    """Interface for the bus to the motor controllers, written one axis at a time."""
+
+    def write(self, axis, value, now):
+        """Send a rate command in degrees per second to one axis."""
+        raise NotImplementedError
+
+    def turning_rates(self):
+        """Pan and tilt rates in degrees per second the axes are driven at, None if the motors don't report them."""
+        return None
+
+    def close(self):
+        """Release the bus."""
+        pass
+
+
+class SimulatedDriver(Driver):
+    def __init__(self, gimbal=None, bitrate=100000, bytes_per_write=6, bits_per_byte=9):
+        # gimbal to pass the commands on to, if any
+        self.gimbal = gimbal
+        self.rates = {axis: 0.0 for axis in AXES}
+
+        # bus speed in bits per second and the size of a write, by default an I2C write of address, register, and
+        # a 32 bit value with acknowledge bits
+        self.bitrate = bitrate
+        self.bytes_per_write = bytes_per_write
+        self.bits_per_byte = bits_per_byte
+
+        # every write as (time, axis, value), and the time the bus was busy in seconds
+        self.writes = []
+        self.busy = 0.0
+
+    def write(self, axis, value, now):
+        """Record the write and pass it on to the gimbal."""
+        self.writes.append((now, axis, value))
+        self.busy += self.bytes_per_write * self.bits_per_byte / float(self.bitrate)
+        self.rates[axis] = value
+        if self.gimbal is not None:
+            self.gimbal.command(self.rates['pan'], self.rates['tilt'], now)
+
+    def turning_rates(self):
+        return self.gimbal.turning_rates() if self.gimbal is not None else None
+
+    def close(self):
+        if self.gimbal is not None:
+            self.gimbal.close()
+
+
+class ActuatorOutput(Actuator):
+    def __init__(self, driver, rate=50, max_rate=180.0, max_slew=1800.0, deadband=0.05, clock=time.perf_counter):
+        # pluggable bus to the motor controllers, written on a fixed-rate tick in Hz of its own
+        self.driver = driver
+        self.rate = rate
+        self.clock = clock
+
+        # per axis, the largest rate command in degrees per second and how fast it may change in degrees per second
+        # squared, and the smallest change worth a write
+        self.max_rate = max_rate if isinstance(max_rate, dict) else {axis: max_rate for axis in AXES}
+        self.max_slew = max_slew if isinstance(max_slew, dict) else {axis: max_slew for axis in AXES}
+        self.deadband = deadband
+
+        # the latest command per axis, replacing older ones, with the time it was given until it's first written
+        self.targets = {}
+        self.lock = threading.Lock()
+
+        # what was last sent per axis, and when
+        self.sent = {axis: 0.0 for axis in AXES}
+        self.last_flush = None
+
+        # commands given and replaced before they were sent, writes to the driver, and the latency from each command
+        # to its first write
+        self.commands = 0
+        self.coalesced = 0
+        self.writes = 0
+        self.latencies = []
+
+        self.thread = None
+        self.stop = threading.Event()
+
+    def command(self, pan_rate, tilt_rate, now=None):
+        """Queue the rates for the next tick, replacing any not sent yet."""
+        now = self.clock() if now is None else now
+        with self.lock:
+            self.commands += 1
+            self.coalesced += 1 if any(commanded is not None for _, commanded in self.targets.values()) else 0
+            self.targets = {'pan': (pan_rate, now), 'tilt': (tilt_rate, now)}
+
+    def flush(self, now=None):
+        """Move each axis toward its latest command, rate and slew limited, skipping axes that wouldn't change.
+
+        A command the slew limit holds back keeps being slewed toward on the following ticks.
+        """
+        now = self.clock() if now is None else now
+        with self.lock:
+            targets = self.targets
+            self.targets = {axis: (value, None) for axis, (value, _) in targets.items()}
+        dt = 1.0 / self.rate if self.last_flush is None else now - self.last_flush
+        self.last_flush = now
+
+        for axis, (value, commanded) in targets.items():
+            value = min(max(value, -self.max_rate[axis]), self.max_rate[axis])
+            step = self.max_slew[axis] * dt
+            value = min(max(value, self.sent[axis] - step), self.sent[axis] + step)
+            if abs(value - self.sent[axis]) < self.deadband:
+                continue
+            self.driver.write(axis, value, now)
+            self.writes += 1
+            self.sent[axis] = value
+            if commanded is not None:
+                self.latencies.append(now - commanded)
+
+    def run(self):
+        """Flush on a fixed-rate tick until stopped."""
+        scheduler = PeriodicScheduler(self.rate)
+        while not self.stop.is_set():
+            self.flush(scheduler.wait())
+
+    def start(self):
+        """Start flushing on a thread of its own."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def close(self):
+        """Stop the tick, then stop the axes right away and release the driver."""
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            self.targets = {}
+        now = self.clock()
+        for axis in AXES:
+            self.driver.write(axis, 0.0, now)
+            self.writes += 1
+            self.sent[axis] = 0.0
+        self.driver.close()
+
+    def turning_rates(self):
+        """Pan and tilt rates the axes are driven at, as the driver reports them or else as last sent."""
+        rates = self.driver.turning_rates()
+        return (self.sent['pan'], self.sent['tilt']) if rates is None else rates
+
+    def stats(self):
+        """Command and write counts, and the latency from command to write in seconds."""
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            'commands': self.commands,
+            'coalesced': self.coalesced,
+            'writes': self.writes,
+            'latency_mean': float(latencies.mean()),
+            'latency_p99': float(np.percentile(latencies, 99)),
+            'latency_max': float(latencies.max())
+        }
+
+
+def benchmark(duration, controls_rate, output_rate, bitrate):
+    """Command a simulated gimbal from a control loop for a while and measure the output's latency and bus use."""
+    driver = SimulatedDriver(SimulatedGimbal(), bitrate=bitrate)
+    output = ActuatorOutput(driver, output_rate)
+    scheduler = PeriodicScheduler(controls_rate)
+    output.start()
+    start = scheduler.wait()
+    now = start
+    while now - start < duration:
+        phase = 2.0 * math.pi * 0.5 * (now - start)
+        output.command(90.0 * math.sin(phase), 45.0 * math.cos(phase), now)
+        now = scheduler.wait()
+    output.close()
+    stats = output.stats()
+    stats['utilization'] = driver.busy / (now - start)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the actuator output on a simulated bus.')
+    parser.add_argument(
+        '--duration',
+        default=10.0,
+        type=float,
+        help='Seconds to run')
+    parser.add_argument(
+        '--controls-rate',
+        default=100,
+        type=int,
+        help='Rate the controls give commands at in Hz')
+    parser.add_argument(
+        '--output-rate',
+        default=50,
+        type=int,
+        help='Rate commands are flushed to the bus at in Hz')
+    parser.add_argument(
+        '--bitrate',
+        default=100000,
+        type=int,
+        help='Bus speed in bits per second')
+    args = parser.parse_args()
+
+    stats = benchmark(args.duration, args.controls_rate, args.output_rate, args.bitrate)
+    print('%(commands)d commands, %(coalesced)d coalesced, %(writes)d writes, latency %(latency_mean).4fs mean '
+          '%(latency_p99).4fs p99 %(latency_max).4fs max, bus %(utilization).3f%% busy' %
+          dict(stats, utilization=100 * stats['utilization']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import time
+
+
+class Actuator:
+    """Interface for the gimbal that pivots the payload, commanded with pan and tilt rates in degrees per second."""
+
+    def start(self):
+        """Get ready to take commands once the mission starts."""
+        pass
+
+    def command(self, pan_rate, tilt_rate, now=None):
+        """Drive the pan and tilt axes at the given rates."""
+        raise NotImplementedError
+
+    def turning_rates(self):
+        """Pan and tilt rates in degrees per second the axes are driven at after every limit, None if unknown."""
+        return None
+
+    def close(self):
+        """Stop the axes and release the hardware."""
+        pass
+
+
+class SimulatedGimbal(Actuator):
+    def __init__(self, max_rate=180.0, pan_limits=(-180.0, 180.0), tilt_limits=(-90.0, 90.0), record=True):
+        # fastest each axis can turn in degrees per second, and the travel of each axis in degrees
+        self.max_rate = max_rate
+        self.pan_limits = pan_limits
+        self.tilt_limits = tilt_limits
+
+        # current angles and rates of the axes
+        self.pan = 0.0
+        self.tilt = 0.0
+        self.pan_rate = 0.0
+        self.tilt_rate = 0.0
+        self.last_time = None
+
+        # every command with the time it was received, for testing and benchmarking
+        self.record = record
+        self.commands = []
+
+    def advance(self, now):
+        """Move the axes at their current rates up to the given time."""
+        if self.last_time is not None:
+            dt = now - self.last_time
+            self.pan = min(max(self.pan + self.pan_rate * dt, self.pan_limits[0]), self.pan_limits[1])
+            self.tilt = min(max(self.tilt + self.tilt_rate * dt, self.tilt_limits[0]), self.tilt_limits[1])
+        self.last_time = now
+
+    def command(self, pan_rate, tilt_rate, now=None):
+        """Drive the pan and tilt axes at the given rates, limited to what the motors can do."""
+        now = time.perf_counter() if now is None else now
+        self.advance(now)
+        self.pan_rate = min(max(pan_rate, -self.max_rate), self.max_rate)
+        self.tilt_rate = min(max(tilt_rate, -self.max_rate), self.max_rate)
+        if self.record:
+            self.commands.append((now, self.pan_rate, self.tilt_rate))
+
+    def turning_rates(self):
+        """Pan and tilt rates the axes are driven at, none against an end-stop."""
+        return (self.limited(self.pan, self.pan_rate, self.pan_limits),
+                self.limited(self.tilt, self.tilt_rate, self.tilt_limits))
+
+    def limited(self, angle, rate, limits):
+        return 0.0 if (angle <= limits[0] and rate < 0) or (angle >= limits[1] and rate > 0) else rate
+
+    def close(self):
+        """Stop the axes."""
+        self.pan_rate = 0.0
+        self.tilt_rate = 0.0
@@ -0,0 +1,334 @@
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+
+
+def quaternion_to_euler(quaternion):
+    """Roll, pitch, and yaw in degrees from a (w, x, y, z) unit quaternion."""
+    q0, q1, q2, q3 = quaternion
+    roll = math.atan2(2 * (q0 * q1 + q2 * q3), 1 - 2 * (q1 * q1 + q2 * q2))
+    pitch = math.asin(max(-1.0, min(1.0, 2 * (q0 * q2 - q3 * q1))))
+    yaw = math.atan2(2 * (q0 * q3 + q1 * q2), 1 - 2 * (q2 * q2 + q3 * q3))
+    return [math.degrees(roll), math.degrees(pitch), math.degrees(yaw)]
+
+
+class AttitudeEstimator:
+    def __init__(self, method='madgwick', beta=0.1, kp=1.0, ki=0.0, history_size=1024, max_dt=0.1):
+        if method not in ('madgwick', 'mahony'):
+            raise ValueError('Unknown attitude estimator: %s, choose from madgwick or mahony' % method)
+        self.method = method
+
+        # Madgwick gradient descent gain, and Mahony proportional and integral gains
+        self.beta = beta
+        self.kp = kp
+        self.ki = ki
+
+        # longest gap between samples that is integrated, e.g. after a restart
+        self.max_dt = max_dt
+
+        # preallocated state: the orientation as a (w, x, y, z) quaternion, the Mahony integral, the last sample
+        self.q0, self.q1, self.q2, self.q3 = 1.0, 0.0, 0.0, 0.0
+        self.integral_x, self.integral_y, self.integral_z = 0.0, 0.0, 0.0
+        self.last_time = None
+        self.rates = np.zeros(3)
+
+        # ring of recent (time, w, x, y, z) estimates for looking up the attitude at a past instant
+        self.history = np.zeros((history_size, 5))
+        self.history_count = 0
+
+    def quaternion(self):
+        """Current orientation as a (w, x, y, z) quaternion."""
+        return [self.q0, self.q1, self.q2, self.q3]
+
+    def level(self, accelerometer):
+        """Start from the orientation that has gravity along an accelerometer reading, with no yaw."""
+        ax, ay, az = accelerometer
+        roll = math.atan2(ay, az)
+        pitch = math.atan2(-ax, math.sqrt(ay * ay + az * az))
+        cr, sr = math.cos(roll / 2), math.sin(roll / 2)
+        cp, sp = math.cos(pitch / 2), math.sin(pitch / 2)
+        self.integrate(cr * cp, sr * cp, cr * sp, -sr * sp)
+
+    def up(self):
+        """Unit vector pointing up in the IMU's frame, the direction the accelerometer reads gravity in."""
+        q0, q1, q2, q3 = self.q0, self.q1, self.q2, self.q3
+        return np.array([2.0 * (q1 * q3 - q0 * q2), 2.0 * (q0 * q1 + q2 * q3), q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3])
+
+    def update(self, samples):
+        """Update the orientation with a batch of raw IMU samples, oldest first.
+
+        Each sample is a row of time in seconds, gyroscope in degrees per second, accelerometer, and magnetometer,
+        as buffered by data capture. Returns the number of samples used.
+        """
+        if len(samples) == 0:
+            return 0
+
+        # vectorized over the batch: time steps, gyroscope in rad/s, and normalized accelerometer and magnetometer
+        times = samples[:, 0]
+        previous = times[0] if self.last_time is None else self.last_time
+        dts = np.clip(np.diff(times, prepend=previous), 0.0, self.max_dt)
+        gyroscope = np.radians(samples[:, 1:4])
+        accelerometer = samples[:, 4:7]
+        magnetometer = samples[:, 7:10]
+        accelerometer_norm = np.linalg.norm(accelerometer, axis=1, keepdims=True)
+        magnetometer_norm = np.linalg.norm(magnetometer, axis=1, keepdims=True)
+        accelerometer = np.divide(accelerometer, accelerometer_norm, out=np.zeros_like(accelerometer),
+                                  where=accelerometer_norm > 0)
+        magnetometer = np.divide(magnetometer, magnetometer_norm, out=np.zeros_like(magnetometer),
+                                 where=magnetometer_norm > 0)
+
+        # the filter itself is sequential, so run it on plain floats which is faster than NumPy for 4 elements
+        step = self.madgwick if self.method == 'madgwick' else self.mahony
+        history = self.history
+        size = len(history)
+        count = self.history_count
+        for t, dt, g, a, m in zip(times.tolist(), dts.tolist(), gyroscope.tolist(), accelerometer.tolist(),
+                                  magnetometer.tolist()):
+            step(dt, g[0], g[1], g[2], a[0], a[1], a[2], m[0], m[1], m[2])
+            history[count % size] = (t, self.q0, self.q1, self.q2, self.q3)
+            count += 1
+
+        self.history_count = count
+        self.last_time = times[-1]
+        self.rates[:] = gyroscope[-1]
+        return len(samples)
+
+    def madgwick(self, dt, gx, gy, gz, ax, ay, az, mx, my, mz):
+        """Madgwick AHRS update with normalized accelerometer and magnetometer readings."""
+        q0, q1, q2, q3 = self.q0, self.q1, self.q2, self.q3
+
+        # rate of change of quaternion from gyroscope
+        qdot0 = 0.5 * (-q1 * gx - q2 * gy - q3 * gz)
+        qdot1 = 0.5 * (q0 * gx + q2 * gz - q3 * gy)
+        qdot2 = 0.5 * (q0 * gy - q1 * gz + q3 * gx)
+        qdot3 = 0.5 * (q0 * gz + q1 * gy - q2 * gx)
+
+        # gradient descent corrective step, without the magnetometer if there's no reading
+        if ax or ay or az:
+            if mx or my or mz:
+                _2q0mx = 2.0 * q0 * mx
+                _2q0my = 2.0 * q0 * my
+                _2q0mz = 2.0 * q0 * mz
+                _2q1mx = 2.0 * q1 * mx
+                _2q0 = 2.0 * q0
+                _2q1 = 2.0 * q1
+                _2q2 = 2.0 * q2
+                _2q3 = 2.0 * q3
+                _2q0q2 = 2.0 * q0 * q2
+                _2q2q3 = 2.0 * q2 * q3
+                q0q0 = q0 * q0
+                q0q1 = q0 * q1
+                q0q2 = q0 * q2
+                q0q3 = q0 * q3
+                q1q1 = q1 * q1
+                q1q2 = q1 * q2
+                q1q3 = q1 * q3
+                q2q2 = q2 * q2
+                q2q3 = q2 * q3
+                q3q3 = q3 * q3
+
+                # reference direction of earth's magnetic field
+                hx = mx * q0q0 - _2q0my * q3 + _2q0mz * q2 + mx * q1q1 + _2q1 * my * q2 + _2q1 * mz * q3 \
+                    - mx * q2q2 - mx * q3q3
+                hy = _2q0mx * q3 + my * q0q0 - _2q0mz * q1 + _2q1mx * q2 - my * q1q1 + my * q2q2 \
+                    + _2q2 * mz * q3 - my * q3q3
+                _2bx = math.sqrt(hx * hx + hy * hy)
+                _2bz = -_2q0mx * q2 + _2q0my * q1 + mz * q0q0 + _2q1mx * q3 - mz * q1q1 + _2q2 * my * q3 \
+                    - mz * q2q2 + mz * q3q3
+                _4bx = 2.0 * _2bx
+                _4bz = 2.0 * _2bz
+
+                # objective function errors shared by the gradient terms
+                fax = 2.0 * q1q3 - _2q0q2 - ax
+                fay = 2.0 * q0q1 + _2q2q3 - ay
+                faz = 1.0 - 2.0 * q1q1 - 2.0 * q2q2 - az
+                fmx = _2bx * (0.5 - q2q2 - q3q3) + _2bz * (q1q3 - q0q2) - mx
+                fmy = _2bx * (q1q2 - q0q3) + _2bz * (q0q1 + q2q3) - my
+                fmz = _2bx * (q0q2 + q1q3) + _2bz * (0.5 - q1q1 - q2q2) - mz
+
+                s0 = -_2q2 * fax + _2q1 * fay - _2bz * q2 * fmx + (-_2bx * q3 + _2bz * q1) * fmy + _2bx * q2 * fmz
+                s1 = _2q3 * fax + _2q0 * fay - 4.0 * q1 * faz + _2bz * q3 * fmx + (_2bx * q2 + _2bz * q0) * fmy \
+                    + (_2bx * q3 - _4bz * q1) * fmz
+                s2 = -_2q0 * fax + _2q3 * fay - 4.0 * q2 * faz + (-_4bx * q2 - _2bz * q0) * fmx \
+                    + (_2bx * q1 + _2bz * q3) * fmy + (_2bx * q0 - _4bz * q2) * fmz
+                s3 = _2q1 * fax + _2q2 * fay + (-_4bx * q3 + _2bz * q1) * fmx + (-_2bx * q0 + _2bz * q2) * fmy \
+                    + _2bx * q1 * fmz
+            else:
+                q0q0 = q0 * q0
+                q1q1 = q1 * q1
+                q2q2 = q2 * q2
+                q3q3 = q3 * q3
+                s0 = 4.0 * q0 * q2q2 + 2.0 * q2 * ax + 4.0 * q0 * q1q1 - 2.0 * q1 * ay
+                s1 = 4.0 * q1 * q3q3 - 2.0 * q3 * ax + 4.0 * q0q0 * q1 - 2.0 * q0 * ay - 4.0 * q1 \
+                    + 8.0 * q1 * q1q1 + 8.0 * q1 * q2q2 + 4.0 * q1 * az
+                s2 = 4.0 * q0q0 * q2 + 2.0 * q0 * ax + 4.0 * q2 * q3q3 - 2.0 * q3 * ay - 4.0 * q2 \
+                    + 8.0 * q2 * q1q1 + 8.0 * q2 * q2q2 + 4.0 * q2 * az
+                s3 = 4.0 * q1q1 * q3 - 2.0 * q1 * ax + 4.0 * q2q2 * q3 - 2.0 * q2 * ay
+
+            norm = math.sqrt(s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3)
+            if norm > 0:
+                qdot0 -= self.beta * s0 / norm
+                qdot1 -= self.beta * s1 / norm
+                qdot2 -= self.beta * s2 / norm
+                qdot3 -= self.beta * s3 / norm
+
+        self.integrate(q0 + qdot0 * dt, q1 + qdot1 * dt, q2 + qdot2 * dt, q3 + qdot3 * dt)
+
+    def mahony(self, dt, gx, gy, gz, ax, ay, az, mx, my, mz):
+        """Mahony AHRS update with normalized accelerometer and magnetometer readings."""
+        q0, q1, q2, q3 = self.q0, self.q1, self.q2, self.q3
+
+        if ax or ay or az:
+            q0q0 = q0 * q0
+            q0q1 = q0 * q1
+            q0q2 = q0 * q2
+            q0q3 = q0 * q3
+            q1q1 = q1 * q1
+            q1q2 = q1 * q2
+            q1q3 = q1 * q3
+            q2q2 = q2 * q2
+            q2q3 = q2 * q3
+            q3q3 = q3 * q3
+
+            # error between the estimated and measured direction of gravity
+            halfvx = q1q3 - q0q2
+            halfvy = q0q1 + q2q3
+            halfvz = q0q0 - 0.5 + q3q3
+            halfex = ay * halfvz - az * halfvy
+            halfey = az * halfvx - ax * halfvz
+            halfez = ax * halfvy - ay * halfvx
+
+            # error between the estimated and measured direction of the magnetic field
+            if mx or my or mz:
+                hx = 2.0 * (mx * (0.5 - q2q2 - q3q3) + my * (q1q2 - q0q3) + mz * (q1q3 + q0q2))
+                hy = 2.0 * (mx * (q1q2 + q0q3) + my * (0.5 - q1q1 - q3q3) + mz * (q2q3 - q0q1))
+                bx = math.sqrt(hx * hx + hy * hy)
+                bz = 2.0 * (mx * (q1q3 - q0q2) + my * (q2q3 + q0q1) + mz * (0.5 - q1q1 - q2q2))
+                halfwx = bx * (0.5 - q2q2 - q3q3) + bz * (q1q3 - q0q2)
+                halfwy = bx * (q1q2 - q0q3) + bz * (q0q1 + q2q3)
+                halfwz = bx * (q0q2 + q1q3) + bz * (0.5 - q1q1 - q2q2)
+                halfex += my * halfwz - mz * halfwy
+                halfey += mz * halfwx - mx * halfwz
+                halfez += mx * halfwy - my * halfwx
+
+            # integral and proportional feedback on the gyroscope
+            if self.ki > 0:
+                self.integral_x += 2.0 * self.ki * halfex * dt
+                self.integral_y += 2.0 * self.ki * halfey * dt
+                self.integral_z += 2.0 * self.ki * halfez * dt
+                gx += self.integral_x
+                gy += self.integral_y
+                gz += self.integral_z
+            gx += 2.0 * self.kp * halfex
+            gy += 2.0 * self.kp * halfey
+            gz += 2.0 * self.kp * halfez
+
+        gx *= 0.5 * dt
+        gy *= 0.5 * dt
+        gz *= 0.5 * dt
+        self.integrate(q0 - q1 * gx - q2 * gy - q3 * gz,
+                       q1 + q0 * gx + q2 * gz - q3 * gy,
+                       q2 + q0 * gy - q1 * gz + q3 * gx,
+                       q3 + q0 * gz + q1 * gy - q2 * gx)
+
+    def integrate(self, q0, q1, q2, q3):
+        """Store the updated quaternion after normalizing it."""
+        norm = math.sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+        self.q0, self.q1, self.q2, self.q3 = q0 / norm, q1 / norm, q2 / norm, q3 / norm
+
+    def quaternions_at(self, times):
+        """Orientation at each of the given past times, interpolated between recorded estimates.
+
+        Times outside the recorded history are clamped to the oldest or newest estimate.
+        """
+        size = len(self.history)
+        start = max(0, self.history_count - size)
+        history = self.history[np.arange(start, self.history_count) % size]
+        if len(history) == 0:
+            return np.tile(self.quaternion(), (len(times), 1))
+
+        # normalized linear interpolation, close to slerp between estimates a few milliseconds apart
+        after = np.minimum(np.maximum(np.searchsorted(history[:, 0], times), 1), len(history) - 1)
+        before = np.maximum(after - 1, 0)
+        span = history[after, 0] - history[before, 0]
+        weight = np.divide(times - history[before, 0], span, out=np.zeros(len(after)), where=span > 0)
+        weight = np.clip(weight, 0.0, 1.0)[:, np.newaxis]
+        quaternions = history[before, 1:] + (history[after, 1:] - history[before, 1:]) * weight
+        return quaternions / np.linalg.norm(quaternions, axis=1, keepdims=True)
+
+
+def simulate(duration, rate, seed=0):
+    """Simulated IMU samples of a slowly tumbling payload, in the layout buffered by data capture."""
+    rng = np.random.default_rng(seed)
+    n = int(duration * rate)
+    times = np.arange(n) / rate
+    gyroscope = np.column_stack([20 * np.sin(0.5 * times), 15 * np.cos(0.3 * times), 10 * np.ones(n)])
+    gyroscope += rng.normal(0, 0.5, (n, 3))
+    accelerometer = np.array([0.0, 0.0, 9.80665]) + rng.normal(0, 0.2, (n, 3))
+    magnetometer = np.array([2000.0, 0.0, -4000.0]) + rng.normal(0, 50, (n, 3))
+    return np.column_stack([times, gyroscope, accelerometer, magnetometer])
+
+
+def load_csv(csv_filepath):
+    """IMU samples from a flight data CSV written by data capture."""
+    from datetime import datetime
+
+    rows = []
+    with open(csv_filepath, 'r') as f:
+        next(f)
+        for line in f:
+            fields = line.strip().split(',')
+            stamp = datetime.strptime(fields[0], '%Y-%m-%d %H:%M:%S.%f').timestamp()
+            rows.append([stamp] + [float(field) for field in fields[1:10]])
+    return np.array(rows)
+
+
+def benchmark(samples, method, batch_size):
+    """Run the estimator over the samples in batches and return the sustained update rate in Hz."""
+    estimator = AttitudeEstimator(method)
+    start = time.perf_counter()
+    for index in range(0, len(samples), batch_size):
+        estimator.update(samples[index:index + batch_size])
+    elapsed = time.perf_counter() - start
+    return len(samples) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the attitude estimator on one core.')
+    parser.add_argument(
+        '--csv',
+        type=str,
+        help='Flight data CSV to replay instead of simulated samples')
+    parser.add_argument(
+        '--duration',
+        default=60.0,
+        type=float,
+        help='Seconds of simulated samples')
+    parser.add_argument(
+        '--rate',
+        default=208.0,
+        type=float,
+        help='Gyroscope output data rate in Hz')
+    parser.add_argument(
+        '--batch',
+        default=8,
+        type=int,
+        help='Samples per update, as when catching up on buffered samples')
+    args = parser.parse_args()
+
+    # measure on a single core like the controls process on the Pi
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {sorted(os.sched_getaffinity(0))[0]})
+
+    samples = load_csv(args.csv) if args.csv else simulate(args.duration, args.rate)
+    for method in ('madgwick', 'mahony'):
+        rate = benchmark(samples, method, args.batch)
+        print('%s: %d samples, %.0f Hz sustained, %.1f us per sample, %.0fx headroom at %.0f Hz' %
+              (method, len(samples), rate, 1e6 / rate, rate / args.rate, args.rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,143 @@
-import time
+import collections
+import math
+
+from controller.scheduler import PeriodicScheduler
+from .actuator_output import ActuatorOutput, SimulatedDriver
+from .actuators import SimulatedGimbal
+from .attitude import AttitudeEstimator
+from .fusion import Fusion
+from .pointing import PointingController
+from .prediction import TargetPredictor
 
 
 class ControlsSystem:
-    def __init__(self):
+    def __init__(self, rate=100, actuator=None, camera_width=448, camera_height=448, predict=True, output_rate=100,
+                 imu_timeout=0.05):
+        # control loop at a fixed rate in Hz, independent of how often detections arrive
+        self.scheduler = PeriodicScheduler(rate)
+
+        # gimbal that pivots the payload, simulated until the hardware is finalized, with its commands coalesced and
+        # flushed to the bus at a fixed rate in Hz of their own unless there's no output rate
+        self.actuator = SimulatedGimbal() if actuator is None else actuator
+        if output_rate is not None and actuator is None:
+            self.actuator = ActuatorOutput(SimulatedDriver(self.actuator), output_rate)
+
+        # estimates the payload attitude from the IMU samples at the gyroscope rate, its rates fed forward until the
+        # latest sample is older than the timeout in seconds, since the IMU may sample slower than the control loop
+        self.estimator = AttitudeEstimator()
+        self.imu_timeout = imu_timeout
+        self.last_sample = None
+
+        # the gimbal's rates on the last control cycles, to take out of the gyroscope as they were when it sampled
+        self.gimbal_history = collections.deque(maxlen=16)
+        self.sampled_gimbal_rates = None
+
+        # turns the rocket's position in the image into pan and tilt commands
+        self.pointing = PointingController(camera_width, camera_height)
+
+        # moves each detection to where the rocket should be now, making up for the detection's age
+        self.predictor = TargetPredictor(camera_width, camera_height, axes=self.pointing.feedforward_axes) \
+            if predict else None
+        self.last_index = None
+
+        # pairs detections with the IMU state at capture time
+        self.fusion = None
+
+        # age of each detection from its exposure until the controls first saw it
+        self.ages = {'detections': 0, 'age_mean': 0.0, 'age_max': 0.0}
+
+    def prepare(self):
+        """Get ready to run the controls before the mission starts."""
         pass
 
-    def controls(self, mission_start, time_total, prediction, run):
+    def step(self, now, detection, samples):
+        """Run one control cycle on the latest detection and the IMU samples read since the last one."""
+        self.estimator.update(samples)
+
+        # feed forward the latest IMU rates while they're fresh, with the gimbal's rates from when they were sampled
+        self.gimbal_history.append((now, self.actuator.turning_rates()))
+        if len(samples):
+            self.last_sample = samples[-1][0]
+            self.sampled_gimbal_rates = self.gimbal_history[0][1]
+            for tick, gimbal_rates in self.gimbal_history:
+                if tick <= self.last_sample:
+                    self.sampled_gimbal_rates = gimbal_rates
+        fresh = self.last_sample is not None and now - self.last_sample <= self.imu_timeout
+        rates = [math.degrees(rate) for rate in self.estimator.rates] if fresh else None
+
+        # measure how old each detection is when it gets here
+        if detection is not None and detection.get('timestamp') is not None and detection['index'] != self.last_index:
+            self.last_index = detection['index']
+            self.record_age(now - detection['timestamp'])
+
+        # steer on where the rocket should be now rather than where it was when the frame was exposed
+        if self.predictor is not None:
+            self.predictor.update_rotation(samples)
+            detection = self.predictor.predict(now, detection)
+
+        pan_rate, tilt_rate = self.pointing.update(now, detection, rates, self.sampled_gimbal_rates)
+        self.actuator.command(pan_rate, tilt_rate, now)
+        return pan_rate, tilt_rate
+
+    def record_age(self, age):
+        """Accumulate the age of a detection."""
+        ages = self.ages
+        ages['detections'] += 1
+        ages['age_mean'] += (age - ages['age_mean']) / ages['detections']
+        ages['age_max'] = max(ages['age_max'], age)
+
+    def controls(self, mission_start, time_total, prediction, run, heartbeat=None, imu_buffer=None):
+        """Point the payload at the rocket with a fixed-rate control loop."""
+        # align each new detection with the IMU samples if they're shared
+        if imu_buffer is not None:
+            self.fusion = Fusion(imu_buffer, estimator=self.estimator)
+        fused_index = -1
+        imu_count = 0
+
+        # start the actuator output's own tick
+        self.actuator.start()
+
         # run until mission duration complete
         while True:
+            # wait for the next period of the control loop
+            tick = self.scheduler.wait()
+
             # check if mission duration complete
-            if time.perf_counter() - mission_start > time_total:
-                # print(prediction['prediction'])
+            if tick - mission_start > time_total:
                 break
 
-            # do something if practice run
-            if run == 'practice':
-                pass
+            # let the mission controller know the controls are alive
+            if heartbeat is not None:
+                heartbeat.beat()
+
+            # catch up on the IMU samples read since the last loop and command the gimbal
+            samples = []
+            if imu_buffer is not None:
+                samples, imu_count = imu_buffer.read(imu_count)
+            detection = prediction['prediction']
+            self.step(tick, detection, samples)
+
+            # publish the new attitude
+            if len(samples):
+                prediction['attitude'] = {
+                    "quaternion": self.estimator.quaternion(),
+                    "rates": self.estimator.rates.tolist(),
+                    "timestamp": self.estimator.last_time
+                }
+
+            # publish each new detection with the payload attitude and rates at the moment its frame was exposed
+            if self.fusion is not None and detection['index'] != fused_index:
+                fused = self.fusion.align(detection)
+                if fused is not None:
+                    prediction['fused'] = fused
+                    fused_index = detection['index']
+
+        # stop the gimbal and report the control loop's timing
+        self.actuator.close()
+        prediction['controls_timing'] = dict(self.scheduler.stats(), **self.ages)
+        if run == 'practice':
+            print(self.scheduler.report('controls'))
+            print('controls: %(detections)d detections, age %(age_mean).4fs mean %(age_max).4fs max' % self.ages)
+            if isinstance(self.actuator, ActuatorOutput):
+                print('controls: %(commands)d commands, %(coalesced)d coalesced, %(writes)d writes, latency '
+                      '%(latency_mean).4fs mean %(latency_max).4fs max' % self.actuator.stats())
@@ -0,0 +1,69 @@
+import math
+import time
+
+import numpy as np
+
+from .attitude import quaternion_to_euler
+
+
+class Fusion:
+    def __init__(self, imu_buffer, window=256, estimator=None):
+        # buffered IMU samples to interpolate from, only the most recent window is searched
+        self.imu_buffer = imu_buffer
+        self.window = window
+
+        # attitude estimator whose history is used instead of the accelerometer and magnetometer if given
+        self.estimator = estimator
+
+    def interpolate(self, samples, times):
+        """Linearly interpolate every IMU channel to each of the given times at once.
+
+        Times outside the buffered samples are clamped to the first or last sample.
+        """
+        sample_times = samples[:, 0]
+        after = np.clip(np.searchsorted(sample_times, times), 1, len(sample_times) - 1)
+        before = after - 1
+        span = sample_times[after] - sample_times[before]
+        weight = np.divide(times - sample_times[before], span, out=np.zeros(len(after)), where=span > 0)
+        weight = np.clip(weight, 0.0, 1.0)[:, np.newaxis]
+        return samples[before] + (samples[after] - samples[before]) * weight
+
+    def attitude(self, accelerometer, magnetometer):
+        """Roll, pitch, and tilt-compensated heading in degrees from the accelerometer and magnetometer."""
+        ax, ay, az = accelerometer
+        mx, my, mz = magnetometer
+        roll = math.atan2(ay, az)
+        pitch = math.atan2(-ax, math.sqrt(ay * ay + az * az))
+        heading_x = mx * math.cos(pitch) + (my * math.sin(roll) + mz * math.cos(roll)) * math.sin(pitch)
+        heading_y = my * math.cos(roll) - mz * math.sin(roll)
+        yaw = math.atan2(-heading_y, heading_x)
+        return [math.degrees(roll), math.degrees(pitch), math.degrees(yaw)]
+
+    def align(self, detection, now=None):
+        """Pair a detection with the IMU state at the moment its frame was exposed.
+
+        Returns None if the detection has no capture timestamp or there are no IMU samples yet.
+        """
+        if detection.get('timestamp') is None:
+            return None
+        samples = self.imu_buffer.latest(self.window)
+        if len(samples) < 2:
+            return None
+
+        state = self.interpolate(samples, np.array([detection['timestamp']]))[0]
+        if self.estimator is not None and self.estimator.history_count > 0:
+            attitude = quaternion_to_euler(self.estimator.quaternions_at(np.array([detection['timestamp']]))[0])
+        else:
+            attitude = self.attitude(state[4:7], state[7:10])
+        now = time.perf_counter() if now is None else now
+        return {
+            "xmin": detection['xmin'],
+            "ymin": detection['ymin'],
+            "width": detection['width'],
+            "height": detection['height'],
+            "index": detection['index'],
+            "timestamp": detection['timestamp'],
+            "attitude": attitude,
+            "rates": state[1:4].tolist(),
+            "latency": now - detection['timestamp']
+        }
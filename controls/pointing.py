@@ -0,0 +1,128 @@
+class PID:
+    def __init__(self, kp, ki, kd, output_limit, integral_limit=None):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+
+        # the output saturates at the limit, and the integral term alone never exceeds its own limit
+        self.output_limit = output_limit
+        self.integral_limit = output_limit if integral_limit is None else integral_limit
+
+        self.integral = 0.0
+        self.last_error = None
+
+    def reset(self):
+        """Forget the integral and derivative history."""
+        self.integral = 0.0
+        self.last_error = None
+
+    def update(self, error, dt, feedforward=0.0, derivative=None):
+        """Output for the given error, with anti-windup by conditional integration and integral clamping.
+
+        The derivative of the error is taken between updates unless it's given.
+        """
+        if derivative is None:
+            derivative = 0.0 if self.last_error is None or dt <= 0 else (error - self.last_error) / dt
+        self.last_error = error
+
+        # integrate only if that doesn't push an already saturated output further into saturation
+        integral = self.integral + self.ki * error * dt
+        integral = min(max(integral, -self.integral_limit), self.integral_limit)
+        unsaturated = feedforward + self.kp * error + integral + self.kd * derivative
+        if abs(unsaturated) < self.output_limit or (unsaturated > 0) != (error > 0):
+            self.integral = integral
+
+        output = feedforward + self.kp * error + self.integral + self.kd * derivative
+        return min(max(output, -self.output_limit), self.output_limit)
+
+    def hold(self, feedforward=0.0):
+        """Output with no measurement, the feed-forward and the integral term frozen at its last value."""
+        self.last_error = None
+        output = feedforward + self.integral
+        return min(max(output, -self.output_limit), self.output_limit)
+
+
+class PointingController:
+    def __init__(self, camera_width=448, camera_height=448, field_of_view=(62.2, 48.8), kp=4.0, ki=0.5, kd=0.1,
+                 max_rate=180.0, max_age=0.5, feedforward_axes=((2, -1.0), (1, -1.0))):
+        # image size in pixels and the camera's horizontal and vertical field of view in degrees
+        self.camera_width = camera_width
+        self.camera_height = camera_height
+        self.degrees_per_pixel = (field_of_view[0] / camera_width, field_of_view[1] / camera_height)
+
+        # pan and tilt loops turning the angle to the rocket into rate commands in degrees per second
+        self.pan = PID(kp, ki, kd, max_rate)
+        self.tilt = PID(kp, ki, kd, max_rate)
+
+        # oldest detection still steered on, in seconds
+        self.max_age = max_age
+
+        # body axis and sign of the gyroscope rate that turns the camera in pan and in tilt, the IMU turns with it
+        self.feedforward_axes = feedforward_axes
+
+        self.last_time = None
+
+        # the last rate commands
+        self.last_command = (0.0, 0.0)
+
+        # the detection being steered on, its angle error, and how fast that error is changing
+        self.last_index = None
+        self.last_detection_time = None
+        self.last_error = (0.0, 0.0)
+        self.error_rate = (0.0, 0.0)
+
+    def error(self, detection):
+        """Angle in degrees from the center of the image to the center of the detection, for pan and tilt."""
+        x = detection['xmin'] + detection['width'] / 2.0
+        y = detection['ymin'] + detection['height'] / 2.0
+        return ((x - self.camera_width / 2.0) * self.degrees_per_pixel[0],
+                (y - self.camera_height / 2.0) * self.degrees_per_pixel[1])
+
+    def update(self, now, detection, rates, gimbal_rates=None):
+        """Pan and tilt rate commands for the latest detection and the payload's body rates in degrees per second.
+
+        The latest detection's error is held between detections, unless it's a prediction of where the rocket is
+        now, which is steered on directly. Without a recent detection, only the gyroscope feed-forward and the held
+        integral terms are commanded. The feed-forward needs fresh body rates and the rates the gimbal is turning
+        at, and is left out without either.
+        """
+        dt = 0.0 if self.last_time is None else now - self.last_time
+        self.last_time = now
+
+        # counter-rotate against the rotation of the base, what the gyroscope measures less the gimbal's own motion
+        pan_feedforward = tilt_feedforward = 0.0
+        if rates is not None and gimbal_rates is not None:
+            (pan_axis, pan_sign), (tilt_axis, tilt_sign) = self.feedforward_axes
+            pan_feedforward = gimbal_rates[0] - pan_sign * rates[pan_axis]
+            tilt_feedforward = gimbal_rates[1] - tilt_sign * rates[tilt_axis]
+        self.last_command = self.command(now, detection, dt, pan_feedforward, tilt_feedforward)
+        return self.last_command
+
+    def command(self, now, detection, dt, pan_feedforward, tilt_feedforward):
+        """Pan and tilt rate commands from the feed-forward and the detection's error."""
+
+        # steer on recent detections only
+        fresh = detection is not None and detection.get('xmin') is not None \
+            and (detection.get('timestamp') is None or now - detection['timestamp'] <= self.max_age)
+        if not fresh:
+            return self.pan.hold(pan_feedforward), self.tilt.hold(tilt_feedforward)
+
+        # predictions move every loop, so they're steered on and differentiated between loops
+        if detection.get('predicted'):
+            pan_error, tilt_error = self.error(detection)
+            return self.pan.update(pan_error, dt, pan_feedforward), self.tilt.update(tilt_error, dt, tilt_feedforward)
+
+        # differentiate the error between detections rather than between loops, where it's held constant
+        if detection['index'] != self.last_index:
+            error = self.error(detection)
+            detection_time = now if detection.get('timestamp') is None else detection['timestamp']
+            if self.last_detection_time is not None and detection_time > self.last_detection_time:
+                elapsed = detection_time - self.last_detection_time
+                self.error_rate = ((error[0] - self.last_error[0]) / elapsed, (error[1] - self.last_error[1]) / elapsed)
+            self.last_index = detection['index']
+            self.last_detection_time = detection_time
+            self.last_error = error
+
+        pan_error, tilt_error = self.last_error
+        return (self.pan.update(pan_error, dt, pan_feedforward, self.error_rate[0]),
+                self.tilt.update(tilt_error, dt, tilt_feedforward, self.error_rate[1]))
@@ -0,0 +1,118 @@
+import numpy as np
+
+
+class TargetPredictor:
+    def __init__(self, camera_width=448, camera_height=448, field_of_view=(62.2, 48.8),
+                 axes=((2, -1.0), (1, -1.0)), history=6, window=1.0, max_age=0.5, rotation_history=2048):
+        # image size in pixels and the camera's horizontal and vertical field of view in degrees
+        self.camera_width = camera_width
+        self.camera_height = camera_height
+        self.degrees_per_pixel = (field_of_view[0] / camera_width, field_of_view[1] / camera_height)
+
+        # body axis and sign of the gyroscope rate that turns the camera's view in pan and in tilt
+        self.axes = axes
+
+        # detections used to fit the rocket's motion, at most this many and no older than the window in seconds
+        self.history = history
+        self.window = window
+
+        # oldest detection still extrapolated from, in seconds
+        self.max_age = max_age
+
+        # camera pan and tilt in degrees integrated from the gyroscope, as a ring of (time, pan, tilt)
+        self.rotations = np.zeros((rotation_history, 3))
+        self.rotation_count = 0
+        self.pan = 0.0
+        self.tilt = 0.0
+
+        # each detection's time and the rocket's direction with the camera's rotation removed, as (time, pan, tilt)
+        self.detections = np.zeros((history, 3))
+        self.detection_count = 0
+        self.last_index = None
+        self.last_size = (0, 0)
+
+    def update_rotation(self, samples):
+        """Integrate the camera's rotation over a batch of IMU samples, oldest first."""
+        if len(samples) == 0:
+            return
+        (pan_axis, pan_sign), (tilt_axis, tilt_sign) = self.axes
+        times = samples[:, 0]
+        previous = times[0] if self.rotation_count == 0 else self.rotations[(self.rotation_count - 1) %
+                                                                            len(self.rotations), 0]
+        dts = np.diff(times, prepend=previous)
+        pans = self.pan + np.cumsum(pan_sign * samples[:, 1 + pan_axis] * dts)
+        tilts = self.tilt + np.cumsum(tilt_sign * samples[:, 1 + tilt_axis] * dts)
+
+        indices = np.arange(self.rotation_count, self.rotation_count + len(samples)) % len(self.rotations)
+        self.rotations[indices] = np.column_stack([times, pans, tilts])
+        self.rotation_count += len(samples)
+        self.pan = pans[-1]
+        self.tilt = tilts[-1]
+
+    def rotation_at(self, time):
+        """Camera pan and tilt in degrees at a past time, interpolated between IMU samples."""
+        if self.rotation_count == 0:
+            return 0.0, 0.0
+        size = len(self.rotations)
+        start = max(0, self.rotation_count - size)
+        rotations = self.rotations[np.arange(start, self.rotation_count) % size]
+        return (float(np.interp(time, rotations[:, 0], rotations[:, 1])),
+                float(np.interp(time, rotations[:, 0], rotations[:, 2])))
+
+    def add_detection(self, detection):
+        """Remember a new detection's direction, with the camera's rotation at its exposure removed."""
+        if detection is None or detection.get('xmin') is None or detection.get('timestamp') is None:
+            return
+        if detection['index'] == self.last_index:
+            return
+        self.last_index = detection['index']
+        self.last_size = (detection['width'], detection['height'])
+
+        x = detection['xmin'] + detection['width'] / 2.0
+        y = detection['ymin'] + detection['height'] / 2.0
+        pan, tilt = self.rotation_at(detection['timestamp'])
+        self.detections[self.detection_count % self.history] = (
+            detection['timestamp'],
+            (x - self.camera_width / 2.0) * self.degrees_per_pixel[0] + pan,
+            (y - self.camera_height / 2.0) * self.degrees_per_pixel[1] + tilt)
+        self.detection_count += 1
+
+    def predict(self, now, detection):
+        """The detection moved to where the rocket should be in the image now.
+
+        Fits the rocket's motion over recent detections and removes the camera's rotation since then. Returns
+        None if there's no recent detection to extrapolate from.
+        """
+        self.add_detection(detection)
+        if self.detection_count == 0:
+            return None
+        count = min(self.detection_count, self.history)
+        history = self.detections[np.arange(self.detection_count - count, self.detection_count) % self.history]
+        latest = history[-1]
+        if now - latest[0] > self.max_age:
+            return None
+
+        # least squares velocity over the detections within the window, held still with only one
+        recent = history[history[:, 0] >= latest[0] - self.window]
+        if len(recent) > 1 and np.ptp(recent[:, 0]) > 0:
+            elapsed = recent[:, 0] - latest[0]
+            centered = elapsed - elapsed.mean()
+            pan_velocity = np.dot(centered, recent[:, 1] - recent[:, 1].mean()) / np.dot(centered, centered)
+            tilt_velocity = np.dot(centered, recent[:, 2] - recent[:, 2].mean()) / np.dot(centered, centered)
+        else:
+            pan_velocity = tilt_velocity = 0.0
+
+        # extrapolate the rocket's direction to now and put it back in the camera's current view
+        ahead = now - latest[0]
+        pan = latest[1] + pan_velocity * ahead - self.pan
+        tilt = latest[2] + tilt_velocity * ahead - self.tilt
+        width, height = self.last_size
+        return {
+            "xmin": pan / self.degrees_per_pixel[0] + self.camera_width / 2.0 - width / 2.0,
+            "ymin": tilt / self.degrees_per_pixel[1] + self.camera_height / 2.0 - height / 2.0,
+            "width": width,
+            "height": height,
+            "index": self.last_index,
+            "timestamp": now,
+            "predicted": True
+        }
@@ -19,23 +19,32 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import importlib
 import io
+import os
 import re
 import time
 
-from .annotation import Annotator
-
 import numpy as np
-import picamera
 
-from PIL import Image
-from tflite_runtime.interpreter import load_delegate
-from tflite_runtime.interpreter import Interpreter
+from controller.scheduler import PeriodicScheduler
+from data.profiles import PROFILES, Reconfigurer
+from .frames import FrameOutput
 
 
 class CVDetect:
-    def __init__(self):
-        pass
+    def __init__(self, warmup_inferences=3, framerate=30):
+        # capture and detect at the camera's frame rate in Hz
+        self.framerate = framerate
+        self.scheduler = PeriodicScheduler(framerate)
+
+        # number of inferences run on a real frame before the mission clock starts
+        self.warmup_inferences = warmup_inferences
+
+        # state created by the prepare phase
+        self.labels = None
+        self.interpreter = None
+        self.camera = None
 
     def load_labels(self, path):
         """Loads the labels file. Supports files with or without index numbers."""
@@ -62,8 +71,43 @@ class CVDetect:
         tensor = np.squeeze(interpreter.get_tensor(output_details['index']))
         return tensor
 
-    def detect_objects(self, interpreter, image, threshold):
-        """Returns a list of detection results, each a dictionary of object info."""
+    def load_interpreter(self, model_filepath, device='tpu'):
+        """Loads the model on the Edge TPU, on the CPU, or on the Edge TPU when one is plugged in and the CPU otherwise.
+
+        An Edge TPU model can't run on the CPU, so the CPU uses the model next to it without the _edgetpu suffix.
+        """
+        try:
+            from tflite_runtime.interpreter import load_delegate
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            load_delegate = tf.lite.experimental.load_delegate
+            Interpreter = tf.lite.Interpreter
+
+        if device in ('tpu', 'auto'):
+            try:
+                interpreter = Interpreter(model_filepath, experimental_delegates=[load_delegate('libedgetpu.so.1.0')])
+                interpreter.allocate_tensors()
+                return interpreter, 'tpu'
+            except (ValueError, OSError, RuntimeError):
+                if device == 'tpu':
+                    raise
+
+        cpu_model_filepath = model_filepath.replace('_edgetpu.tflite', '.tflite')
+        if not os.path.exists(cpu_model_filepath):
+            raise(Exception('No Edge TPU and no CPU model at ' + cpu_model_filepath))
+        interpreter = Interpreter(cpu_model_filepath)
+        interpreter.allocate_tensors()
+        return interpreter, 'cpu'
+
+    def preprocess(self, image, input_width, input_height):
+        """Converts a frame to RGB and resizes it to the model's input size."""
+        from PIL import Image
+
+        return image.convert('RGB').resize((input_width, input_height), Image.LANCZOS)
+
+    def get_detections(self, interpreter, image, threshold):
+        """Returns every detection result with a score at the threshold or above, each a dictionary of object info."""
         self.set_input_tensor(interpreter, image)
         interpreter.invoke()
 
@@ -72,17 +116,21 @@ class CVDetect:
         class_ids = self.get_output_tensor(interpreter, 1)
         scores = self.get_output_tensor(interpreter, 2)
 
+        return [{
+            'bounding_box': box,
+            'class_id': class_id,
+            'score': score
+        } for box, class_id, score in zip(boxes, class_ids, scores) if score >= threshold]
+
+    def detect_objects(self, interpreter, image, threshold):
+        """Returns the best detection result, a dictionary of object info, or None."""
         # find best detection
         best_detection = None
-        max_score = np.float('-inf')
-        for box, class_id, score in zip(boxes, class_ids, scores):
-            if score >= threshold and score >= max_score:
-                best_detection = {
-                    'bounding_box': box,
-                    'class_id': class_id,
-                    'score': score
-                }
-                max_score = score
+        max_score = float('-inf')
+        for detection in self.get_detections(interpreter, image, threshold):
+            if detection['score'] >= max_score:
+                best_detection = detection
+                max_score = detection['score']
 
         return best_detection
 
@@ -101,68 +149,157 @@ class CVDetect:
             annotator.text([xmin, ymin],
                            '%s\n%.2f' % (labels[obj['class_id']], obj['score']))
 
-    def cv(self, mission_start, time_total, camera_width, camera_height, model_filepath, labels_filepath, threshold, prediction, run):
-        """Capture frames with the camera and use the deep learning model to make detection predictions."""
+    def prepare_spare(self, labels_filepath):
+        """Get a spare ready to take over, loading the labels and importing the camera and Edge TPU libraries.
 
-        # setup for computer vision
-        labels = self.load_labels(labels_filepath)
-        interpreter = Interpreter(model_filepath,
-                                  experimental_delegates=[load_delegate('libedgetpu.so.1.0')])
-        interpreter.allocate_tensors()
-        _, input_height, input_width, _ = interpreter.get_input_details()[0]['shape']
+        The camera and the Edge TPU are held by the running process, so they're opened by prepare after takeover.
+        """
+        self.labels = self.load_labels(labels_filepath)
+        importlib.import_module('picamera')
+        importlib.import_module('PIL.Image')
+        try:
+            importlib.import_module('tflite_runtime.interpreter')
+        except ImportError:
+            importlib.import_module('tensorflow')
+
+    def prepare(self, camera_width, camera_height, model_filepath, labels_filepath, threshold):
+        """Load the model, open the camera, and run warm-up inferences before the mission starts."""
+        # camera and Edge TPU backends are imported here so only the computer vision process pays for them
+        import picamera
+        from PIL import Image
+
+        self.labels = self.load_labels(labels_filepath)
+        self.interpreter, _ = self.load_interpreter(model_filepath)
+        _, input_height, input_width, _ = self.interpreter.get_input_details()[0]['shape']
 
         # use picamera with customizable camera settings
-        with picamera.PiCamera(resolution=(camera_width, camera_height), framerate=30) as camera:
+        self.camera = picamera.PiCamera(resolution=(camera_width, camera_height), framerate=self.framerate)
+
+        # the first invoke uploads the model to the Edge TPU, so run it on a real frame before the mission
+        stream = io.BytesIO()
+        self.camera.capture(stream, format='jpeg', use_video_port=True)
+        stream.seek(0)
+        image = self.preprocess(Image.open(stream), input_width, input_height)
+        for _ in range(self.warmup_inferences):
+            self.detect_objects(self.interpreter, image, threshold)
+
+    def detect(self, jpeg, capture_time, camera_width, camera_height, threshold, prediction, stages=None):
+        """Decode a frame, run the model on it, and share its best detection with the controls, returning it."""
+        from PIL import Image
+
+        # decode the frame and fit it to the model's input
+        start = time.perf_counter()
+        _, input_height, input_width, _ = self.interpreter.get_input_details()[0]['shape']
+        image = self.preprocess(Image.open(io.BytesIO(jpeg)), input_width, input_height)
+        preprocessed = time.perf_counter()
+
+        # get best prediction for recent frame
+        best_detection = self.detect_objects(self.interpreter, image, threshold)
+        if stages is not None:
+            stages.record('preprocess', preprocessed - start)
+            stages.record('inference', time.perf_counter() - preprocessed)
+
+        # check if an object is detected and get coordinates for prediction
+        if best_detection is not None:
+            ymin, xmin, ymax, xmax = best_detection['bounding_box']
+            xmin = int(xmin * camera_width)
+            ymin = int(ymin * camera_height)
+            width = int(xmax * camera_width) - xmin
+            height = int(ymax * camera_height) - ymin
+        else:
+            xmin = None
+            ymin = None
+            width = None
+            height = None
+
+        # update prediction based on recent detections
+        prediction['prediction'] = {
+            "xmin": xmin,
+            "ymin": ymin,
+            "width": width,
+            "height": height,
+            "index": prediction['prediction']["index"] + 1,
+            "timestamp": capture_time
+        }
+        return best_detection
+
+    def cv(self, mission_start, time_total, camera_width, camera_height, model_filepath, labels_filepath, threshold, prediction, run,
+           heartbeat=None, throttle=None, phase=None, stages=None):
+        """Capture frames with the camera and use the deep learning model to make detection predictions."""
+
+        # setup for computer vision if it wasn't prepared before the mission clock started
+        if self.camera is None:
+            self.prepare(camera_width, camera_height, model_filepath, labels_filepath, threshold)
+        labels = self.labels
+
+        # close the camera once the mission is complete
+        with self.camera as camera:
             # view object detection's camera view if practice run
             if run == 'practice':
+                from .annotation import Annotator
                 camera.start_preview()
                 annotator = Annotator(camera)
 
-            # stream to store frames from camera capture
-            stream = io.BytesIO()
+            # pace the camera itself to the flight phase's frame rate, so frames aren't captured only to wait
+            reconfigurer = None
+            if phase is not None:
+                current_phase = phase.phase()
+                reconfigurer = Reconfigurer(camera=camera)
+                reconfigurer.apply(current_phase)
+                self.scheduler.set_rate(min(PROFILES[current_phase]['cv_framerate'], self.framerate))
+
+            # record frames from the camera's video port, so each one is stamped with the time it was exposed
+            output = FrameOutput(camera, verbose=run == 'practice')
+            camera.start_recording(output, format='mjpeg')
+            frame_number = 0
+            frame_index = 0
 
-            # capture frames with the camera
             # run until mission duration complete
-            for _ in camera.capture_continuous(stream, format='jpeg', use_video_port=True):
+            while True:
+                # wait for the next frame, checking the mission time if the camera stalls
+                frame = output.next(frame_index, timeout=1.0)
+                if frame is None:
+                    if time.perf_counter() - mission_start > time_total:
+                        break
+                    continue
+                frame_index, jpeg, capture_time = frame
+
                 # check if mission duration complete
-                if time.perf_counter() - mission_start > time_total:
+                if capture_time - mission_start > time_total:
                     break
 
-                # get new frame from camera
-                stream.seek(0)
-                image = Image.open(stream).convert('RGB').resize((input_width, input_height), Image.ANTIALIAS)
+                # let the mission controller know computer vision is alive, and how long the frame took to get here
+                if heartbeat is not None:
+                    heartbeat.beat()
+                if stages is not None:
+                    stages.record('capture', time.perf_counter() - capture_time)
+
+                # re-pace the camera when the flight phase changes
+                if phase is not None and phase.phase() != current_phase:
+                    current_phase = phase.phase()
+                    reconfigurer.request(current_phase)
+                    self.scheduler.set_rate(min(PROFILES[current_phase]['cv_framerate'], self.framerate))
+
+                # the camera paces the loop, and a frame that comes before it's due, such as while the camera is
+                # being re-paced, is dropped rather than held, since waiting once it's exposed only makes it older
+                if self.scheduler.poll(capture_time) is None:
+                    continue
+
+                # skip this frame if the governor lowered the frame rate
+                frame_number += 1
+                if throttle is not None and frame_number % throttle.setting('cv_frame_skip'):
+                    continue
 
                 # track prediction time if practice run
                 if run == 'practice':
                     start_time = time.monotonic()
 
-                # get best prediction for recent frame
-                best_detection = self.detect_objects(interpreter, image, threshold)
-
-                # check if an object is detected and get coordinates for prediction
-                if best_detection is not None:
-                    ymin, xmin, ymax, xmax = best_detection['bounding_box']
-                    xmin = int(xmin * camera_width)
-                    ymin = int(ymin * camera_height)
-                    width = int(xmax * camera_width) - xmin
-                    height = int(ymax * camera_height) - ymin
-                else:
-                    xmin = None
-                    ymin = None
-                    width = None
-                    height = None
-
-                # update prediction based on recent detections
-                prediction['prediction'] = {
-                    "xmin": xmin,
-                    "ymin": ymin,
-                    "width": width,
-                    "height": height,
-                    "index": prediction['prediction']["index"] + 1
-                }
+                # get best prediction for recent frame and share it
+                best_detection = self.detect(jpeg, capture_time, camera_width, camera_height, threshold, prediction,
+                                             stages)
 
                 # annotate detected objects if practice run
-                if run == 'practice':
+                if run == 'practice' and (throttle is None or throttle.setting('practice_output')):
                     # track prediction time
                     elapsed_ms = (time.monotonic() - start_time) * 1000
 
@@ -175,10 +312,12 @@ class CVDetect:
                     annotator.text([5, 0], '%.1fms' % elapsed_ms)
                     annotator.update()
 
-                # clear previous frames captured by camera
-                stream.seek(0)
-                stream.truncate()
+            camera.stop_recording()
+            if reconfigurer is not None:
+                reconfigurer.close()
 
             # stop object detection's camera view if practice run
             if run == 'practice':
                 camera.stop_preview()
+                print(self.scheduler.report('cv'))
+        self.camera = None
@@ -0,0 +1,340 @@
+import argparse
+import glob
+import io
+import json
+import os
+import time
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+from .cv_detect import CVDetect
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def tfrecord_samples(tfrecord_filepaths):
+    """Labelled frames from TFRecords written by utilities/generate_tfrecord.py, one dict at a time.
+
+    Each frame has its name, encoded image, and ground truth boxes as relative [ymin, xmin, ymax, xmax] and class names.
+    """
+    import tensorflow as tf
+
+    features = {
+        'image/filename': tf.io.FixedLenFeature([], tf.string),
+        'image/encoded': tf.io.FixedLenFeature([], tf.string),
+        'image/object/bbox/xmin': tf.io.VarLenFeature(tf.float32),
+        'image/object/bbox/xmax': tf.io.VarLenFeature(tf.float32),
+        'image/object/bbox/ymin': tf.io.VarLenFeature(tf.float32),
+        'image/object/bbox/ymax': tf.io.VarLenFeature(tf.float32),
+        'image/object/class/text': tf.io.VarLenFeature(tf.string)
+    }
+    for record in tf.data.TFRecordDataset(tfrecord_filepaths):
+        example = tf.io.parse_single_example(record, features)
+        dense = {key: tf.sparse.to_dense(value).numpy() if isinstance(value, tf.sparse.SparseTensor) else value.numpy()
+                 for key, value in example.items()}
+        yield {
+            'name': dense['image/filename'].decode('utf-8'),
+            'encoded': dense['image/encoded'],
+            'boxes': np.stack([dense['image/object/bbox/ymin'], dense['image/object/bbox/xmin'],
+                               dense['image/object/bbox/ymax'], dense['image/object/bbox/xmax']], axis=-1),
+            'classes': [text.decode('utf-8') for text in dense['image/object/class/text']]
+        }
+
+
+def read_txt_labels(txt_filepath):
+    """Class names and absolute [xmin, ymin, xmax, ymax] boxes from a label file of class xmin ymin xmax ymax lines."""
+    objects = []
+    with open(txt_filepath, 'r') as file:
+        for line in file:
+            fields = line.split()
+            if fields:
+                objects.append((fields[0], [float(value) for value in fields[1:5]]))
+    return objects
+
+
+def read_xml_labels(xml_filepath):
+    """Image filename, and class names and absolute [xmin, ymin, xmax, ymax] boxes, from a Pascal VOC label file."""
+    root = ElementTree.parse(xml_filepath).getroot()
+    objects = []
+    for element in root.iter('object'):
+        box = element.find('bndbox')
+        objects.append((element.find('name').text,
+                        [float(box.find(name).text) for name in ('xmin', 'ymin', 'xmax', 'ymax')]))
+    return root.find('filename').text, objects
+
+
+def directory_samples(img_dirpath, label_dirpath):
+    """Labelled frames from a directory of images and a directory of TXT or XML labels, one dict at a time.
+
+    Images without labels are kept as frames with nothing in them, which count against false detections.
+    """
+    from PIL import Image
+
+    xml_labels = dict(read_xml_labels(xml_filepath) for xml_filepath in
+                      sorted(glob.glob(os.path.join(label_dirpath, '*.xml'))))
+    for image_filepath in sorted(glob.glob(os.path.join(img_dirpath, '*'))):
+        name = os.path.basename(image_filepath)
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        txt_filepath = os.path.join(label_dirpath, os.path.splitext(name)[0] + '.txt')
+        objects = read_txt_labels(txt_filepath) if os.path.exists(txt_filepath) else xml_labels.get(name, [])
+
+        with open(image_filepath, 'rb') as file:
+            encoded = file.read()
+        width, height = Image.open(io.BytesIO(encoded)).size
+        boxes = np.array([[ymin / height, xmin / width, ymax / height, xmax / width]
+                          for _, (xmin, ymin, xmax, ymax) in objects]).reshape(-1, 4)
+        yield {'name': name, 'encoded': encoded, 'boxes': boxes, 'classes': [class_name for class_name, _ in objects]}
+
+
+def box_iou(box, boxes):
+    """Intersection over union of a [ymin, xmin, ymax, xmax] box with each of an array of them."""
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    heights = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    widths = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    intersection = heights * widths
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = area + areas - intersection
+    return np.where(union > 0, intersection / np.where(union > 0, union, 1), 0.0)
+
+
+def average_precision(scores, matched, num_ground_truth):
+    """Area under the precision-recall curve of scored detections, each matched to a ground truth box or not.
+
+    Precision is made non-increasing in recall before the area is taken, as in Pascal VOC and COCO.
+    """
+    if num_ground_truth == 0:
+        return None
+    order = np.argsort(-np.asarray(scores, dtype=float), kind='stable')
+    matched = np.asarray(matched, dtype=bool)[order]
+    true_positives = np.cumsum(matched)
+    recall = np.concatenate([[0.0], true_positives / num_ground_truth])
+    precision = np.concatenate([[1.0], true_positives / np.arange(1, len(matched) + 1)])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    return float(np.sum((recall[1:] - recall[:-1]) * precision[1:]))
+
+
+class Evaluation:
+    def __init__(self, iou_threshold=0.5):
+        # a detection is correct if it overlaps a ground truth box of its class by the IoU threshold or more
+        self.iou_threshold = iou_threshold
+
+        # every detection's class, score, and whether it matched, and the ground truth count per class
+        self.detection_classes = []
+        self.detection_scores = []
+        self.detection_matched = []
+        self.ground_truth = {}
+
+        # per frame, whether there's anything in it, and the best detection's score and whether it matched,
+        # which is what the mission acts on
+        self.frame_labelled = []
+        self.best_scores = []
+        self.best_matched = []
+
+    def update(self, detections, boxes, classes):
+        """Match a frame's detections, named by class, to its ground truth boxes, highest score first."""
+        for name in classes:
+            self.ground_truth[name] = self.ground_truth.get(name, 0) + 1
+
+        taken = np.zeros(len(classes), dtype=bool)
+        matched = []
+        for detection in sorted(detections, key=lambda detection: -detection['score']):
+            candidates = np.array([name == detection['class'] for name in classes], dtype=bool) & ~taken
+            overlaps = np.where(candidates, box_iou(detection['bounding_box'], boxes), -1.0) if len(classes) else []
+            best = int(np.argmax(overlaps)) if len(overlaps) else -1
+            match = best >= 0 and overlaps[best] >= self.iou_threshold
+            if match:
+                taken[best] = True
+            matched.append(match)
+            self.detection_classes.append(detection['class'])
+            self.detection_scores.append(float(detection['score']))
+            self.detection_matched.append(match)
+
+        self.frame_labelled.append(len(classes) > 0)
+        self.best_scores.append(max((float(detection['score']) for detection in detections), default=-np.inf))
+        self.best_matched.append(bool(matched) and bool(matched[0]))
+
+    def metrics(self, thresholds):
+        """mAP over every detection, and recall, precision, and the mission's frame rates at each score threshold."""
+        classes = np.array(self.detection_classes, dtype=object)
+        scores = np.array(self.detection_scores, dtype=float)
+        matched = np.array(self.detection_matched, dtype=bool)
+        average_precisions = {name: average_precision(scores[classes == name], matched[classes == name], count)
+                              for name, count in sorted(self.ground_truth.items())}
+        num_ground_truth = sum(self.ground_truth.values())
+
+        frame_labelled = np.array(self.frame_labelled, dtype=bool)
+        best_scores = np.array(self.best_scores, dtype=float)
+        best_matched = np.array(self.best_matched, dtype=bool)
+        at_thresholds = {}
+        for threshold in thresholds:
+            kept = scores >= threshold
+            found = best_scores >= threshold
+            at_thresholds[threshold] = {
+                'recall': float(np.sum(matched & kept) / num_ground_truth) if num_ground_truth else None,
+                'precision': float(np.sum(matched & kept) / np.sum(kept)) if np.any(kept) else None,
+                # frames with a rocket whose best detection is on it, and empty frames with a detection anyway
+                'frame_recall': float(np.mean(found[frame_labelled] & best_matched[frame_labelled]))
+                if np.any(frame_labelled) else None,
+                'false_alarm_rate': float(np.mean(found[~frame_labelled])) if np.any(~frame_labelled) else None
+            }
+        return {
+            'map': float(np.mean([ap for ap in average_precisions.values() if ap is not None]))
+            if num_ground_truth else None,
+            'average_precision': average_precisions,
+            'ground_truth': num_ground_truth,
+            'frames': len(self.frame_labelled),
+            'thresholds': at_thresholds
+        }
+
+
+def latency_stats(seconds):
+    """Mean, percentiles, and maximum of per frame times, in milliseconds."""
+    milliseconds = np.asarray(seconds, dtype=float) * 1000
+    if len(milliseconds) == 0:
+        return {}
+    p50, p90, p99 = np.percentile(milliseconds, [50, 90, 99])
+    return {'mean': float(milliseconds.mean()), 'p50': float(p50), 'p90': float(p90), 'p99': float(p99),
+            'max': float(milliseconds.max())}
+
+
+def evaluate(model_filepath, labels_filepath, samples, thresholds, device='auto', iou_threshold=0.5, min_score=0.01,
+             warmup_inferences=3):
+    """Run labelled frames through the model with the mission's preprocessing and postprocessing.
+
+    Returns a report of the accuracy at each threshold and the latency and throughput on the device used.
+    """
+    from PIL import Image
+
+    detector = CVDetect()
+    labels = detector.load_labels(labels_filepath)
+    interpreter, device = detector.load_interpreter(model_filepath, device)
+    _, input_height, input_width, _ = interpreter.get_input_details()[0]['shape']
+    evaluation = Evaluation(iou_threshold)
+
+    # the first invokes upload the model to the Edge TPU, so they're run before timing starts as before the mission
+    blank = Image.new('RGB', (input_width, input_height))
+    for _ in range(warmup_inferences):
+        detector.get_detections(interpreter, blank, min_score)
+
+    decode_times = []
+    inference_times = []
+    start = time.perf_counter()
+    for sample in samples:
+        # decode and resize as the camera loop does
+        decode_start = time.perf_counter()
+        image = detector.preprocess(Image.open(io.BytesIO(sample['encoded'])), input_width, input_height)
+        inference_start = time.perf_counter()
+        decode_times.append(inference_start - decode_start)
+
+        detections = detector.get_detections(interpreter, image, min_score)
+        inference_times.append(time.perf_counter() - inference_start)
+
+        for detection in detections:
+            detection['class'] = labels.get(int(detection['class_id']), str(int(detection['class_id'])))
+        evaluation.update(detections, sample['boxes'], sample['classes'])
+    elapsed = time.perf_counter() - start
+
+    report = {
+        'model': model_filepath,
+        'device': device,
+        'iou_threshold': iou_threshold,
+        'throughput': len(inference_times) / elapsed if elapsed > 0 else 0.0,
+        'decode_ms': latency_stats(decode_times),
+        'inference_ms': latency_stats(inference_times),
+        'frame_ms': latency_stats(np.add(decode_times, inference_times))
+    }
+    report.update(evaluation.metrics(thresholds))
+    return report
+
+
+def format_metric(value, spec='%.3f'):
+    return '-' if value is None else spec % value
+
+
+def print_reports(reports):
+    """Comparison table of the reports, a row per model and threshold."""
+    print('%-48s %6s %6s %6s %6s %6s %6s %6s %8s %8s %8s %8s' % (
+        'Model', 'Device', 'Thresh', 'mAP', 'Recall', 'Prec', 'FrmRec', 'FalseAl', 'p50 ms', 'p90 ms', 'p99 ms',
+        'Frames/s'))
+    for report in reports:
+        for threshold, metrics in sorted(report['thresholds'].items()):
+            print('%-48s %6s %6.2f %6s %6s %6s %6s %6s %8.1f %8.1f %8.1f %8.1f' % (
+                os.path.basename(report['model'])[-48:], report['device'], threshold, format_metric(report['map']),
+                format_metric(metrics['recall']), format_metric(metrics['precision']),
+                format_metric(metrics['frame_recall']), format_metric(metrics['false_alarm_rate']),
+                report['frame_ms'].get('p50', 0.0), report['frame_ms'].get('p90', 0.0),
+                report['frame_ms'].get('p99', 0.0), report['throughput']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate object detection models on labelled frames for accuracy '
+                                                 'and speed.')
+    parser.add_argument(
+        '--model',
+        nargs='+',
+        default=[os.path.abspath('./cv/efficientdet-lite2-rocket-quant_edgetpu.tflite')],
+        help='TFLite models to compare, the mission model by default')
+    parser.add_argument(
+        '--labels',
+        default=os.path.abspath('./cv/rocket-labels.txt'),
+        help='Labels file of the models')
+    parser.add_argument(
+        '--tfrecord',
+        nargs='+',
+        help='TFRecords written by utilities/generate_tfrecord.py to evaluate on')
+    parser.add_argument(
+        '--img_dir',
+        help='Directory of images to evaluate on, instead of TFRecords')
+    parser.add_argument(
+        '--label_dir',
+        help='Directory of TXT or XML labels of the images')
+    parser.add_argument(
+        '--threshold',
+        nargs='+',
+        type=float,
+        default=[0.25],
+        help='Score thresholds to report recall and precision at, the mission threshold by default')
+    parser.add_argument(
+        '--iou',
+        type=float,
+        default=0.5,
+        help='Overlap with a ground truth box for a detection to count as correct')
+    parser.add_argument(
+        '--device',
+        choices=['auto', 'tpu', 'cpu'],
+        default='auto',
+        help='Run on the Edge TPU, the CPU, or the Edge TPU if one is plugged in and the CPU otherwise')
+    parser.add_argument(
+        '--limit',
+        type=int,
+        help='Evaluate on at most this many frames')
+    parser.add_argument(
+        '--report',
+        help='Write the reports to this JSON file to compare later')
+    args = parser.parse_args()
+
+    if args.tfrecord is None and (args.img_dir is None or args.label_dir is None):
+        parser.error('Give --tfrecord, or --img_dir and --label_dir')
+
+    reports = []
+    for model_filepath in args.model:
+        # stream the frames again for each model, never holding the dataset in memory
+        if args.tfrecord is not None:
+            samples = tfrecord_samples(args.tfrecord)
+        else:
+            samples = directory_samples(args.img_dir, args.label_dir)
+        if args.limit is not None:
+            samples = (sample for _, sample in zip(range(args.limit), samples))
+        reports.append(evaluate(model_filepath, args.labels, samples, args.threshold, args.device, args.iou))
+
+    print_reports(reports)
+    if args.report is not None:
+        with open(args.report, 'w') as file:
+            json.dump(reports, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import io
+import threading
+import time
+
+
+class FrameOutput:
+    """Custom output for an MJPEG recording that keeps the latest complete frame with the time it was exposed.
+
+    picamera only reports a frame's timestamp while a recording runs, so the frames are recorded rather than captured.
+    """
+
+    def __init__(self, camera, clock=time.perf_counter, verbose=False):
+        self.camera = camera
+        self.clock = clock
+        self.verbose = verbose
+
+        # the frame being written, and the latest complete one as (index, JPEG bytes, exposure time)
+        self.buffer = io.BytesIO()
+        self.index = 0
+        self.latest = None
+        self.condition = threading.Condition()
+
+        # set once a frame had to be stamped on arrival because the camera reported no timestamp for it
+        self.fallback = False
+
+    def exposure_time(self, now):
+        """Time the camera's current frame was exposed, on the time.perf_counter() clock shared by the mission."""
+        frame_timestamp = self.camera.frame.timestamp
+        if frame_timestamp is None:
+            if not self.fallback and self.verbose:
+                print('cv: the camera reported no frame timestamp, stamping frames on arrival')
+            self.fallback = True
+            return now
+        return now - (self.camera.timestamp - frame_timestamp) / 1e6
+
+    def write(self, data):
+        """Take the recording's data from picamera, a frame at a time or in pieces."""
+        now = self.clock()
+        self.buffer.write(data)
+        if self.camera.frame.complete:
+            with self.condition:
+                self.index += 1
+                self.latest = (self.index, self.buffer.getvalue(), self.exposure_time(now))
+                self.condition.notify_all()
+            self.buffer.seek(0)
+            self.buffer.truncate()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def next(self, index, timeout=None):
+        """The latest frame newer than the index, waiting up to the timeout in seconds for one, otherwise None.
+
+        Frames that came in while the caller was busy are skipped, so it's always handed the freshest one.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.index > index, timeout)
+            return self.latest if self.index > index else None
@@ -0,0 +1,129 @@
+import multiprocessing
+
+import numpy as np
+
+GRAVITY = 9.80665
+
+
+class AltitudeEstimator:
+    def __init__(self, accel_noise=0.5, baro_noise=1.0, bias_drift=0.01, launch_velocity=15.0, launch_height=30.0,
+                 apogee_samples=5):
+        # noise of the vertical acceleration in m/s^2 and of the barometric altitude in meters, and how fast the
+        # accelerometer bias wanders in m/s^2 per root second
+        self.accel_noise = accel_noise
+        self.baro_noise = baro_noise
+        self.bias_drift = bias_drift
+
+        # state of altitude, vertical velocity, and vertical accelerometer bias, and its covariance
+        self.state = np.zeros(3)
+        self.covariance = np.diag([100.0, 1.0, 0.25])
+        self.last_time = None
+        self.initialized = False
+
+        # unit vector pointing up in the IMU's frame, from the attitude estimate as the IMU turns with the gimbal, or
+        # else from gravity in the first sample with the payload still
+        self.up = None
+
+        # launch is detected by the climb rate in m/s or the height above ground in meters, and apogee once the
+        # velocity has been falling for some samples
+        self.launch_velocity = launch_velocity
+        self.launch_height = launch_height
+        self.apogee_samples = apogee_samples
+        self.ground = None
+        self.launched = False
+        self.descending = 0
+        self.apogee = None
+        self.peak = (None, -np.inf)
+
+    def predict(self, time, accelerometer, up=None):
+        """Propagate the state to the time of an accelerometer sample in m/s^2, with up in the IMU's frame if known."""
+        accelerometer = np.asarray(accelerometer, dtype=float)
+        if up is not None:
+            self.up = np.asarray(up, dtype=float)
+        elif self.up is None:
+            norm = np.linalg.norm(accelerometer)
+            self.up = accelerometer / norm if norm > 0 else np.array([0.0, 0.0, 1.0])
+        if self.last_time is None:
+            self.last_time = time
+            return
+        dt = time - self.last_time
+        self.last_time = time
+        if dt <= 0 or not self.initialized:
+            return
+
+        # vertical acceleration with gravity removed, less the estimated bias
+        acceleration = np.dot(accelerometer, self.up) - GRAVITY - self.state[2]
+        self.state[0] += self.state[1] * dt + 0.5 * acceleration * dt * dt
+        self.state[1] += acceleration * dt
+
+        transition = np.array([[1.0, dt, -0.5 * dt * dt], [0.0, 1.0, -dt], [0.0, 0.0, 1.0]])
+        noise = np.array([0.5 * dt * dt, dt, 0.0])
+        process = np.outer(noise, noise) * self.accel_noise ** 2
+        process[2, 2] += self.bias_drift ** 2 * dt
+        self.covariance = transition.dot(self.covariance).dot(transition.T) + process
+        self.detect(time)
+
+    def correct(self, altitude):
+        """Correct the state with a barometric altitude in meters."""
+        if not self.initialized:
+            self.state[0] = altitude
+            self.ground = altitude
+            self.initialized = True
+            return
+        innovation = altitude - self.state[0]
+        gain = self.covariance[:, 0] / (self.covariance[0, 0] + self.baro_noise ** 2)
+        self.state += gain * innovation
+        self.covariance -= np.outer(gain, self.covariance[0])
+
+    def restore(self, state):
+        """Carry on from an estimate shared before a restart, keeping its ground rather than taking a new one."""
+        self.state[0] = state['altitude']
+        self.state[1] = state['velocity']
+        self.ground = state['ground']
+        self.launched = state['launched']
+        if state['apogee'] is not None:
+            self.apogee = self.peak = (state['apogee']['time'], state['apogee']['altitude'])
+        self.initialized = True
+
+    def detect(self, time):
+        """Track launch and the highest point since, and call apogee once the payload has been falling."""
+        altitude, velocity = self.state[0], self.state[1]
+        if not self.launched:
+            self.launched = velocity > self.launch_velocity or altitude - self.ground > self.launch_height
+            return
+        if altitude > self.peak[1]:
+            self.peak = (time, altitude)
+        if self.apogee is None:
+            self.descending = self.descending + 1 if velocity < 0 else 0
+            if self.descending >= self.apogee_samples:
+                self.apogee = self.peak
+
+
+class AltitudeState:
+    # fields shared by the flight data capture, time is time.perf_counter() on the mission clock, and the attitude
+    # the vertical is taken from as a (w, x, y, z) quaternion
+    FIELDS = ['Time', 'Altitude', 'Velocity', 'Ground', 'Launched', 'Apogee-Time', 'Apogee-Altitude', 'Q-W', 'Q-X',
+              'Q-Y', 'Q-Z']
+
+    def __init__(self):
+        # latest estimate in shared memory, written by data capture at the IMU rate and read by the others
+        self.values = multiprocessing.RawArray('d', len(self.FIELDS))
+        self.lock = multiprocessing.Lock()
+        self.values[5] = self.values[6] = np.nan
+
+    def publish(self, time, estimator, quaternion=(1.0, 0.0, 0.0, 0.0)):
+        """Share the estimator's latest altitude, velocity, and apogee, and the attitude it was propagated with."""
+        apogee_time, apogee_altitude = estimator.apogee if estimator.apogee is not None else (np.nan, np.nan)
+        with self.lock:
+            self.values[:] = [time, estimator.state[0], estimator.state[1], estimator.ground or 0.0,
+                              float(estimator.launched), apogee_time, apogee_altitude] + list(quaternion)
+
+    def read(self):
+        """Copy of the latest shared estimate as a dict, with no apogee until one is detected."""
+        with self.lock:
+            values = list(self.values)
+        state = dict(zip(['time', 'altitude', 'velocity', 'ground', 'launched'], values[:5]))
+        state['launched'] = bool(state['launched'])
+        state['apogee'] = None if np.isnan(values[5]) else {'time': values[5], 'altitude': values[6]}
+        state['quaternion'] = values[7:11]
+        return state
@@ -0,0 +1,257 @@
+import argparse
+import glob
+import itertools
+import os
+import time
+
+import numpy as np
+
+
+def flight_logs(dirpath):
+    """Flight data CSVs in a directory, oldest first, leaving out the governor logs written next to them."""
+    return sorted(filepath for filepath in glob.glob(os.path.join(dirpath, '*.csv'))
+                  if not filepath.endswith('_governor.csv'))
+
+
+def read_header(csv_filepath):
+    """Column names of a flight data CSV."""
+    with open(csv_filepath, 'r') as file:
+        return file.readline().strip().split(',')
+
+
+def log_dtype(columns):
+    """Structured array type of a flight log, every column a float with the time in seconds."""
+    return np.dtype([(column, 'f8') for column in columns])
+
+
+def parse_lines(lines, dtype):
+    """Parse lines of a flight data CSV into a structured array, a whole chunk at a time.
+
+    The timestamps are parsed by NumPy as datetimes and the numbers by its C parser instead of one at a time.
+    """
+    rows = np.empty(len(lines), dtype=dtype)
+    stamps = np.array([line.split(',', 1)[0] for line in lines], dtype='datetime64[us]')
+    rows[dtype.names[0]] = stamps.astype(np.int64) / 1e6
+    values = np.loadtxt(lines, delimiter=',', usecols=range(1, len(dtype.names)), ndmin=2)
+    for index, name in enumerate(dtype.names[1:]):
+        rows[name] = values[:, index]
+    return rows
+
+
+def chunks(csv_filepath, chunk_rows=65536):
+    """Stream a flight data CSV as structured arrays of at most chunk_rows rows each."""
+    dtype = log_dtype(read_header(csv_filepath))
+    with open(csv_filepath, 'r') as file:
+        next(file)
+        while True:
+            lines = list(itertools.islice(file, chunk_rows))
+            if not lines:
+                return
+
+            # leave out blank lines and a last line cut short by the capture stopping mid-write
+            rows = [line for line in lines if line.endswith('\n') and line.count(',') == len(dtype) - 1]
+            yield parse_lines(rows, dtype) if rows else np.empty(0, dtype=dtype)
+
+
+def count_rows(csv_filepath, block_size=1 << 20):
+    """Number of data rows in a CSV, counted in blocks without parsing."""
+    count = 0
+    with open(csv_filepath, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            count += block.count(b'\n')
+    return count - 1
+
+
+class RunningStats:
+    def __init__(self, names):
+        # count, mean, sum of squared deviations, minimum, and maximum per channel, merged chunk by chunk
+        self.names = list(names)
+        self.count = 0
+        self.mean = np.zeros(len(self.names))
+        self.m2 = np.zeros(len(self.names))
+        self.minimum = np.full(len(self.names), np.inf)
+        self.maximum = np.full(len(self.names), -np.inf)
+
+    def update(self, values):
+        """Merge a chunk of rows, one column per channel, into the statistics."""
+        values = np.asarray(values, dtype=float)
+        count = len(values)
+        if count == 0:
+            return
+        mean = values.mean(axis=0)
+        m2 = ((values - mean) ** 2).sum(axis=0)
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.minimum = np.minimum(self.minimum, values.min(axis=0))
+        self.maximum = np.maximum(self.maximum, values.max(axis=0))
+
+    def summary(self):
+        """Statistics per channel as a dict of dicts."""
+        std = np.sqrt(self.m2 / self.count) if self.count else np.zeros(len(self.names))
+        return {name: {'count': self.count, 'mean': self.mean[i], 'std': std[i], 'min': self.minimum[i],
+                       'max': self.maximum[i]} for i, name in enumerate(self.names)}
+
+
+class FlightLog:
+    def __init__(self, csv_filepath, cache_filepath=None, chunk_rows=65536):
+        # the CSV is converted once to a NumPy file next to it, which is memory-mapped from then on
+        self.csv_filepath = csv_filepath
+        self.cache_filepath = cache_filepath or os.path.splitext(csv_filepath)[0] + '.npy'
+        self.chunk_rows = chunk_rows
+        if not self.cached():
+            self.convert()
+        self.rows = np.load(self.cache_filepath, mmap_mode='r')
+        self.columns = list(self.rows.dtype.names)
+
+    def cached(self):
+        """Whether the memory-mapped copy exists and is at least as new as the CSV."""
+        return (os.path.exists(self.cache_filepath) and
+                os.path.getmtime(self.cache_filepath) >= os.path.getmtime(self.csv_filepath))
+
+    def convert(self):
+        """Write the CSV to the memory-mapped copy a chunk at a time, never holding the whole flight in memory."""
+        dtype = log_dtype(read_header(self.csv_filepath))
+        partial = self.cache_filepath + '.tmp.npy'
+        rows = np.lib.format.open_memmap(partial, mode='w+', dtype=dtype, shape=(count_rows(self.csv_filepath),))
+        end = 0
+        for chunk in chunks(self.csv_filepath, self.chunk_rows):
+            rows[end:end + len(chunk)] = chunk
+            end += len(chunk)
+        rows.flush()
+
+        # lines that couldn't be parsed are left out, so the rows can come up short of the line count
+        if end < len(rows):
+            trimmed = self.cache_filepath + '.trim.npy'
+            np.save(trimmed, rows[:end])
+            del rows
+            os.replace(trimmed, partial)
+        else:
+            del rows
+        os.replace(partial, self.cache_filepath)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def times(self):
+        return self.rows[self.columns[0]]
+
+    def channels(self, names=None):
+        """Names of the data channels, every column but the time, or the ones asked for."""
+        return self.columns[1:] if names is None else list(names)
+
+    def slice(self, start=None, stop=None):
+        """Rows from start to stop, in seconds since the first sample, as a view into the memory map.
+
+        The samples are in time order, so the range is found by binary search.
+        """
+        times = self.times
+        first = times[0] if len(times) else 0.0
+        low = 0 if start is None else np.searchsorted(times, first + start, side='left')
+        high = len(times) if stop is None else np.searchsorted(times, first + stop, side='right')
+        return self.rows[low:high]
+
+    def resample(self, rate, names=None, start=None, stop=None):
+        """Channels linearly interpolated onto a common timebase at the rate in Hz.
+
+        Returns the times in seconds since the first sample and an array with a column per channel.
+        """
+        rows = self.slice(start, stop)
+        names = self.channels(names)
+        if len(rows) == 0:
+            return np.zeros(0), np.zeros((0, len(names)))
+        origin = self.times[0]
+        times = np.asarray(rows[self.columns[0]]) - origin
+        timebase = np.arange(times[0], times[-1], 1.0 / rate)
+        values = np.column_stack([np.interp(timebase, times, rows[name]) for name in names])
+        return timebase, values
+
+    def decimate(self, factor, names=None, start=None, stop=None):
+        """Channels averaged over blocks of factor samples, smoothing before thinning out.
+
+        Returns the mean time of each block in seconds since the first sample and an array with a column per channel.
+        """
+        rows = self.slice(start, stop)
+        names = self.channels(names)
+        blocks = len(rows) // factor
+        times = (np.asarray(rows[self.columns[0]][:blocks * factor]) - self.times[0]).reshape(blocks, factor)
+        values = np.column_stack([np.asarray(rows[name][:blocks * factor]).reshape(blocks, factor).mean(axis=1)
+                                  for name in names]) if blocks else np.zeros((0, len(names)))
+        return times.mean(axis=1), values
+
+    def summary(self, names=None, start=None, stop=None):
+        """Per channel count, mean, standard deviation, minimum, and maximum, read a chunk at a time."""
+        rows = self.slice(start, stop)
+        names = self.channels(names)
+        stats = RunningStats(names)
+        for index in range(0, len(rows), self.chunk_rows):
+            chunk = rows[index:index + self.chunk_rows]
+            stats.update(np.column_stack([chunk[name] for name in names]))
+        return stats.summary()
+
+
+def summarize_csv(csv_filepath, names=None, chunk_rows=65536):
+    """Per channel statistics streamed straight from a CSV in constant memory, without a memory-mapped copy."""
+    columns = read_header(csv_filepath)
+    names = columns[1:] if names is None else list(names)
+    stats = RunningStats(names)
+    for chunk in chunks(csv_filepath, chunk_rows):
+        stats.update(np.column_stack([chunk[name] for name in names]))
+    return stats.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a flight data CSV, memory-mapping it for later runs.')
+    parser.add_argument(
+        'csv',
+        nargs='?',
+        type=str,
+        help='Flight data CSV, the newest in data/output/IMU/ by default')
+    parser.add_argument(
+        '--start',
+        type=float,
+        help='Seconds since the first sample to start at')
+    parser.add_argument(
+        '--stop',
+        type=float,
+        help='Seconds since the first sample to stop at')
+    parser.add_argument(
+        '--channels',
+        nargs='+',
+        help='Channels to summarize, every one by default')
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Stream the CSV in chunks instead of memory-mapping it')
+    args = parser.parse_args()
+
+    csv_filepath = args.csv
+    if csv_filepath is None:
+        logs = flight_logs(os.path.abspath('./data/output/IMU/'))
+        if not logs:
+            parser.error('No flight data in data/output/IMU/, give a CSV')
+        csv_filepath = logs[-1]
+
+    start = time.perf_counter()
+    if args.stream:
+        summary = summarize_csv(csv_filepath, args.channels)
+        print('%s: streamed in %.3fs' % (csv_filepath, time.perf_counter() - start))
+    else:
+        log = FlightLog(csv_filepath)
+        opened = time.perf_counter() - start
+        summary = log.summary(args.channels, args.start, args.stop)
+        duration = log.times[-1] - log.times[0] if len(log) else 0.0
+        print('%s: %d samples over %.2fs, opened in %.3fs, summarized in %.3fs' %
+              (csv_filepath, len(log), duration, opened, time.perf_counter() - start - opened))
+
+    print('%-12s %10s %12s %12s %12s %12s' % ('Channel', 'Count', 'Mean', 'Std', 'Min', 'Max'))
+    for name, stats in summary.items():
+        print('%-12s %10d %12.4f %12.4f %12.4f %12.4f' % (name, stats['count'], stats['mean'], stats['std'],
+                                                         stats['min'], stats['max']))
+
+
+if __name__ == '__main__':
+    main()
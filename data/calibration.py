@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import socket
+import time
+from datetime import datetime
+
+import numpy as np
+
+GRAVITY = 9.80665
+
+
+def board_id():
+    """Serial number of the Raspberry Pi, or the hostname elsewhere."""
+    try:
+        with open('/proc/cpuinfo') as file:
+            for line in file:
+                if line.startswith('Serial'):
+                    return line.split(':')[1].strip()
+    except OSError:
+        pass
+    return socket.gethostname()
+
+
+def fit_ellipsoid(points):
+    """Center and correction matrix that map points on an ellipsoid onto a sphere of their mean radius.
+
+    Fits the general quadric x'Ax + 2b'x = 1 to the points by linear least squares.
+    """
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    design = np.column_stack([x * x, y * y, z * z, 2 * y * z, 2 * x * z, 2 * x * y, 2 * x, 2 * y, 2 * z])
+    v = np.linalg.lstsq(design, np.ones(len(points)), rcond=None)[0]
+    quadric = np.array([[v[0], v[5], v[4]], [v[5], v[1], v[3]], [v[4], v[3], v[2]]])
+    center = -np.linalg.solve(quadric, v[6:9])
+
+    # scale the quadric so the centered ellipsoid is x'Ax = 1, whose square root maps it onto the unit sphere
+    quadric = quadric / (1.0 + center.dot(quadric).dot(center))
+    values, vectors = np.linalg.eigh(quadric)
+    if np.any(values <= 0):
+        raise ValueError('Samples do not fit an ellipsoid, rotate the board through more orientations')
+    radius = np.prod(1.0 / np.sqrt(values)) ** (1.0 / 3.0)
+    return center, radius * vectors.dot(np.diag(np.sqrt(values))).dot(vectors.T)
+
+
+class Calibration:
+    def __init__(self, gyro_bias=(0.0, 0.0, 0.0), accel_offset=(0.0, 0.0, 0.0), mag_offset=(0.0, 0.0, 0.0),
+                 mag_matrix=None, temperature=None):
+        # gyroscope bias in degrees per second and accelerometer offsets in m/s^2, subtracted from the readings
+        self.gyro_bias = np.asarray(gyro_bias, dtype=float)
+        self.accel_offset = np.asarray(accel_offset, dtype=float)
+
+        # hard-iron offset subtracted from the magnetometer, then the soft-iron correction applied
+        self.mag_offset = np.asarray(mag_offset, dtype=float)
+        self.mag_matrix = np.eye(3) if mag_matrix is None else np.asarray(mag_matrix, dtype=float)
+
+        # board temperature in degrees Celsius the gyroscope and accelerometer were calibrated at
+        self.temperature = temperature
+        self.build()
+
+    def build(self):
+        """Fold every correction into one affine map of a row of gyroscope, accelerometer, and magnetometer."""
+        matrix = np.zeros((10, 9))
+        matrix[0:3, 0:3] = np.eye(3)
+        matrix[3:6, 3:6] = np.eye(3)
+        matrix[6:9, 6:9] = self.mag_matrix.T
+        matrix[9, 0:3] = -self.gyro_bias
+        matrix[9, 3:6] = -self.accel_offset
+        matrix[9, 6:9] = -self.mag_matrix.dot(self.mag_offset)
+        self.linear = matrix[:9]
+        self.offset = matrix[9]
+
+    def apply(self, readings):
+        """Calibrate one reading or an array of readings of the 9 gyroscope, accelerometer, and magnetometer axes."""
+        return np.dot(readings, self.linear) + self.offset
+
+    def fit_stationary(self, readings):
+        """Gyroscope bias and accelerometer offset from readings of the board sitting still.
+
+        Still, the gyroscope should read zero and the accelerometer gravity, so only the accelerometer's error
+        along gravity is observable.
+        """
+        readings = np.asarray(readings, dtype=float)
+        self.gyro_bias = readings[:, 0:3].mean(axis=0)
+        accelerometer = readings[:, 3:6].mean(axis=0)
+        norm = np.linalg.norm(accelerometer)
+        self.accel_offset = accelerometer - GRAVITY * accelerometer / norm if norm > 0 else np.zeros(3)
+        self.build()
+
+    def fit_magnetometer(self, readings):
+        """Hard- and soft-iron correction from magnetometer readings taken while turning the board every way."""
+        self.mag_offset, self.mag_matrix = fit_ellipsoid(np.asarray(readings, dtype=float)[:, 6:9])
+        self.build()
+
+
+class CalibrationCache:
+    def __init__(self, filepath, board=None, temperature_step=5.0):
+        # cache file of calibrations per board, with the gyroscope and accelerometer per temperature bin in Celsius
+        self.filepath = filepath
+        self.board = board_id() if board is None else board
+        self.temperature_step = temperature_step
+
+    def read(self):
+        """All cached calibrations, empty if there's no cache yet."""
+        try:
+            with open(self.filepath) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def key(self, temperature):
+        return str(int(round(temperature / self.temperature_step) * self.temperature_step))
+
+    def load(self, temperature, nearest=False):
+        """The cached calibration for this board near the given temperature, or at the nearest cached one if asked.
+
+        Returns the calibration and whether the gyroscope and accelerometer were cached for that temperature,
+        or None if nothing is cached for this board.
+        """
+        board = self.read().get(self.board)
+        if board is None:
+            return None, False
+        magnetometer = board.get('magnetometer', {})
+        temperatures = board.get('temperatures', {})
+        stationary = temperatures.get(self.key(temperature))
+        if stationary is None and nearest and temperatures:
+            stationary = temperatures[min(temperatures, key=lambda key: abs(float(key) - temperature))]
+        calibration = Calibration(mag_offset=magnetometer.get('offset', (0.0, 0.0, 0.0)),
+                                  mag_matrix=magnetometer.get('matrix'))
+        if stationary is None:
+            return calibration, False
+        calibration.gyro_bias = np.array(stationary['gyro_bias'])
+        calibration.accel_offset = np.array(stationary['accel_offset'])
+        calibration.temperature = stationary['temperature']
+        calibration.build()
+        return calibration, True
+
+    def save(self, calibration, magnetometer=False):
+        """Store the calibration's gyroscope and accelerometer under its temperature, and the magnetometer if asked."""
+        cache = self.read()
+        board = cache.setdefault(self.board, {})
+        if magnetometer:
+            board['magnetometer'] = {'offset': calibration.mag_offset.tolist(),
+                                     'matrix': calibration.mag_matrix.tolist()}
+        if calibration.temperature is not None:
+            board.setdefault('temperatures', {})[self.key(calibration.temperature)] = {
+                'gyro_bias': calibration.gyro_bias.tolist(),
+                'accel_offset': calibration.accel_offset.tolist(),
+                'temperature': calibration.temperature,
+                'date': datetime.now().isoformat(timespec='seconds')
+            }
+
+        # replace the file in one step so a reader never sees half of it
+        os.makedirs(os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True)
+        partial = self.filepath + '.tmp'
+        with open(partial, 'w') as file:
+            json.dump(cache, file, indent=1)
+        os.replace(partial, self.filepath)
+
+
+def collect(imu, magnetometer, duration, rate=100):
+    """Read the gyroscope, accelerometer, and magnetometer at a fixed rate for a while."""
+    count = max(int(duration * rate), 1)
+    readings = np.empty((count, 9))
+    deadline = time.perf_counter()
+    for i in range(count):
+        readings[i] = imu.getGyroscopeDPS() + imu.getAccelerometerMPS2() + magnetometer.getMagnetometerRaw()
+        deadline += 1.0 / rate
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    return readings
+
+
+def calibrate(imu, magnetometer, cache, window=2.0, rate=100, measure=True):
+    """Calibration for the sensors, loaded from the cache or measured over a window of the board sitting still.
+
+    Without measuring, the calibration cached nearest the temperature is used, as when the board may be moving.
+    """
+    temperature = imu.getTemperatureCelsius()
+    calibration, cached = cache.load(temperature, nearest=not measure)
+    if cached or not measure:
+        return Calibration() if calibration is None else calibration
+    if calibration is None:
+        calibration = Calibration()
+    calibration.fit_stationary(collect(imu, magnetometer, window, rate))
+    calibration.temperature = temperature
+    cache.save(calibration)
+    return calibration
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate the AltIMU-10 v5 and cache the result for this board.')
+    parser.add_argument(
+        '--cache',
+        default=os.path.abspath('./data/output/calibration.json'),
+        type=str,
+        help='Calibration cache file')
+    parser.add_argument(
+        '--still',
+        default=5.0,
+        type=float,
+        help='Seconds to hold the board still for the gyroscope and accelerometer')
+    parser.add_argument(
+        '--rotate',
+        default=30.0,
+        type=float,
+        help='Seconds to turn the board every way for the magnetometer, 0 to skip')
+    args = parser.parse_args()
+
+    from .lis3mdl import LIS3MDL
+    from .lsm6ds33 import LSM6DS33
+
+    imu = LSM6DS33()
+    imu.enable()
+    magnetometer = LIS3MDL()
+    magnetometer.enable()
+    cache = CalibrationCache(args.cache)
+    calibration = Calibration(temperature=imu.getTemperatureCelsius())
+
+    print('Hold the board still for %g seconds' % args.still)
+    calibration.fit_stationary(collect(imu, magnetometer, args.still))
+    print('Gyroscope bias (dps): %s' % np.round(calibration.gyro_bias, 4).tolist())
+    print('Accelerometer offset (m/s^2): %s' % np.round(calibration.accel_offset, 4).tolist())
+
+    if args.rotate > 0:
+        print('Turn the board slowly through every orientation for %g seconds' % args.rotate)
+        calibration.fit_magnetometer(collect(imu, magnetometer, args.rotate, 20))
+        print('Magnetometer offset (raw): %s' % np.round(calibration.mag_offset, 1).tolist())
+    cache.save(calibration, magnetometer=args.rotate > 0)
+    print('Saved the calibration for board %s at %.1f C to %s' % (cache.board, calibration.temperature, cache.filepath))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+import argparse
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+# columns of the flight data, as in the CSV, and the resolution each is stored at, finer than the sensors resolve:
+# time in microseconds, the gyroscope in mdps, the accelerometer in 0.1 mm/s^2, and the rest as written to the CSV
+COLUMNS = ['Time', 'X-Gyro', 'Y-Gyro', 'Z-Gyro', 'X-Accel', 'Y-Accel', 'Z-Accel', 'X-Mag', 'Y-Mag', 'Z-Mag',
+           'Pressure', 'Altitude', 'Temperature']
+SCALES = [1e-6, 1e-3, 1e-3, 1e-3, 1e-4, 1e-4, 1e-4, 1e-2, 1e-2, 1e-2, 1e-2, 1e-2, 1e-2]
+
+# file header, block header of row count, payload size, and checksum, index entry of first time, offset, and row
+# count, and the footer pointing at the index
+MAGIC = b'BX4L'
+VERSION = 1
+BLOCK = struct.Struct('<III')
+ENTRY = struct.Struct('<dQI')
+FOOTER = struct.Struct('<QI4s')
+INDEX_MAGIC = b'BX4I'
+
+
+def csv_line(now, gyroscope, accelerometer, magnetometer, pressure, altitude, temperature):
+    """Format a sample as a line of the flight data file."""
+    # make new strings to edit
+    gyroscope_data = str(gyroscope)
+    accelerometer_data = str(accelerometer)
+    magnetometer_data = str(magnetometer)
+
+    # chop brackets off the end of strings
+    gyroscope_data = gyroscope_data[1:len(gyroscope_data) - 1]
+    accelerometer_data = accelerometer_data[1:len(accelerometer_data) - 1]
+    magnetometer_data = magnetometer_data[1:len(magnetometer_data) - 1]
+
+    # get rid of whitespace
+    gyroscope_data = gyroscope_data.replace(' ', '')
+    accelerometer_data = accelerometer_data.replace(' ', '')
+    magnetometer_data = magnetometer_data.replace(' ', '')
+    pressure_data = str(round(pressure, 1))
+    altitude_data = str(round(altitude, 2))
+    temperature_data = str(temperature)
+
+    return ','.join([str(now), gyroscope_data, accelerometer_data, magnetometer_data, pressure_data,
+                     altitude_data, temperature_data + '\n'])
+
+
+def zigzag(values):
+    """Map signed integers to unsigned ones, small magnitudes to small numbers."""
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def unzigzag(values):
+    values = np.asarray(values, dtype=np.uint64)
+    return (values >> np.uint64(1)).view(np.int64) ^ -(values & np.uint64(1)).view(np.int64)
+
+
+def encode_varints(values):
+    """Encode unsigned integers as LEB128 varints, 7 bits a byte with the high bit set on all but the last byte.
+
+    Vectorized over the values, looping only over the at most 10 byte positions.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for position in range(1, 10):
+        lengths += values >= np.uint64(1 << (7 * position))
+    starts = np.cumsum(lengths) - lengths
+    data = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for position in range(int(lengths.max()) if len(values) else 0):
+        more = lengths > position
+        chunk = (values[more] >> np.uint64(7 * position)) & np.uint64(0x7F)
+        chunk |= (lengths[more] > position + 1).astype(np.uint64) << np.uint64(7)
+        data[starts[more] + position] = chunk
+    return data
+
+
+def decode_varints(data):
+    """Decode LEB128 varints, vectorized over every byte at once."""
+    data = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray, memoryview)) else data
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    last = data < 0x80
+    ends = np.flatnonzero(last)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+
+    # each byte's position within its varint gives its shift, and the shifted bits never overlap so they add up
+    group = np.cumsum(last) - last
+    shifts = (np.arange(len(data)) - starts[group]) * 7
+    bits = (data & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.add.reduceat(bits, starts)
+
+
+def encode_block(rows, scales):
+    """Quantize a block of rows, delta encode each channel from the block's first row, and pack the deltas as
+    zigzag varints, one channel after another."""
+    quantized = np.round(np.asarray(rows, dtype=float) / scales).astype(np.int64)
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, quantized.shape[1]), dtype=np.int64))
+    return encode_varints(zigzag(deltas.T.ravel())).tobytes()
+
+
+def decode_block(payload, count, scales):
+    """Rows of a block, as floats with a column per channel."""
+    deltas = unzigzag(decode_varints(payload)).reshape(len(scales), count)
+    return (np.cumsum(deltas, axis=1) * np.asarray(scales)[:, None]).T
+
+
+class BlockWriter:
+    def __init__(self, filepath, columns=COLUMNS, scales=SCALES, block_rows=1024, background=True):
+        # rows are gathered into blocks, and each full block is encoded and written on a thread of its own
+        self.filepath = filepath
+        self.columns = list(columns)
+        self.scales = np.asarray(scales, dtype=float)
+        self.block_rows = block_rows
+        self.rows = np.empty((block_rows, len(self.columns)))
+        self.count = 0
+
+        # first time, offset, and row count of every block written
+        self.index = []
+
+        self.file = open(filepath, 'wb')
+        header = json.dumps({'columns': self.columns, 'scales': self.scales.tolist()}).encode()
+        self.file.write(MAGIC + struct.pack('<HI', VERSION, len(header)) + header)
+
+        self.blocks = queue.Queue() if background else None
+        self.thread = None
+        if background:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def append(self, row):
+        """Add a row, handing the block off to be written once it's full."""
+        self.rows[self.count] = row
+        self.count += 1
+        if self.count == self.block_rows:
+            self.submit()
+
+    def submit(self):
+        block = self.rows[:self.count].copy()
+        self.count = 0
+        if self.blocks is None:
+            self.write_block(block)
+        else:
+            self.blocks.put(block)
+
+    def write_block(self, block):
+        """Encode a block and write it with its header, recording it in the index."""
+        payload = encode_block(block, self.scales)
+        self.index.append((block[0, 0], self.file.tell(), len(block)))
+        self.file.write(BLOCK.pack(len(block), len(payload), zlib.crc32(payload)) + payload)
+
+    def run(self):
+        """Write handed off blocks until closed."""
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                return
+            self.write_block(block)
+
+    def close(self):
+        """Write the last partial block and the index, and close the file."""
+        if self.count:
+            self.submit()
+        if self.thread is not None:
+            self.blocks.put(None)
+            self.thread.join()
+            self.thread = None
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(ENTRY.pack(*entry))
+        self.file.write(FOOTER.pack(index_offset, len(self.index), INDEX_MAGIC))
+        self.file.close()
+
+
+class BlockLog:
+    def __init__(self, filepath):
+        # memory-map the file, read the header and the block index, rebuilding the index by walking the blocks if
+        # the capture never got to write it
+        self.filepath = filepath
+        with open(filepath, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:4] != MAGIC:
+            raise ValueError('%s is not a block compressed flight log' % filepath)
+        _, header_size = struct.unpack_from('<HI', self.data, 4)
+        header = json.loads(self.data[10:10 + header_size].decode())
+        self.columns = header['columns']
+        self.scales = np.asarray(header['scales'])
+        self.start = 10 + header_size
+
+        index = self.read_index()
+        if index is None:
+            index = self.scan()
+        self.times = np.array([entry[0] for entry in index])
+        self.offsets = np.array([entry[1] for entry in index], dtype=np.int64)
+        self.counts = np.array([entry[2] for entry in index], dtype=np.int64)
+
+    def read_index(self):
+        """Index entries from the footer, or None if there's no complete index."""
+        if len(self.data) < self.start + FOOTER.size:
+            return None
+        index_offset, count, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+        if magic != INDEX_MAGIC or index_offset + count * ENTRY.size + FOOTER.size != len(self.data):
+            return None
+        return [ENTRY.unpack_from(self.data, index_offset + i * ENTRY.size) for i in range(count)]
+
+    def scan(self):
+        """Index entries found by walking the blocks, up to the first one that's cut short or corrupt."""
+        index = []
+        offset = self.start
+        while offset + BLOCK.size <= len(self.data):
+            count, size, checksum = BLOCK.unpack_from(self.data, offset)
+            payload = self.data[offset + BLOCK.size:offset + BLOCK.size + size]
+            if len(payload) != size or zlib.crc32(payload) != checksum:
+                break
+            index.append((decode_block(payload, count, self.scales)[0, 0], offset, count))
+            offset += BLOCK.size + size
+        return index
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def block(self, number):
+        """Rows of one block, checked against its checksum."""
+        count, size, checksum = BLOCK.unpack_from(self.data, self.offsets[number])
+        begin = self.offsets[number] + BLOCK.size
+        payload = self.data[begin:begin + size]
+        if zlib.crc32(payload) != checksum:
+            raise ValueError('Block %d of %s is corrupt' % (number, self.filepath))
+        return decode_block(payload, count, self.scales)
+
+    def read(self, start=None, stop=None):
+        """Rows from start to stop, in seconds since the first sample, decoding only the blocks that hold them."""
+        if len(self.times) == 0:
+            return np.zeros((0, len(self.columns)))
+        first = self.times[0]
+        low = 0 if start is None else max(np.searchsorted(self.times, first + start, side='right') - 1, 0)
+        high = len(self.times) if stop is None else np.searchsorted(self.times, first + stop, side='right')
+        rows = np.concatenate([self.block(number) for number in range(low, high)] or
+                              [np.zeros((0, len(self.columns)))])
+        keep = np.ones(len(rows), dtype=bool)
+        if start is not None:
+            keep &= rows[:, 0] >= first + start
+        if stop is not None:
+            keep &= rows[:, 0] <= first + stop
+        return rows[keep]
+
+    def to_csv(self, csv_filepath):
+        """Write the log out as a flight data CSV, block by block."""
+        with open(csv_filepath, 'w') as file:
+            file.write(','.join(self.columns) + '\n')
+            decimals = [max(int(round(-np.log10(scale))), 0) for scale in self.scales[1:]]
+            for number in range(len(self.offsets)):
+                for row in self.block(number):
+                    file.write(','.join([str(datetime.fromtimestamp(row[0]))] +
+                                        ['%.*f' % (places, value) for places, value in zip(decimals, row[1:])]) + '\n')
+
+
+def simulate(duration, rate, seed=0):
+    """Rows of a payload sitting still, at the resolution of the sensors' registers."""
+    rng = np.random.default_rng(seed)
+    count = int(duration * rate)
+    times = 1.7e9 + np.arange(count) / rate
+    gyroscope = np.round(rng.normal(0.0, 0.1, (count, 3)) / 0.035) * 0.035
+    accelerometer = np.round((np.array([0.0, 0.0, 9.80665]) + rng.normal(0.0, 0.02, (count, 3))) / 0.0012) * 0.0012
+    magnetometer = np.round(np.array([2000.0, 0.0, -4000.0]) + rng.normal(0.0, 5.0, (count, 3)))
+    pressure = np.round(1013.25 + np.cumsum(rng.normal(0.0, 0.001, count)), 1)
+    altitude = np.round((1.0 - (pressure / 1013.25) ** 0.190284) * 44307.7, 2)
+    temperature = np.full(count, 21.0)
+    return np.column_stack([times, gyroscope, accelerometer, magnetometer, pressure, altitude, temperature])
+
+
+def benchmark(rows, block_rows, dirpath):
+    """Write the rows as a CSV and as a block compressed log, and compare their size and encode and decode speed."""
+    from .analysis import chunks
+
+    csv_filepath = os.path.join(dirpath, 'benchmark.csv')
+    block_filepath = os.path.join(dirpath, 'benchmark.bx4l')
+
+    start = time.perf_counter()
+    with open(csv_filepath, 'w') as file:
+        file.write(','.join(COLUMNS) + '\n')
+        for row in rows.tolist():
+            file.write(csv_line(datetime.fromtimestamp(row[0]), row[1:4], row[4:7], row[7:10], row[10], row[11],
+                                row[12]))
+    csv_encode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    blocks = BlockWriter(block_filepath, block_rows=block_rows)
+    for row in rows:
+        blocks.append(row)
+    blocks.close()
+    block_encode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in chunks(csv_filepath):
+        pass
+    csv_decode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    log = BlockLog(block_filepath)
+    decoded = log.read()
+    block_decode = time.perf_counter() - start
+
+    # time to read one second from the middle of the flight
+    start = time.perf_counter()
+    middle = (rows[-1, 0] - rows[0, 0]) / 2
+    log.read(middle, middle + 1.0)
+    random_access = time.perf_counter() - start
+
+    return {
+        'rows': len(rows),
+        'csv_bytes': os.path.getsize(csv_filepath),
+        'block_bytes': os.path.getsize(block_filepath),
+        'csv_encode': len(rows) / csv_encode,
+        'block_encode': len(rows) / block_encode,
+        'csv_decode': len(rows) / csv_decode,
+        'block_decode': len(rows) / block_decode,
+        'random_access': random_access,
+        'max_error': float(np.max(np.abs(decoded - rows) / SCALES))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the block compressed flight log against the CSV.')
+    parser.add_argument(
+        '--csv',
+        type=str,
+        help='Flight data CSV to compress instead of simulated samples')
+    parser.add_argument(
+        '--duration',
+        default=600.0,
+        type=float,
+        help='Seconds of simulated samples')
+    parser.add_argument(
+        '--rate',
+        default=200.0,
+        type=float,
+        help='Sample rate of the simulated samples in Hz')
+    parser.add_argument(
+        '--block-rows',
+        default=1024,
+        type=int,
+        help='Rows per block')
+    parser.add_argument(
+        '--to-csv',
+        type=str,
+        help='Convert a block compressed flight log to a CSV next to it instead')
+    args = parser.parse_args()
+
+    if args.to_csv:
+        csv_filepath = os.path.splitext(args.to_csv)[0] + '.csv'
+        BlockLog(args.to_csv).to_csv(csv_filepath)
+        print('Wrote %s' % csv_filepath)
+        return
+
+    if args.csv:
+        from .analysis import chunks
+        rows = np.concatenate([np.column_stack([chunk[name] for name in chunk.dtype.names])
+                               for chunk in chunks(args.csv)])
+    else:
+        rows = simulate(args.duration, args.rate)
+
+    import tempfile
+    with tempfile.TemporaryDirectory() as dirpath:
+        stats = benchmark(rows, args.block_rows, dirpath)
+    print('%(rows)d rows, CSV %(csv_bytes)d bytes, blocks %(block_bytes)d bytes, %(ratio).1fx smaller' %
+          dict(stats, ratio=stats['csv_bytes'] / float(stats['block_bytes'])))
+    print('encode: CSV %(csv_encode).0f rows/s, blocks %(block_encode).0f rows/s' % stats)
+    print('decode: CSV %(csv_decode).0f rows/s, blocks %(block_decode).0f rows/s, 1s of flight in %(random_access).4fs'
+          % stats)
+    print('largest error %(max_error).2f of the stored resolution' % stats)
+
+
+if __name__ == '__main__':
+    main()
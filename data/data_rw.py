@@ -1,19 +1,88 @@
+import importlib
 import os
 import time
-import RPi.GPIO as GPIO  # Import Raspberry Pi GPIO library
-from datetime import datetime
+from datetime import datetime, timedelta
 
+import numpy as np
+
+from controller.scheduler import PeriodicScheduler
+from controls.attitude import AttitudeEstimator
+from .altitude import AltitudeEstimator
+from .calibration import CalibrationCache, calibrate
+from .codec import BlockWriter, csv_line
 from .constants import *
+from .launch import LaunchDetector, PreTriggerBuffer
 from .lsm6ds33 import LSM6DS33  # Accel & Gyro (+ temp)
 from .lis3mdl import LIS3MDL  # Magnetometer (+ temp)
 from .lps25h import LPS25H  # Barometric Pressure & Temperature
+from .profiles import PROFILES, PhaseDetector, Reconfigurer
 
 
 class DataRW:
-    def __init__(self):
+    def __init__(self, rate=100, calibration_filepath=os.path.abspath('./data/output/calibration.json'),
+                 calibration_window=2.0, armed_rate=50, launch_threshold=3.0 * 9.80665, launch_duration=0.1,
+                 pre_trigger=2.0, profiles=PROFILES, clock=time.perf_counter):
+        # sample the IMU at a fixed rate in Hz, or at each flight phase's rate with profiles, stamping the samples on
+        # the mission clock
+        self.scheduler = PeriodicScheduler(rate)
+        self.clock = clock
+
+        # per flight phase sample rate, sensor output data rates, and full-scale ranges, None to keep them fixed
+        self.profiles = profiles
+        self.reconfigurer = None
+        self.gyroscope = None
+        self.accelerometer = None
+
+        # while armed on the pad, sample at a low rate in Hz until the acceleration in m/s^2 stays above the threshold
+        # for the duration in seconds, keeping the last seconds before launch in memory
+        self.armed_rate = armed_rate
+        self.launch_threshold = launch_threshold
+        self.launch_duration = launch_duration
+        self.pre_trigger = pre_trigger
+
+        # calibration cache, and how many seconds of the board sitting still to calibrate on if nothing is cached
+        self.calibration_filepath = calibration_filepath
+        self.calibration_window = calibration_window
+        self.calibration = None
+
+        # a spare taking over in flight uses the calibration the failed process left in the cache, since measuring
+        # one needs the board sitting still
+        self.spare = False
+
+        # sensors are brought up by the prepare phase in the process that reads them
+        self.imu = None
+        self.magnetometer = None
+        self.barometer_thermometer = None
+
+        # the barometer updates at 12.5 Hz, so its readings are kept between its new samples
+        self.pressure = None
+        self.barometric_altitude = None
+        self.temperature = None
+
+        # the barometric altitude fused with the accelerometer along the vertical of the attitude estimate, which is
+        # leveled on the first sample unless carried over from before a restart, the flight phase, and the number of
+        # samples read, every one is shared but only some are logged under pressure
+        self.altitude = AltitudeEstimator()
+        self.attitude = AttitudeEstimator()
+        self.leveled = False
+        self.detector = PhaseDetector()
+        self.sample_number = 0
+
+    def prepare_spare(self):
+        """Get a spare ready to take over, importing the GPIO library without touching the sensors in use."""
+        importlib.import_module('RPi.GPIO')
+        self.spare = True
+
+    def prepare(self):
+        """Bring up the IMU chips and take a first reading before the mission starts."""
+        import RPi.GPIO as GPIO  # Import Raspberry Pi GPIO library, only in the process that reads the IMU
+
         GPIO.setwarnings(False)  # Ignore warning for now
         GPIO.setmode(GPIO.BOARD)  # Use physical pin numbering
+        self.enable()
 
+    def enable(self):
+        """Bring up the IMU chips on the I2C bus, program them for the pad, and calibrate them."""
         self.imu = LSM6DS33()  # Accelerometer and Gyroscope
         self.imu.enable()
 
@@ -23,49 +92,227 @@ class DataRW:
         self.barometer_thermometer = LPS25H()  # Barometric and Temperature
         self.barometer_thermometer.enable()
 
-    def rw(self, mission_start, time_total, data_dirpath, run):
-        """Capture flight data with the IMU and write it to a file"""
+        # the first samples after enabling are discarded
+        self.imu.getIMURaw()
+        self.magnetometer.getMagnetometerRaw()
+        self.barometer_thermometer.getAllRaw()
+
+        # program the sensors for the pad, waiting out the re-scale here before the mission
+        if self.profiles is not None:
+            self.reconfigurer = Reconfigurer(self.imu, self.magnetometer, self.barometer_thermometer, self.profiles)
+            self.reconfigurer.apply('pad')
+            self.scheduler.set_rate(self.profiles['pad']['imu_rate'])
+
+        # calibrate on the pad, or load the calibration cached for this board at this temperature
+        self.calibration = calibrate(self.imu, self.magnetometer, CalibrationCache(self.calibration_filepath),
+                                     self.calibration_window, self.scheduler.rate, measure=not self.spare)
+
+    def read(self):
+        """Read and calibrate the gyroscope, accelerometer, and magnetometer, stamped halfway through the reads.
+
+        While the accelerometer and gyroscope re-scale for a new flight phase, their last good readings are held.
+        """
+        settling = self.reconfigurer is not None and self.reconfigurer.settling.is_set()
+        read_start = self.clock()
+        gyroscope = self.imu.getGyroscopeDPS()
+        accelerometer = self.imu.getAccelerometerMPS2()
+        magnetometer = self.magnetometer.getMagnetometerRaw()
+        sample_time = (read_start + self.clock()) / 2
+        if self.reconfigurer is not None:
+            if (settling or self.reconfigurer.settling.is_set()) and self.gyroscope is not None:
+                gyroscope, accelerometer = self.gyroscope, self.accelerometer
+            else:
+                self.gyroscope, self.accelerometer = gyroscope, accelerometer
+
+        # remove the gyroscope bias, accelerometer offset, and hard- and soft-iron distortion in one step
+        readings = self.calibration.apply(gyroscope + accelerometer + magnetometer).tolist()
+        return sample_time, readings[0:3], readings[3:6], readings[6:9]
+
+    def read_barometer(self):
+        """Read the pressure, and the altitude from that same reading, and the temperature only when they're new.
+
+        Returns whether there's a new pressure.
+        """
+        pressure_ready, temperature_ready = self.barometer_thermometer.getDataAvailable()
+        if pressure_ready or self.pressure is None:
+            self.pressure = self.barometer_thermometer.getBarometerMillibars(rounded=False)
+            self.barometric_altitude = self.barometer_thermometer.getAltitude(rounded=False, cached=True)
+        if temperature_ready or self.temperature is None:
+            self.temperature = self.barometer_thermometer.getTemperatureCelsius()
+        return pressure_ready
+
+    def write(self, log, now, gyroscope, accelerometer, magnetometer, pressure, altitude, temperature):
+        """Write a sample to the flight data file, as a line of text or a row of the block compressed log."""
+        if isinstance(log, BlockWriter):
+            log.append([now.timestamp()] + gyroscope + accelerometer + magnetometer + [pressure, altitude, temperature])
+        else:
+            log.write(csv_line(now, gyroscope, accelerometer, magnetometer, pressure, altitude, temperature))
+
+    def arm(self, run, heartbeat=None):
+        """Sample at a low rate on the pad until launch is detected.
+
+        Returns the launch time on the mission clock and the samples of the last seconds before launch was
+        confirmed, oldest first, as rows of time, the 9 IMU axes, pressure, altitude, and temperature.
+        """
+        # bring up the sensors if they weren't prepared yet
+        if self.imu is None:
+            self.prepare()
+
+        scheduler = PeriodicScheduler(self.armed_rate)
+        detector = LaunchDetector(self.launch_threshold, self.launch_duration)
+        buffer = PreTriggerBuffer(self.pre_trigger, self.armed_rate, 13)
+        if run == 'practice':
+            print('data: armed, waiting for launch')
+
+        while True:
+            scheduler.wait()
+            if heartbeat is not None:
+                heartbeat.beat()
+
+            sample_time, gyroscope, accelerometer, magnetometer = self.read()
+            self.read_barometer()
+            buffer.append([sample_time] + gyroscope + accelerometer + magnetometer +
+                          [self.pressure, self.barometric_altitude, self.temperature])
+
+            launch_time = detector.update(sample_time, accelerometer)
+            if launch_time is not None:
+                if run == 'practice':
+                    print('data: launch detected, %.3fs after it started' % (sample_time - launch_time))
+                return launch_time, buffer.flush()
+
+    def fuse(self, sample_time, gyroscope, accelerometer, magnetometer):
+        """Track the attitude with a sample, and propagate the altitude with its acceleration along the vertical."""
+        if not self.leveled:
+            self.attitude.level(accelerometer)
+            self.leveled = True
+        self.attitude.update(np.array([[sample_time] + gyroscope + accelerometer + magnetometer]))
+        self.altitude.predict(sample_time, accelerometer, self.attitude.up())
+
+    def restore(self, state):
+        """Carry on from the altitude, ground, and attitude shared before a restart in flight."""
+        self.altitude.restore(state)
+        self.attitude.integrate(*state['quaternion'])
+        self.leveled = True
+
+    def sample(self, log, mission_start, run, imu_buffer=None, throttle=None, altitude_state=None, phase_state=None,
+               stages=None):
+        """Read a sample, share it, fuse the altitude and follow the flight phase with it, and log it.
+
+        Returns the time the sample was read.
+        """
+        # read the IMU, stamping the sample halfway through the reads on the mission clock
+        start = self.clock()
+        sample_time, gyroscope, accelerometer, magnetometer = self.read()
+        read = self.clock()
+        if stages is not None:
+            stages.record('read', read - start)
+
+        # share the sample with the other subsystems
+        if imu_buffer is not None:
+            imu_buffer.append([sample_time] + gyroscope + accelerometer + magnetometer)
+
+        # read the barometer only when it has a new sample
+        self.fuse(sample_time, gyroscope, accelerometer, magnetometer)
+        if self.read_barometer() or not self.altitude.initialized:
+            self.altitude.correct(self.barometric_altitude)
+
+        # share the fused altitude, vertical velocity, and apogee
+        if altitude_state is not None:
+            altitude_state.publish(sample_time, self.altitude, self.attitude.quaternion())
+
+        # switch to the next flight phase's profile when a transition is detected
+        phase = self.detector.phase
+        if self.profiles is not None and self.detector.update(sample_time, accelerometer, self.altitude) != phase:
+            self.reconfigurer.request(self.detector.phase)
+            self.scheduler.set_rate(self.profiles[self.detector.phase]['imu_rate'])
+            if phase_state is not None:
+                phase_state.set(self.detector.phase)
+            if run == 'practice':
+                print('data: %s phase at %.2fs' % (self.detector.phase, sample_time - mission_start))
+
+        # skip logging this sample if the governor lowered the log rate
+        fused = self.clock()
+        if stages is not None:
+            stages.record('fuse', fused - read)
+        self.sample_number += 1
+        if throttle is not None and self.sample_number % throttle.setting('log_decimation'):
+            return sample_time
+
+        # write imu data to file
+        now = datetime.now()
+        self.write(log, now, gyroscope, accelerometer, magnetometer, self.pressure, self.barometric_altitude,
+                   self.temperature)
+        if stages is not None:
+            stages.record('write', self.clock() - fused)
+        return sample_time
+
+    def rw(self, mission_start, time_total, data_dirpath, run, heartbeat=None, imu_buffer=None, throttle=None,
+           altitude_state=None, pre_trigger=None, phase_state=None, log_format='csv', stages=None):
+        """Capture flight data with the IMU and write it to a file, starting with any samples from before launch"""
+        if log_format not in ('csv', 'blocks'):
+            raise ValueError('Unknown flight data format: %s, choose from csv or blocks' % log_format)
+
+        # bring up the sensors if they weren't prepared before the mission clock started
+        if self.imu is None:
+            self.prepare()
 
         # setup for data capture
         date = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        file = open(os.path.join(data_dirpath, date + '.csv'), 'w')
         header = 'Time,X-Gyro,Y-Gyro,Z-Gyro,X-Accel,Y-Accel,Z-Accel,X-Mag,Y-Mag,Z-Mag,Pressure,Altitude,Temperature\n'
-        file.write(header)
 
-        # print header to terminal if practice run
-        if run == 'practice':
-            print(header[:-1])
+        # write the flight data as CSV text, or as a block compressed log encoded in the background
+        if log_format == 'blocks':
+            log = BlockWriter(os.path.join(data_dirpath, date + '.bx4l'))
+        else:
+            log = open(os.path.join(data_dirpath, date + '.csv'), 'w')
+            log.write(header)
+
+        # a restart carries on from the shared estimate, since the payload may be moving by then
+        if altitude_state is not None:
+            state = altitude_state.read()
+            if state['time']:
+                self.restore(state)
+
+        # write and share the samples from before launch first, so none of the boost is lost
+        if pre_trigger is not None:
+            offset = self.clock()
+            now = datetime.now()
+            pressure = None
+            for row in pre_trigger.tolist():
+                if imu_buffer is not None:
+                    imu_buffer.append(row[0:10])
+                self.fuse(row[0], row[1:4], row[4:7], row[7:10])
+                if row[10] != pressure:
+                    pressure = row[10]
+                    self.altitude.correct(row[11])
+                self.write(log, now - timedelta(seconds=offset - row[0]), row[1:4], row[4:7], row[7:10], row[10],
+                           row[11], row[12])
 
         # run until mission duration complete
         while True:
+            # wait for the next sample period
+            tick = self.scheduler.wait()
+
             # check if mission duration complete
-            if time.perf_counter() - mission_start > time_total:
+            if tick - mission_start > time_total:
                 break
 
-            # make new strings to edit
-            gyroscope_data = str(self.imu.getGyroscopeDPS())
-            accelerometer_data = str(self.imu.getAccelerometerMPS2())
-            magnetometer_data = str(self.magnetometer.getMagnetometerRaw())
-
-            # chop brackets off the end of strings
-            gyroscope_data = gyroscope_data[1:len(gyroscope_data) - 1]
-            accelerometer_data = accelerometer_data[1:len(accelerometer_data) - 1]
-            magnetometer_data = magnetometer_data[1:len(magnetometer_data) - 1]
-
-            # get rid of whitespace
-            gyroscope_data = gyroscope_data.replace(' ', '')
-            accelerometer_data = accelerometer_data.replace(' ', '')
-            magnetometer_data = magnetometer_data.replace(' ', '')
-            pressure_data = str(self.barometer_thermometer.getBarometerMillibars())
-            altitude_data = str(self.barometer_thermometer.getAltitude())
-            temperature_data = str(self.barometer_thermometer.getTemperatureCelsius())
-
-            # write imu data to file
-            now = str(datetime.now())
-            imu_data = ','.join([now, gyroscope_data, accelerometer_data, magnetometer_data, pressure_data,
-                                 altitude_data, temperature_data + '\n'])
-            file.write(imu_data)
-
-            # print imu data to terminal if practice run
-            if run == 'practice':
-                print(imu_data[:-1])
+            # let the mission controller know data capture is alive
+            if heartbeat is not None:
+                heartbeat.beat()
+
+            # read, share, and log a sample
+            self.sample(log, mission_start, run, imu_buffer, throttle, altitude_state, phase_state, stages)
+
+        # close the flight data file and report the sampling loop's timing if practice run
+        log.close()
+        if self.reconfigurer is not None:
+            self.reconfigurer.close()
+        if run == 'practice':
+            print(self.scheduler.report('data'))
+            if self.reconfigurer is not None and self.reconfigurer.durations:
+                print('data: %d reconfigurations, %.4fs max, off the sampling loop' %
+                      (len(self.reconfigurer.durations), max(self.reconfigurer.durations)))
+            if self.altitude.apogee is not None:
+                print('data: apogee %.1fm above ground at %.2fs' % (self.altitude.apogee[1] - self.altitude.ground,
+                                                                     self.altitude.apogee[0] - mission_start))
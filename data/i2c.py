@@ -10,22 +10,29 @@
 #
 ########################################################################
 
-# Imports
-from smbus import SMBus
-
-
 # Code
 class I2C(object):
     """ Class to set up and access I2C devices.
     """
 
+    # Callable returning the bus object for a bus id. None uses
+    # smbus.SMBus, anything else (e.g. a simulated bus) must offer the
+    # same read/write methods.
+    busFactory = None
+
     ##
     ## Class methods
     ##
 
     ## Private methods
     def __init__(self, busId = 1):
-        """ Initialize the I2C bus. """
+        """ Initialize the I2C bus. The SMBus backend is imported on
+            first use so importing the sensor modules stays cheap.
+        """
+        if I2C.busFactory is not None:
+            self._i2c = I2C.busFactory(busId)
+            return
+        from smbus import SMBus
         self._i2c = SMBus(busId)
 
 
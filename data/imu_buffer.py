@@ -0,0 +1,45 @@
+import multiprocessing
+
+import numpy as np
+
+
+class ImuBuffer:
+    # columns of each sample, time is time.perf_counter() so it shares the mission clock across processes
+    COLUMNS = ['Time', 'X-Gyro', 'Y-Gyro', 'Z-Gyro', 'X-Accel', 'Y-Accel', 'Z-Accel', 'X-Mag', 'Y-Mag', 'Z-Mag']
+
+    def __init__(self, capacity=4096):
+        # ring buffer of the most recent samples in shared memory, written by data capture and read by the others
+        self.capacity = capacity
+        self.width = len(self.COLUMNS)
+        self.samples = multiprocessing.RawArray('d', capacity * self.width)
+        self.count = multiprocessing.RawValue('q', 0)
+        self.lock = multiprocessing.Lock()
+
+    def view(self):
+        """NumPy view of the shared samples, one row per sample."""
+        return np.frombuffer(self.samples, dtype=np.float64).reshape(self.capacity, self.width)
+
+    def append(self, row):
+        """Add a sample to the buffer, overwriting the oldest one when full."""
+        samples = self.view()
+        with self.lock:
+            samples[self.count.value % self.capacity] = row
+            self.count.value += 1
+
+    def read(self, start=0):
+        """Copy the samples numbered from start onward, oldest first, along with the number of the next sample.
+
+        Samples that were already overwritten are skipped.
+        """
+        samples = self.view()
+        with self.lock:
+            end = self.count.value
+            start = max(start, end - self.capacity, 0)
+            indices = np.arange(start, end) % self.capacity
+            return samples[indices], end
+
+    def latest(self, n=None):
+        """Copy the most recent n samples, oldest first, or every buffered sample if n is None."""
+        n = self.capacity if n is None else n
+        rows, _ = self.read(self.count.value - n)
+        return rows
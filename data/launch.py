@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class LaunchDetector:
+    def __init__(self, threshold=3.0 * 9.80665, duration=0.1):
+        # launch is the acceleration magnitude in m/s^2 staying above the threshold for the duration in seconds
+        self.threshold = threshold
+        self.duration = duration
+        self.above_since = None
+        self.launch_time = None
+
+    def update(self, time, accelerometer):
+        """Check a sample, returning the time the acceleration first crossed the threshold once launch is confirmed."""
+        if self.launch_time is not None:
+            return self.launch_time
+        if np.dot(accelerometer, accelerometer) < self.threshold * self.threshold:
+            self.above_since = None
+            return None
+        if self.above_since is None:
+            self.above_since = time
+        if time - self.above_since >= self.duration:
+            self.launch_time = self.above_since
+        return self.launch_time
+
+
+class PreTriggerBuffer:
+    def __init__(self, seconds, rate, width):
+        # the most recent seconds of rows sampled at the rate in Hz, kept in memory until launch
+        self.rows = np.zeros((max(int(round(seconds * rate)), 1), width))
+        self.count = 0
+
+    def append(self, row):
+        """Add a row, overwriting the oldest one when full."""
+        self.rows[self.count % len(self.rows)] = row
+        self.count += 1
+
+    def flush(self):
+        """Every buffered row, oldest first, and empty the buffer."""
+        start = max(self.count - len(self.rows), 0)
+        rows = self.rows[np.arange(start, self.count) % len(self.rows)]
+        self.count = 0
+        return rows
@@ -87,6 +87,19 @@ class LIS3MDL(I2C):
         LIS_TEMP_OUT_H, # high byte of temperature value
     ]
 
+    # Output data rate settings (DO bits of CTRL_REG1), in Hz
+    DO_MASK         = 0xE3   # Mask for removing output data rate bits
+    DO_SETTINGS     = {
+        0.625:  0x00,
+        1.25:   0x04,
+        2.5:    0x08,
+        5:      0x0C,
+        10:     0x10,
+        20:     0x14,
+        40:     0x18,
+        80:     0x1C,
+    }
+
 
     ##
     ## Class methods
@@ -167,6 +180,21 @@ class LIS3MDL(I2C):
         self._writeRegister(self.I2C_ADDR, self.LIS_CTRL_REG1, ctrl_reg1)
 
 
+    def setMagnetometerDataRate(self, rate):
+        """ Set the magnetometer output data rate in Hz, one of
+            DO_SETTINGS.
+        """
+        if not self.magEnabled:
+            raise(Exception('Magnetometer has to be enabled first'))
+        if rate not in self.DO_SETTINGS:
+            raise(Exception('Output data rate set to invalid value: ' +
+                             str(rate)))
+        curr_reg = self._readRegister(self.I2C_ADDR, self.LIS_CTRL_REG1)
+        curr_reg = curr_reg & self.DO_MASK          # Mask off DO bits
+        curr_reg = curr_reg | self.DO_SETTINGS[rate] # Set new DO bits
+        self._writeRegister(self.I2C_ADDR, self.LIS_CTRL_REG1, curr_reg)
+
+
     def getMagnetometerRaw(self):
         """ Return a 3-dimensional vector (list) of raw magnetometer
             data.
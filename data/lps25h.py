@@ -97,6 +97,15 @@ class LPS25H(I2C):
         LPS_TEMP_OUT_H, # high byte of temperature value
     ]
 
+    # Output data rate settings (ODR bits of CTRL_REG1), in Hz
+    ODR_MASK            = 0x8F  # Mask for removing output data rate bits
+    ODR_SETTINGS        = {
+        1:      0x10,
+        7:      0x20,
+        12.5:   0x30,
+        25:     0x40,
+    }
+
 
     ##
     ## Class methods
@@ -109,6 +118,9 @@ class LPS25H(I2C):
         super(LPS25H, self).__init__(busId)
         self.pressEnabled = False
 
+        # Last raw pressure read, so altitude doesn't need another read
+        self.pressRaw = None
+
 
     def __del__(self):
         """ Clean up routines. """
@@ -137,14 +149,41 @@ class LPS25H(I2C):
         self.pressEnabled = True
 
 
+    def setDataRate(self, rate):
+        """ Set the output data rate of both sensors in Hz, one of
+            ODR_SETTINGS.
+        """
+        if not self.pressEnabled:
+            raise(Exception('Barometer has to be enabled first'))
+        if rate not in self.ODR_SETTINGS:
+            raise(Exception('Output data rate set to invalid value: ' +
+                             str(rate)))
+        curr_reg = self._readRegister(LPS25H_ADDR, self.LPS_CTRL_REG1)
+        curr_reg = curr_reg & self.ODR_MASK           # Mask off ODR bits
+        curr_reg = curr_reg | self.ODR_SETTINGS[rate] # Set new ODR bits
+        self._writeRegister(LPS25H_ADDR, self.LPS_CTRL_REG1, curr_reg)
+
+
     def getBarometerRaw(self):
         """ Return the raw pressure sensor data. """
         # Check if barometer has been enabled
         if not self.pressEnabled:
             raise(Exception('Barometer has to be enabled first'))
 
-        # Return sensor data as signed 24 bit value
-        return self._getSensorRawXLoLoHi1(LPS25H_ADDR, self.pressRegisters)
+        # Return sensor data as signed 24 bit value, keeping it for
+        # getAltitude
+        self.pressRaw = self._getSensorRawXLoLoHi1(LPS25H_ADDR,
+                                                   self.pressRegisters)
+        return self.pressRaw
+
+
+    def getDataAvailable(self):
+        """ Return whether new pressure and new temperature data are
+            available, as a list of two booleans. The flags clear when
+            the data is read.
+        """
+        status = self._readRegister(LPS25H_ADDR, self.LPS_STATUS_REG)
+        return [bool(status & 0x02), bool(status & 0x01)]
 
 
     def getTemperatureRaw(self):
@@ -197,15 +236,22 @@ class LPS25H(I2C):
             fahrenheit = round( fahrenheit, 1 )
         return fahrenheit
 
-    def getAltitude(self, altimeterMbar = 1013.25, rounded = True):
+    def getAltitude(self, altimeterMbar = 1013.25, rounded = True,
+                    cached = False):
         """ Return the altitude in meters above the standard pressure
             level of 1013.25 hPa, calculated using the 1976 US Standard
             Atmosphere model.
             altimeterMbar can be adjusted to the actual pressure
             "adjusted to sea level" (QNH) to compensate for regional
             and/or weather-based variations.
+            With cached, the last pressure read is used instead of
+            reading the sensor again.
         """
-        altitude = (1 - pow(self.getBarometerMillibars(rounded = False) / altimeterMbar, 0.190263)) * 44330.8
+        if cached and self.pressRaw is not None:
+            millibars = self.pressRaw / 4096.0
+        else:
+            millibars = self.getBarometerMillibars(rounded = False)
+        altitude = (1 - pow(millibars / altimeterMbar, 0.190263)) * 44330.8
         if rounded:
             return round(altitude, 2)
         return altitude
@@ -181,6 +181,20 @@ class LSM6DS33(I2C):
     GYRO_SCALE_FACTOR_1000dps   = 35.000
     GYRO_SCALE_FACTOR_2000dps   = 70.000
 
+    # Output data rate settings for accelerometer and gyroscope, in Hz
+    ODR_MASK                = 0x0F  # Mask for removing output data rate bits
+    ODR_SETTINGS            = {
+        0:      0x00,   # Power down
+        12.5:   0x10,
+        26:     0x20,
+        52:     0x30,
+        104:    0x40,
+        208:    0x50,
+        416:    0x60,
+        833:    0x70,
+        1660:   0x80,
+    }
+
 
     ##
     ## Class methods
@@ -318,6 +332,34 @@ class LSM6DS33(I2C):
         mps2Values = list(map(lambda x: x * self.G2MPS2, gValues))
         return mps2Values
 
+    # Output data rate setting interfaces
+    #
+    def setAccelerometerDataRate(self, rate):
+        """ Set the accelerometer output data rate in Hz, one of
+            ODR_SETTINGS. Takes effect without re-scaling.
+        """
+        if not self.accEnabled:      # Check if accelerometer has been enabled
+            raise(Exception('Accelerometer has to be enabled first'))
+        self._setDataRate(self.LSM_CTRL1_XL, rate)
+
+    def setGyroscopeDataRate(self, rate):
+        """ Set the gyroscope output data rate in Hz, one of
+            ODR_SETTINGS. Takes effect without re-scaling.
+        """
+        if not self.gyroEnabled:      # Check if gyroscope has been enabled
+            raise(Exception('Gyroscope has to be enabled first'))
+        self._setDataRate(self.LSM_CTRL2_G, rate)
+
+    def _setDataRate(self, register, rate):
+        """ Set the output data rate bits of a control register """
+        if rate not in self.ODR_SETTINGS:
+            raise(Exception('Output data rate set to invalid value: ' +
+                             str(rate)))
+        curr_reg = self._readRegister(self.I2C_ADDR, register)
+        curr_reg = curr_reg & self.ODR_MASK           # Mask off ODR bits
+        curr_reg = curr_reg | self.ODR_SETTINGS[rate] # Set new ODR bits
+        self._writeRegister(self.I2C_ADDR, register, curr_reg)
+
     # Gyroscope full scale setting interfaces
     #
     def setGyroscopeFullScale125dps(self):
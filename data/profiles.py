@@ -0,0 +1,178 @@
+import multiprocessing
+import queue
+import threading
+import time
+
+import numpy as np
+
+GRAVITY = 9.80665
+
+# flight phases in the order they happen
+PHASES = ['pad', 'boost', 'coast', 'apogee', 'descent']
+
+# per phase, the flight data capture's sample rate in Hz, each sensor's output data rate in Hz and full-scale range,
+# and the computer vision's frame rate in Hz, putting the data density where the flight is eventful
+PROFILES = {
+    'pad': {
+        'imu_rate': 50, 'accel_odr': 104, 'accel_scale': 4, 'gyro_odr': 104, 'gyro_scale': 245,
+        'mag_odr': 10, 'baro_odr': 12.5, 'cv_framerate': 15
+    },
+    'boost': {
+        'imu_rate': 200, 'accel_odr': 833, 'accel_scale': 16, 'gyro_odr': 833, 'gyro_scale': 2000,
+        'mag_odr': 80, 'baro_odr': 25, 'cv_framerate': 30
+    },
+    'coast': {
+        'imu_rate': 100, 'accel_odr': 416, 'accel_scale': 8, 'gyro_odr': 416, 'gyro_scale': 1000,
+        'mag_odr': 40, 'baro_odr': 25, 'cv_framerate': 30
+    },
+    'apogee': {
+        'imu_rate': 200, 'accel_odr': 416, 'accel_scale': 4, 'gyro_odr': 416, 'gyro_scale': 500,
+        'mag_odr': 80, 'baro_odr': 25, 'cv_framerate': 30
+    },
+    'descent': {
+        'imu_rate': 50, 'accel_odr': 104, 'accel_scale': 4, 'gyro_odr': 104, 'gyro_scale': 500,
+        'mag_odr': 20, 'baro_odr': 12.5, 'cv_framerate': 10
+    }
+}
+
+
+class PhaseDetector:
+    def __init__(self, boost_threshold=2.0 * GRAVITY, burnout_threshold=1.0 * GRAVITY, hold=0.05,
+                 apogee_velocity=15.0, apogee_window=2.0):
+        # boost while the acceleration magnitude in m/s^2 is above the boost threshold, coast once the acceleration
+        # along the pad's up is below the burnout threshold, as drag pulls against the climb, each held for some seconds
+        self.boost_threshold = boost_threshold
+        self.burnout_threshold = burnout_threshold
+        self.hold = hold
+
+        # apogee from when the climb rate in m/s drops below the apogee velocity until some seconds after apogee
+        self.apogee_velocity = apogee_velocity
+        self.apogee_window = apogee_window
+
+        self.phase = PHASES[0]
+        self.since = None
+
+    def held(self, time, condition):
+        """Whether the condition has been true for the hold time."""
+        if not condition:
+            self.since = None
+            return False
+        if self.since is None:
+            self.since = time
+        return time - self.since >= self.hold
+
+    def update(self, time, accelerometer, altitude):
+        """The flight phase after a sample of the accelerometer and the altitude estimator's state."""
+        magnitude = np.linalg.norm(accelerometer)
+        phase = self.phase
+        if phase == 'pad':
+            if altitude.launched or self.held(time, magnitude > self.boost_threshold):
+                phase = 'boost'
+        elif phase == 'boost':
+            if self.held(time, np.dot(accelerometer, altitude.up) < self.burnout_threshold):
+                phase = 'coast'
+        elif phase == 'coast':
+            if altitude.state[1] < self.apogee_velocity:
+                phase = 'apogee'
+        elif phase == 'apogee':
+            if altitude.apogee is not None and time - altitude.apogee[0] > self.apogee_window:
+                phase = 'descent'
+        if phase != self.phase:
+            self.phase = phase
+            self.since = None
+        return phase
+
+
+class PhaseState:
+    def __init__(self):
+        # index of the current flight phase in shared memory, written by data capture and read by the others
+        self.index = multiprocessing.RawValue('i', 0)
+
+    def set(self, phase):
+        self.index.value = PHASES.index(phase)
+
+    def phase(self):
+        return PHASES[self.index.value]
+
+
+class Reconfigurer:
+    """Reprograms the sensors or the camera for a flight phase on a thread of its own, so the loop never waits on it."""
+
+    def __init__(self, imu=None, magnetometer=None, barometer_thermometer=None, profiles=PROFILES, camera=None,
+                 background=True):
+        self.imu = imu
+        self.magnetometer = magnetometer
+        self.barometer_thermometer = barometer_thermometer
+        self.profiles = profiles
+
+        # camera to re-pace, and the frame rate in Hz it was opened at, which is the most it's sped up to
+        self.camera = camera
+        self.framerate = float(camera.framerate) if camera is not None else None
+
+        # set while the accelerometer and gyroscope re-scale, when their readings are off
+        self.settling = threading.Event()
+
+        # full-scale ranges last programmed, and how long each reconfiguration took in seconds
+        self.accel_scale = None
+        self.gyro_scale = None
+        self.durations = []
+
+        # reconfigure on the thread, or right away where nothing else runs meanwhile, like the simulator
+        self.background = background
+        self.requests = queue.Queue()
+        self.thread = None
+
+    def apply(self, phase):
+        """Program the camera and sensors for the phase, waiting out a re-scale only if a full-scale range changes."""
+        start = time.perf_counter()
+        profile = self.profiles[phase]
+
+        # the camera's frame rate can't change while it's capturing, but the delta on top of it can
+        if self.camera is not None:
+            self.camera.framerate_delta = min(profile['cv_framerate'] - self.framerate, 0)
+
+        if self.imu is not None:
+            self.imu.setAccelerometerDataRate(profile['accel_odr'])
+            self.imu.setGyroscopeDataRate(profile['gyro_odr'])
+            self.magnetometer.setMagnetometerDataRate(profile['mag_odr'])
+            self.barometer_thermometer.setDataRate(profile['baro_odr'])
+
+            if profile['accel_scale'] != self.accel_scale or profile['gyro_scale'] != self.gyro_scale:
+                self.settling.set()
+                try:
+                    if profile['accel_scale'] != self.accel_scale:
+                        getattr(self.imu, 'setAccelerometerFullScale%dG' % profile['accel_scale'])()
+                        self.accel_scale = profile['accel_scale']
+                    if profile['gyro_scale'] != self.gyro_scale:
+                        getattr(self.imu, 'setGyroscopeFullScale%ddps' % profile['gyro_scale'])()
+                        self.gyro_scale = profile['gyro_scale']
+                finally:
+                    self.settling.clear()
+        self.durations.append(time.perf_counter() - start)
+
+    def run(self):
+        """Apply requested phases until closed, skipping to the latest if several are waiting."""
+        while True:
+            phase = self.requests.get()
+            while not self.requests.empty():
+                phase = self.requests.get()
+            if phase is None:
+                return
+            self.apply(phase)
+
+    def request(self, phase):
+        """Reprogram for the phase in the background."""
+        if not self.background:
+            self.apply(phase)
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.requests.put(phase)
+
+    def close(self):
+        """Finish any reconfiguration under way and stop the thread."""
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
@@ -12,10 +12,32 @@ def main():
         required=True,
         type=str,
         help='Choose to execute a mission or practice run')
+    parser.add_argument(
+        '--subsystems',
+        choices=['cv', 'controls', 'data'],
+        default=['cv', 'controls', 'data'],
+        nargs='+',
+        type=str,
+        help='Choose which subsystems to start')
+    parser.add_argument(
+        '--profile-startup',
+        action='store_true',
+        help='Report the import and init time of each subsystem')
+    parser.add_argument(
+        '--armed',
+        action='store_true',
+        help='Wait on the pad and start the mission when launch is detected')
+    parser.add_argument(
+        '--log-format',
+        choices=['csv', 'blocks'],
+        default='csv',
+        type=str,
+        help='Write the flight data as CSV text or a block compressed log')
     args = parser.parse_args()
 
     # execute mission
-    mc = mission_controller.MissionController()
+    mc = mission_controller.MissionController(subsystems=args.subsystems, profile_startup=args.profile_startup,
+                                              armed=args.armed, log_format=args.log_format)
     mc.execute_mission(args.run)
 
 
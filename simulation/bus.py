@@ -0,0 +1,91 @@
+import numpy as np
+
+from data.constants import LPS25H_ADDR
+from data.lis3mdl import LIS3MDL
+from data.lps25h import LPS25H
+from data.lsm6ds33 import LSM6DS33
+
+# raw value per unit for each full-scale setting, from the full-scale bits of the control registers
+GYRO_LSB_PER_DPS = {
+    LSM6DS33.GYRO_FS_125dps: 1000.0 / LSM6DS33.GYRO_SCALE_FACTOR_125dps,
+    LSM6DS33.GYRO_FS_245dps: 1000.0 / LSM6DS33.GYRO_SCALE_FACTOR_245dps,
+    LSM6DS33.GYRO_FS_500dps: 1000.0 / LSM6DS33.GYRO_SCALE_FACTOR_500dps,
+    LSM6DS33.GYRO_FS_1000dps: 1000.0 / LSM6DS33.GYRO_SCALE_FACTOR_1000dps,
+    LSM6DS33.GYRO_FS_2000dps: 1000.0 / LSM6DS33.GYRO_SCALE_FACTOR_2000dps
+}
+ACCEL_LSB_PER_G = {
+    LSM6DS33.FS_XL_2G: 1000.0 / LSM6DS33.ACC_SCALE_FACTOR_2g,
+    LSM6DS33.FS_XL_4G: 1000.0 / LSM6DS33.ACC_SCALE_FACTOR_4g,
+    LSM6DS33.FS_XL_8G: 1000.0 / LSM6DS33.ACC_SCALE_FACTOR_8g,
+    LSM6DS33.FS_XL_16G: 1000.0 / LSM6DS33.ACC_SCALE_FACTOR_16g
+}
+MAG_LSB_PER_GAUSS = 6842.0
+PRESSURE_LSB_PER_MBAR = 4096.0
+
+
+class SimulatedBus:
+    """Stands in for smbus.SMBus with a register map per chip of the AltIMU-10 v5."""
+
+    def __init__(self, bus_id=1):
+        self.bus_id = bus_id
+        self.registers = {
+            LSM6DS33.I2C_LSM6DS33_SA0_HIGH_ADDRESS: bytearray(256),
+            LIS3MDL.I2C_LIS3MDL_SA0_HIGH_ADDRESS: bytearray(256),
+            LPS25H_ADDR: bytearray(256)
+        }
+        self.registers[LSM6DS33.I2C_LSM6DS33_SA0_HIGH_ADDRESS][LSM6DS33.LSM_WHO_AM_I] = LSM6DS33.I2C_LSM6DS33_WHO_ID
+        self.registers[LIS3MDL.I2C_LIS3MDL_SA0_HIGH_ADDRESS][LIS3MDL.LIS_WHO_AM_I] = LIS3MDL.I2C_LIS3MDL_WHO_ID
+        self.registers[LPS25H_ADDR][LPS25H.LPS_WHO_AM_I] = 0xBD
+
+        # every transfer on the bus, to estimate the time the reads would take on the hardware
+        self.transfers = 0
+
+    def read_byte_data(self, address, register):
+        self.transfers += 1
+        return self.registers[address][register]
+
+    def write_byte_data(self, address, register, value):
+        self.transfers += 1
+        self.registers[address][register] = value & 0xFF
+
+    def read_i2c_block_data(self, address, register, count):
+        self.transfers += 1
+        return list(self.registers[address][register:register + count])
+
+    def read_byte(self, address):
+        self.transfers += 1
+        return 0
+
+    def write_byte(self, address, value):
+        self.transfers += 1
+
+    def write_signed(self, address, register, values, size=2):
+        """Store signed values little-endian in consecutive registers, saturated to the register width."""
+        limit = 1 << (8 * size - 1)
+        data = self.registers[address]
+        for i, value in enumerate(values):
+            value = int(min(max(round(value), -limit), limit - 1)) % (1 << (8 * size))
+            for byte in range(size):
+                data[register + i * size + byte] = (value >> (8 * byte)) & 0xFF
+
+    def set_imu(self, gyroscope, accelerometer, magnetometer, pressure, temperature):
+        """Load the output registers from physical values.
+
+        Takes the gyroscope in degrees per second, the accelerometer in m/s^2, the magnetometer in gauss, the
+        pressure in millibars, and the temperature in degrees Celsius, scaled by the full-scale ranges the drivers
+        last programmed.
+        """
+        imu = LSM6DS33.I2C_LSM6DS33_SA0_HIGH_ADDRESS
+        gyro_scale = GYRO_LSB_PER_DPS[self.registers[imu][LSM6DS33.LSM_CTRL2_G] & ~LSM6DS33.GYRO_FS_MASK & 0xFF]
+        accel_scale = ACCEL_LSB_PER_G[self.registers[imu][LSM6DS33.LSM_CTRL1_XL] & ~LSM6DS33.FS_XL_MASK & 0xFF]
+        self.write_signed(imu, LSM6DS33.LSM_OUTX_L_G, np.asarray(gyroscope) * gyro_scale)
+        self.write_signed(imu, LSM6DS33.LSM_OUTX_L_XL, np.asarray(accelerometer) / LSM6DS33.G2MPS2 * accel_scale)
+        self.write_signed(imu, LSM6DS33.LSM_OUT_TEMP_L, [(temperature - 25.0) * 16.0])
+
+        self.write_signed(LIS3MDL.I2C_LIS3MDL_SA0_HIGH_ADDRESS, LIS3MDL.LIS_OUT_X_L,
+                          np.asarray(magnetometer) * MAG_LSB_PER_GAUSS)
+        self.write_signed(LIS3MDL.I2C_LIS3MDL_SA0_HIGH_ADDRESS, LIS3MDL.LIS_TEMP_OUT_L, [(temperature - 25.0) * 8.0])
+
+        self.write_signed(LPS25H_ADDR, LPS25H.LPS_PRESS_OUT_XL, [pressure * PRESSURE_LSB_PER_MBAR], size=3)
+        self.write_signed(LPS25H_ADDR, LPS25H.LPS_TEMP_OUT_L, [(temperature - 42.5) * 480.0])
+        self.registers[LPS25H_ADDR][LPS25H.LPS_STATUS_REG] = 0x03
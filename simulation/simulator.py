@@ -0,0 +1,294 @@
+import argparse
+import io
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from controller.scheduler import PeriodicScheduler
+from controls.actuator_output import ActuatorOutput, SimulatedDriver
+from controls.controls_system import ControlsSystem
+from cv.cv_detect import CVDetect
+from data.altitude import AltitudeState
+from data.calibration import Calibration, CalibrationCache
+from data.data_rw import DataRW
+from data.i2c import I2C
+from data.imu_buffer import ImuBuffer
+from data.profiles import PROFILES, PhaseState
+from .bus import SimulatedBus
+from .world import GRAVITY, LaggedGimbal, Scenario, SimulatedInterpreter
+
+
+class VirtualClock:
+    """Clock that only moves when slept on, so a mission runs as fast as it can be computed."""
+
+    def __init__(self, start=0.0):
+        self.time = start
+
+    def now(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self.time += max(seconds, 0.0)
+
+
+class MissionSimulator:
+    def __init__(self, scenario, duration=20.0, imu_rate=100, controls_rate=100, framerate=30, camera_width=448,
+                 camera_height=448, field_of_view=(62.2, 48.8), predict=True, output_rate=None, profiles=PROFILES,
+                 threshold=0.25):
+        self.scenario = scenario
+        self.duration = duration
+
+        # rates of the flight data capture, the control loop, and the camera in Hz, the flight data capture following
+        # the flight phase profiles unless they're None
+        self.imu_rate = imu_rate
+        self.profiles = profiles
+        self.controls_rate = controls_rate
+        self.framerate = framerate
+
+        self.camera_width = camera_width
+        self.camera_height = camera_height
+        self.degrees_per_pixel = (field_of_view[0] / camera_width, field_of_view[1] / camera_height)
+        self.threshold = threshold
+        self.predict = predict
+
+        # rate in Hz the commands are flushed to the gimbal at through the actuator output, or straight to it if None
+        self.output_rate = output_rate
+
+    def view(self, t):
+        """The camera's pan and tilt in degrees and their rates in degrees per second, base sway plus gimbal."""
+        self.gimbal.advance(t)
+        (yaw, pitch), (yaw_rate, pitch_rate) = self.scenario.payload.sway(t)
+        return (yaw + self.gimbal.pan, pitch + self.gimbal.tilt,
+                yaw_rate + self.gimbal.pan_rate, pitch_rate + self.gimbal.tilt_rate)
+
+    def load_registers(self, t):
+        """Load the simulated chips' registers from the payload's motion."""
+        scenario = self.scenario
+        pan, tilt, pan_rate, tilt_rate = self.view(t)
+
+        # the IMU turns with the camera, which pans against the z axis and tilts against the y axis
+        noise = self.rng.normal(0.0, scenario.gyro_noise, 3)
+        gyroscope = [noise[0], -tilt_rate + scenario.gyro_bias + noise[1], -pan_rate + scenario.gyro_bias + noise[2]]
+        accelerometer = [GRAVITY * math.sin(math.radians(tilt)), 0.0, GRAVITY * math.cos(math.radians(tilt))]
+        magnetometer = [0.2 * math.cos(math.radians(pan)), -0.2 * math.sin(math.radians(pan)), 0.45]
+        pressure = 1013.25 * (1.0 - 2.25577e-5 * scenario.payload.altitude) ** 5.25588
+        self.bus.set_imu(gyroscope, accelerometer, magnetometer, pressure, 20.0)
+
+    def sample(self, t):
+        """Run one sample of the real flight data capture on the simulated chips."""
+        self.load_registers(t)
+        self.data.sample(self.log, 0.0, None, self.imu_buffer, None, self.altitude, self.phase)
+
+        # pointing error once the rocket is off the pad
+        scenario = self.scenario
+        pan, tilt, _, _ = self.view(t)
+        if t >= scenario.rocket.launch_time:
+            bearing, depression, _ = scenario.rocket.direction_from(t, scenario.payload.height)
+            self.errors.append((bearing - pan, depression - tilt))
+
+    def expose(self, t):
+        """Expose a frame if the detector is free, run the real detection on it, and queue the prediction it shares.
+
+        The prediction reaches the controls once the inference and the hand-off between processes would be done.
+        """
+        scenario = self.scenario
+        if t < self.detector_free:
+            return
+        inference = max(self.rng.normal(scenario.inference_time, scenario.inference_jitter), 0.01)
+        self.detector_free = t + inference
+
+        # where the rocket is in the frame, and how big
+        pan, tilt, _, _ = self.view(t)
+        bearing, depression, distance = scenario.rocket.direction_from(t, scenario.payload.height)
+        x = self.camera_width / 2.0 + (bearing - pan) / self.degrees_per_pixel[0]
+        y = self.camera_height / 2.0 + (depression - tilt) / self.degrees_per_pixel[1]
+        height = max(math.degrees(scenario.rocket.length / distance) / self.degrees_per_pixel[1], 4.0)
+        width = max(height / 8.0, 2.0)
+        self.interpreter.box = None
+        in_view = 0 <= x < self.camera_width and 0 <= y < self.camera_height
+        if in_view and self.rng.random() >= scenario.miss_probability:
+            x += self.rng.normal(0.0, scenario.pixel_noise)
+            y += self.rng.normal(0.0, scenario.pixel_noise)
+            self.interpreter.box = [(y - height / 2.0) / self.camera_height, (x - width / 2.0) / self.camera_width,
+                                    (y + height / 2.0) / self.camera_height, (x + width / 2.0) / self.camera_width]
+
+        if self.detect.detect(self.jpeg, t, self.camera_width, self.camera_height, self.threshold,
+                              self.prediction) is not None:
+            self.detections += 1
+        self.pending.append((t + inference + scenario.handoff_time, self.prediction['prediction']))
+
+    def control(self, t):
+        """Hand over finished predictions and run one cycle of the real controls, timing its computation."""
+        while self.pending and self.pending[0][0] <= t:
+            _, self.detection = self.pending.pop(0)
+
+        samples, self.imu_count = self.imu_buffer.read(self.imu_count)
+        start = time.perf_counter()
+        self.controls.step(t, self.detection, samples)
+        self.compute.append(time.perf_counter() - start)
+
+    def run(self):
+        """Fly the scenario on a virtual clock and return the pointing error and compute statistics."""
+        with tempfile.TemporaryDirectory() as directory:
+            return self.fly(directory)
+
+    def fly(self, directory):
+        """Fly the scenario, keeping the flight data capture's calibration cache in the directory."""
+        scenario = self.scenario
+        wall_start = time.perf_counter()
+        self.rng = np.random.default_rng(scenario.seed + 1)
+        clock = VirtualClock()
+
+        # the real controls steering a gimbal that starts out pointed at the launch pad
+        self.gimbal = LaggedGimbal(scenario.gimbal_time_constant)
+        (yaw, pitch), _ = scenario.payload.sway(0.0)
+        bearing, depression, _ = scenario.rocket.direction_from(0.0, scenario.payload.height)
+        self.gimbal.pan = bearing - yaw
+        self.gimbal.tilt = depression - pitch
+        self.gimbal.advance(0.0)
+        actuator = self.gimbal
+        if self.output_rate is not None:
+            actuator = ActuatorOutput(SimulatedDriver(self.gimbal), self.output_rate, clock=clock.now)
+        self.controls = ControlsSystem(self.controls_rate, actuator, self.camera_width, self.camera_height,
+                                       self.predict)
+        self.controls.scheduler = PeriodicScheduler(self.controls_rate, clock=clock.now, sleep=clock.sleep)
+
+        # the real flight data capture on simulated chips, sampled on the virtual clock and calibrated from a cache,
+        # reprogramming the chips for a new flight phase right away since nothing else runs meanwhile
+        self.bus = SimulatedBus()
+        self.load_registers(0.0)
+        self.data = DataRW(self.imu_rate, os.path.join(directory, 'calibration.json'), profiles=self.profiles,
+                           clock=clock.now)
+        self.data.scheduler = PeriodicScheduler(self.imu_rate, clock=clock.now, sleep=clock.sleep)
+        CalibrationCache(self.data.calibration_filepath).save(Calibration(temperature=20.0))
+        bus_factory = I2C.busFactory
+        I2C.busFactory = lambda bus_id: self.bus
+        try:
+            self.data.enable()
+        finally:
+            I2C.busFactory = bus_factory
+        if self.data.reconfigurer is not None:
+            self.data.reconfigurer.background = False
+        self.log = io.StringIO()
+        self.imu_buffer = ImuBuffer()
+        self.imu_count = 0
+        self.altitude = AltitudeState()
+        self.phase = PhaseState()
+
+        # the real detection on a blank frame, with the model standing in returning where the rocket is
+        self.detect = CVDetect(framerate=self.framerate)
+        self.interpreter = self.detect.interpreter = SimulatedInterpreter(self.camera_width, self.camera_height)
+        frame = io.BytesIO()
+        Image.new('RGB', (self.camera_width, self.camera_height)).save(frame, format='jpeg')
+        self.jpeg = frame.getvalue()
+        self.prediction = {'prediction': {'index': -1}}
+
+        self.detector_free = 0.0
+        self.pending = []
+        self.detections = 0
+        self.detection = None
+        self.errors = []
+        self.compute = []
+
+        # run every task at its own rate, always releasing the one with the earliest deadline next
+        tasks = [
+            (self.data.scheduler, self.sample),
+            (self.controls.scheduler, self.control),
+            (PeriodicScheduler(self.framerate, clock=clock.now, sleep=clock.sleep), self.expose)
+        ]
+        if self.output_rate is not None:
+            tasks.append((PeriodicScheduler(self.output_rate, clock=clock.now, sleep=clock.sleep), actuator.flush))
+        for scheduler, _ in tasks:
+            scheduler.start(0.0)
+        while True:
+            scheduler, task = min(tasks, key=lambda task: task[0].deadline)
+            if scheduler.deadline > self.duration:
+                break
+            task(scheduler.wait())
+        self.controls.actuator.close()
+
+        errors = np.array(self.errors).reshape(-1, 2)
+        total = np.hypot(errors[:, 0], errors[:, 1])
+        half_view = (self.camera_width / 2.0 * self.degrees_per_pixel[0],
+                     self.camera_height / 2.0 * self.degrees_per_pixel[1])
+        compute = np.array(self.compute)
+        wall = time.perf_counter() - wall_start
+        return {
+            'seed': scenario.seed,
+            'error_rms': float(np.sqrt(np.mean(total ** 2))) if len(total) else 0.0,
+            'error_p95': float(np.percentile(total, 95)) if len(total) else 0.0,
+            'error_max': float(total.max()) if len(total) else 0.0,
+            'in_view': float(np.mean((np.abs(errors[:, 0]) < half_view[0]) & (np.abs(errors[:, 1]) < half_view[1])))
+            if len(total) else 1.0,
+            'detections': self.detections,
+            'age_mean': self.controls.ages['age_mean'],
+            'compute_mean': float(compute.mean()),
+            'compute_max': float(compute.max()),
+            'compute_p99': float(np.percentile(compute, 99)),
+            'budget': float(compute.mean() * self.controls_rate),
+            'speedup': self.duration / wall
+        }
+
+
+def run_batch(runs, seed=0, **kwargs):
+    """Fly randomized scenarios, one per seed, and return each one's results."""
+    return [MissionSimulator(Scenario.random(seed + run), **kwargs).run() for run in range(runs)]
+
+
+def report(results):
+    """Print a line per scenario and the aggregate over all of them."""
+    line = '%(seed)6d %(error_rms)8.3f %(error_p95)8.3f %(error_max)8.3f %(in_view)6.1f%% %(detections)6d ' \
+           '%(age_mean)8.4f %(compute_mean)10.6f %(compute_p99)10.6f %(budget)6.2f%% %(speedup)8.1f'
+    print('  seed  rms deg  p95 deg  max deg  in view  dets  age s   compute s   p99 s     budget  speedup')
+    for result in results:
+        print(line % dict(result, in_view=100 * result['in_view'], budget=100 * result['budget']))
+    totals = {key: np.mean([result[key] for result in results]) for key in results[0] if key != 'seed'}
+    totals['error_max'] = max(result['error_max'] for result in results)
+    totals['compute_p99'] = max(result['compute_p99'] for result in results)
+    totals['in_view'] *= 100
+    totals['budget'] *= 100
+    print(' ' * 7 + line.split(' ', 1)[1] % totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fly randomized missions through the controls faster than real time.')
+    parser.add_argument(
+        '--runs',
+        default=10,
+        type=int,
+        help='Number of randomized scenarios')
+    parser.add_argument(
+        '--seed',
+        default=0,
+        type=int,
+        help='Seed of the first scenario, the rest follow')
+    parser.add_argument(
+        '--duration',
+        default=20.0,
+        type=float,
+        help='Mission length in seconds')
+    parser.add_argument(
+        '--framerate',
+        default=30,
+        type=int,
+        help='Camera framerate in Hz')
+    parser.add_argument(
+        '--output-rate',
+        type=int,
+        help='Flush the commands to the gimbal through the actuator output at this rate in Hz')
+    parser.add_argument(
+        '--no-predict',
+        action='store_true',
+        help='Steer on the stale detections without the target predictor')
+    args = parser.parse_args()
+
+    report(run_batch(args.runs, args.seed, duration=args.duration, framerate=args.framerate,
+                     predict=not args.no_predict, output_rate=args.output_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import math
+
+import numpy as np
+
+from controls.actuators import SimulatedGimbal
+
+GRAVITY = 9.80665
+
+
+class Rocket:
+    def __init__(self, distance=1500.0, bearing=0.0, launch_time=2.0, acceleration=100.0, burn_time=3.0,
+                 angle=5.0, heading=0.0, length=2.5):
+        # the launch pad's distance in meters and bearing in degrees from the payload
+        self.pad = np.array([distance * math.cos(math.radians(bearing)), distance * math.sin(math.radians(bearing)),
+                             0.0])
+
+        # launch time in seconds, then the motor's acceleration in m/s^2 for the burn time in seconds along a
+        # direction tilted from vertical by the angle toward the heading, both in degrees
+        self.launch_time = launch_time
+        self.acceleration = acceleration
+        self.burn_time = burn_time
+        tilt = math.radians(angle)
+        self.direction = np.array([math.sin(tilt) * math.cos(math.radians(heading)),
+                                   math.sin(tilt) * math.sin(math.radians(heading)), math.cos(tilt)])
+
+        # length of the rocket in meters, which sets how big it looks in the image
+        self.length = length
+
+    def position(self, t):
+        """Position in meters relative to the payload at a time in seconds, a ballistic coast after the burn."""
+        flight = max(t - self.launch_time, 0.0)
+        burn = min(flight, self.burn_time)
+        coast = flight - burn
+        burnout_velocity = self.direction * self.acceleration * burn
+        position = self.pad + 0.5 * self.direction * self.acceleration * burn * burn - \
+            np.array([0.0, 0.0, 0.5 * GRAVITY * burn * burn])
+        velocity = burnout_velocity - np.array([0.0, 0.0, GRAVITY * burn])
+        position = position + velocity * coast - np.array([0.0, 0.0, 0.5 * GRAVITY * coast * coast])
+        position[2] = max(position[2], 0.0)
+        return position
+
+    def direction_from(self, t, height=0.0):
+        """Bearing to the right and depression below the horizon in degrees, and range in meters, from the payload."""
+        x, y, z = self.position(t) - np.array([0.0, 0.0, height])
+        horizontal = math.hypot(x, y)
+        return math.degrees(math.atan2(y, x)), -math.degrees(math.atan2(z, horizontal)), math.sqrt(
+            horizontal * horizontal + z * z)
+
+
+class Payload:
+    def __init__(self, height=2.0, sway_amplitude=(2.0, 1.0), sway_frequency=(0.5, 0.7), sway_phase=(0.0, 0.0),
+                 altitude=0.0):
+        # height of the camera above the launch pad and the site's altitude in meters
+        self.height = height
+        self.altitude = altitude
+
+        # the payload's base sways in yaw and pitch with an amplitude in degrees and a frequency in Hz
+        self.sway_amplitude = sway_amplitude
+        self.sway_frequency = sway_frequency
+        self.sway_phase = sway_phase
+
+    def sway(self, t):
+        """The base's yaw and pitch in degrees and their rates in degrees per second."""
+        angles = []
+        rates = []
+        for amplitude, frequency, phase in zip(self.sway_amplitude, self.sway_frequency, self.sway_phase):
+            omega = 2.0 * math.pi * frequency
+            angles.append(amplitude * math.sin(omega * t + phase))
+            rates.append(amplitude * omega * math.cos(omega * t + phase))
+        return angles, rates
+
+
+class LaggedGimbal(SimulatedGimbal):
+    """Simulated gimbal whose axes reach the commanded rates with a first-order motor lag."""
+
+    def __init__(self, time_constant=0.02, **kwargs):
+        super().__init__(**kwargs)
+        self.time_constant = time_constant
+        self.pan_command = 0.0
+        self.tilt_command = 0.0
+
+    def advance(self, now):
+        """Move the axes up to the given time while their rates settle toward the commanded ones."""
+        if self.last_time is not None and now > self.last_time:
+            dt = now - self.last_time
+            decay = math.exp(-dt / self.time_constant) if self.time_constant > 0 else 0.0
+            for axis, command in (('pan', self.pan_command), ('tilt', self.tilt_command)):
+                rate = getattr(self, axis + '_rate')
+                limits = getattr(self, axis + '_limits')
+                # exact travel of a rate settling exponentially toward the command
+                travel = command * dt + (rate - command) * self.time_constant * (1.0 - decay)
+                setattr(self, axis, min(max(getattr(self, axis) + travel, limits[0]), limits[1]))
+                setattr(self, axis + '_rate', command + (rate - command) * decay)
+        self.last_time = now if self.last_time is None else max(self.last_time, now)
+
+    def command(self, pan_rate, tilt_rate, now=None):
+        """Set the rates the axes settle toward, limited to what the motors can do."""
+        self.advance(now)
+        self.pan_command = min(max(pan_rate, -self.max_rate), self.max_rate)
+        self.tilt_command = min(max(tilt_rate, -self.max_rate), self.max_rate)
+        if self.record:
+            self.commands.append((now, self.pan_command, self.tilt_command))
+
+    def turning_rates(self):
+        """Pan and tilt rates the motors are driven at, none against an end-stop."""
+        return (self.limited(self.pan, self.pan_command, self.pan_limits),
+                self.limited(self.tilt, self.tilt_command, self.tilt_limits))
+
+    def close(self):
+        """Stop the axes."""
+        self.pan_command = 0.0
+        self.tilt_command = 0.0
+
+
+class SimulatedInterpreter:
+    """Stands in for the TF Lite interpreter, returning the box the scenario puts in the frame it's given."""
+
+    def __init__(self, width, height, score=0.9):
+        self.input = np.zeros((1, height, width, 3), dtype=np.uint8)
+        self.score = score
+
+        # the rocket's box in the next frame as (ymin, xmin, ymax, xmax) relative to the frame, None if it isn't there
+        self.box = None
+        self.outputs = None
+
+    def get_input_details(self):
+        return [{'index': 0, 'shape': np.array(self.input.shape)}]
+
+    def get_output_details(self):
+        return [{'index': 0}, {'index': 1}, {'index': 2}]
+
+    def tensor(self, index):
+        return lambda: self.input
+
+    def invoke(self):
+        """Output the box and an empty second detection, with the boxes, class ids, and scores the model would."""
+        box = [0.0, 0.0, 0.0, 0.0] if self.box is None else self.box
+        self.outputs = [np.array([[box, [0.0, 0.0, 0.0, 0.0]]]), np.zeros((1, 2)),
+                        np.array([[0.0 if self.box is None else self.score, 0.0]])]
+
+    def get_tensor(self, index):
+        return self.outputs[index]
+
+
+class Scenario:
+    def __init__(self, rocket, payload, gimbal_time_constant=0.02, pixel_noise=1.5, miss_probability=0.05,
+                 inference_time=0.05, inference_jitter=0.01, handoff_time=0.002, gyro_noise=0.05, gyro_bias=0.2,
+                 seed=0):
+        self.rocket = rocket
+        self.payload = payload
+        self.gimbal_time_constant = gimbal_time_constant
+
+        # detector: pixel noise in pixels, chance of missing the rocket in a frame, and the time in seconds from
+        # exposure until the detection reaches the controls
+        self.pixel_noise = pixel_noise
+        self.miss_probability = miss_probability
+        self.inference_time = inference_time
+        self.inference_jitter = inference_jitter
+        self.handoff_time = handoff_time
+
+        # gyroscope white noise and constant bias in degrees per second
+        self.gyro_noise = gyro_noise
+        self.gyro_bias = gyro_bias
+
+        self.seed = seed
+
+    @classmethod
+    def random(cls, seed):
+        """A scenario with the rocket, the payload's sway, and the detector drawn at random."""
+        rng = np.random.default_rng(seed)
+        rocket = Rocket(distance=rng.uniform(800.0, 3000.0), bearing=rng.uniform(-5.0, 5.0),
+                        launch_time=rng.uniform(1.0, 3.0), acceleration=rng.uniform(60.0, 150.0),
+                        burn_time=rng.uniform(1.5, 4.0), angle=rng.uniform(0.0, 10.0), heading=rng.uniform(0.0, 360.0))
+        payload = Payload(sway_amplitude=rng.uniform(0.5, 5.0, 2), sway_frequency=rng.uniform(0.2, 1.5, 2),
+                          sway_phase=rng.uniform(0.0, 2.0 * math.pi, 2))
+        return cls(rocket, payload, gimbal_time_constant=rng.uniform(0.01, 0.05), pixel_noise=rng.uniform(0.5, 3.0),
+                   miss_probability=rng.uniform(0.0, 0.2), inference_time=rng.uniform(0.03, 0.08),
+                   gyro_bias=rng.uniform(-0.5, 0.5), seed=seed)
@@ -0,0 +1,16 @@
+from controls.actuator_output import ActuatorOutput, SimulatedDriver
+
+
+def test_writes_count_slew_follow_ups():
+    driver = SimulatedDriver()
+    output = ActuatorOutput(driver, rate=50, max_slew=500.0, clock=lambda: 0.0)
+
+    # one command the slew limit spreads over ten ticks, on both axes
+    output.command(100.0, -100.0, 0.0)
+    for tick in range(1, 12):
+        output.flush(tick * 0.02)
+
+    stats = output.stats()
+    assert stats['commands'] == 1
+    assert stats['writes'] == len(driver.writes) == 20
+    assert len(output.latencies) == 2
@@ -0,0 +1,50 @@
+import math
+
+import numpy as np
+
+from data.altitude import GRAVITY, AltitudeEstimator, AltitudeState
+from data.data_rw import DataRW
+
+
+def tilting_samples(rate=100, duration=3.0, tilt_rate=30.0):
+    # the IMU sits still on the pad while the gimbal tilts it about y, so it only ever reads gravity
+    for i in range(int(duration * rate)):
+        tilt = math.radians(min(i / rate, 2.0) * tilt_rate)
+        yield (i / rate, [0.0, tilt_rate if i / rate < 2.0 else 0.0, 0.0],
+               [-GRAVITY * math.sin(tilt), 0.0, GRAVITY * math.cos(tilt)], [0.2, 0.0, 0.45])
+
+
+def test_tilting_imu_reads_no_vertical_acceleration():
+    data = DataRW()
+    first = AltitudeEstimator()
+    for time, gyroscope, accelerometer, magnetometer in tilting_samples():
+        data.fuse(time, gyroscope, accelerometer, magnetometer)
+        first.predict(time, accelerometer)
+        if not data.altitude.initialized:
+            data.altitude.correct(0.0)
+            first.correct(0.0)
+
+    # up from the first sample takes 60 degrees of tilt for a fall, the attitude doesn't
+    assert abs(first.state[1]) > 5.0
+    assert abs(data.altitude.state[1]) < 1.0
+    assert np.dot(data.attitude.up(), [-math.sin(math.radians(60.0)), 0.0, math.cos(math.radians(60.0))]) > 0.99
+
+
+def test_restart_keeps_ground_and_attitude():
+    data = DataRW()
+    for time, gyroscope, accelerometer, magnetometer in tilting_samples():
+        data.fuse(time, gyroscope, accelerometer, magnetometer)
+        if not data.altitude.initialized:
+            data.altitude.correct(100.0)
+    data.altitude.state[0] = 350.0
+    shared = AltitudeState()
+    shared.publish(3.0, data.altitude, data.attitude.quaternion())
+
+    # the replacement carries on in flight instead of taking its first sample as the ground and the vertical
+    restarted = DataRW()
+    restarted.restore(shared.read())
+    restarted.fuse(3.01, [0.0, 0.0, 0.0], [-GRAVITY * math.sin(math.radians(60.0)), 0.0,
+                                            GRAVITY * math.cos(math.radians(60.0))], [0.2, 0.0, 0.45])
+    assert restarted.altitude.ground == 100.0
+    assert restarted.altitude.state[0] == 350.0
+    assert np.allclose(restarted.attitude.up(), data.attitude.up(), atol=0.01)
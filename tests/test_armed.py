@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+import signal
+import time
+
+import pytest
+
+from controller.mission_clock import MissionClock
+from controller.supervisor import Heartbeats, Supervisor
+
+
+def watch_pad(clock, heartbeat, launch_after):
+    # stands in for the flight data capture on the pad, launching after a while if given one
+    clock.arrive('data')
+    start = time.perf_counter()
+    while True:
+        heartbeat.beat()
+        if launch_after is not None and time.perf_counter() - start > launch_after:
+            clock.launch(time.perf_counter())
+            return
+        time.sleep(0.01)
+
+
+def arm(max_restarts, launch_after):
+    manager = multiprocessing.Manager()
+    clock = MissionClock(manager, 1, prepare_timeout=5, armed=True)
+    heartbeats = Heartbeats(['data'])
+    supervisor = Supervisor(heartbeats, heartbeat_timeout=0.5, max_restarts=max_restarts)
+
+    def start(name, launch=None):
+        process = multiprocessing.Process(target=watch_pad, args=(clock, heartbeats.slot(name), launch))
+        process.start()
+        return process
+
+    processes = {'data': start('data')}
+
+    # kill the flight data capture once it's watching for launch
+    def poll():
+        if supervisor.restarts['data'] == 0 and heartbeats.slot('data').last() > 0:
+            os.kill(processes['data'].pid, signal.SIGKILL)
+        supervisor.watch(processes, lambda name: start(name, launch_after), ['data'])
+
+    return clock, supervisor, processes, lambda: clock.start(poll, poll_interval=0.05)
+
+
+def test_data_killed_on_the_pad_is_restarted():
+    clock, supervisor, processes, start = arm(max_restarts=1, launch_after=0.2)
+    mission_start = start()
+    processes['data'].join(5)
+    assert supervisor.restarts['data'] == 1
+    assert mission_start == clock.launch_time.value > 0
+
+
+def test_data_killed_on_the_pad_without_restarts_aborts():
+    clock, supervisor, processes, start = arm(max_restarts=0, launch_after=None)
+    with pytest.raises(RuntimeError, match='data failed before the mission started'):
+        start()
+    assert not processes['data'].is_alive()
+    assert not clock.launch_event.is_set()
@@ -0,0 +1,49 @@
+import threading
+
+from cv.frames import FrameOutput
+
+
+class Frame:
+    def __init__(self, timestamp, complete):
+        self.timestamp = timestamp
+        self.complete = complete
+
+
+class Camera:
+    # microseconds on the camera's clock
+    timestamp = 1000000
+    frame = None
+
+
+def test_frames_are_stamped_when_exposed():
+    camera = Camera()
+    output = FrameOutput(camera, clock=lambda: 10.0)
+
+    # a frame written in two pieces, exposed 40 ms before the camera's clock reads now
+    camera.frame = Frame(960000, False)
+    output.write(b'\xff\xd8first')
+    assert output.next(0, timeout=0) is None
+    camera.frame = Frame(960000, True)
+    output.write(b' half\xff\xd9')
+    index, jpeg, capture_time = output.next(0, timeout=0)
+    assert jpeg == b'\xff\xd8first half\xff\xd9'
+    assert abs(capture_time - 9.96) < 1e-9
+    assert not output.fallback
+
+
+def test_busy_reader_gets_the_latest_frame():
+    camera = Camera()
+    output = FrameOutput(camera, clock=lambda: 10.0)
+    for data in (b'one', b'two', b'three'):
+        camera.frame = Frame(None, True)
+        output.write(data)
+    assert output.next(0, timeout=0)[:2] == (3, b'three')
+    assert output.fallback
+
+    # a waiting reader is woken by the next frame
+    frames = []
+    reader = threading.Thread(target=lambda: frames.append(output.next(3, timeout=5)))
+    reader.start()
+    output.write(b'four')
+    reader.join(5)
+    assert frames[0][:2] == (4, b'four')
@@ -0,0 +1,61 @@
+import numpy as np
+
+from controls.actuators import SimulatedGimbal
+from controls.controls_system import ControlsSystem
+from controls.pointing import PointingController
+
+
+def offset_detection(index, now):
+    return {'xmin': 300.0, 'ymin': 250.0, 'width': 10.0, 'height': 40.0, 'index': index, 'timestamp': now}
+
+
+def test_no_imu_commands_stay_bounded():
+    # no IMU samples ever arrive, as in a run without the data subsystem
+    gimbal = SimulatedGimbal(record=False)
+    controls = ControlsSystem(actuator=gimbal, predict=False)
+    commands = [controls.step(i * 0.01, offset_detection(i // 3, i * 0.01), []) for i in range(300)]
+
+    # the loop settles on the error instead of winding up to the rate limit
+    assert all(abs(pan) < 180.0 and abs(tilt) < 180.0 for pan, tilt in commands)
+    assert abs(commands[-1][0] - commands[-2][0]) < 1.0
+
+
+def test_detection_lost_holds_without_growing():
+    gimbal = SimulatedGimbal(record=False)
+    controls = ControlsSystem(actuator=gimbal, predict=False)
+    for i in range(100):
+        controls.step(i * 0.01, offset_detection(i // 3, i * 0.01), [])
+
+    # with the detection gone and no IMU samples, only the held integral is commanded, and it doesn't grow
+    lost = [controls.step(1.0 + i * 0.01, None, []) for i in range(100)]
+    assert lost[0] == lost[-1]
+    assert abs(lost[-1][0]) < 180.0 and abs(lost[-1][1]) < 180.0
+
+
+def test_end_stop_leaves_out_the_gimbal_rate():
+    gimbal = SimulatedGimbal(pan_limits=(-10.0, 10.0), record=False)
+    gimbal.pan = 10.0
+    gimbal.pan_rate = 50.0
+    assert gimbal.turning_rates() == (0.0, 0.0)
+
+    # against the end-stop, the feed-forward is only the counter-rotation of the base
+    pointing = PointingController(ki=0.0)
+    pan, tilt = pointing.update(0.0, None, [0.0, 0.0, 5.0], gimbal.turning_rates())
+    assert (pan, tilt) == (5.0, 0.0)
+
+
+def test_slower_imu_keeps_feeding_forward_until_stale():
+    gimbal = SimulatedGimbal(record=False)
+    controls = ControlsSystem(actuator=gimbal, predict=False)
+
+    # the base turns at 20 deg/s about z, sampled at half the control rate
+    commands = []
+    for i in range(100):
+        samples = np.array([[i * 0.01, 0.0, 0.0, 20.0, 0.0, 0.0, 9.80665, 0.2, 0.0, 0.45]] if i % 2 == 0 else [])
+        commands.append(controls.step(i * 0.01, None, samples))
+    assert abs(commands[-1][0] - commands[-2][0]) < 1.0
+    assert abs(commands[-1][0]) > 10.0
+
+    # once the samples stop for longer than the timeout, the feed-forward is left out
+    stale = [controls.step(1.0 + i * 0.01, None, []) for i in range(10)]
+    assert abs(stale[-1][0]) < 1.0
@@ -0,0 +1,19 @@
+from data.profiles import PROFILES, Reconfigurer
+
+
+class Camera:
+    framerate = 30
+    framerate_delta = 0
+
+
+def test_camera_follows_the_phase_frame_rate():
+    camera = Camera()
+    reconfigurer = Reconfigurer(camera=camera)
+    for phase in PROFILES:
+        reconfigurer.apply(phase)
+        assert camera.framerate + camera.framerate_delta == PROFILES[phase]['cv_framerate']
+
+    # requested phases are applied in the background
+    reconfigurer.request('descent')
+    reconfigurer.close()
+    assert camera.framerate + camera.framerate_delta == 10
@@ -0,0 +1,28 @@
+from controller.scheduler import PeriodicScheduler
+
+
+def no_sleep(seconds):
+    raise AssertionError('poll must never sleep')
+
+
+def test_poll_releases_every_frame_at_the_camera_rate():
+    scheduler = PeriodicScheduler(30, sleep=no_sleep)
+    frames = [i / 30.0 + 0.002 * (-1) ** i for i in range(90)]
+    released = [scheduler.poll(frame) for frame in frames]
+    assert all(release is not None for release in released)
+    assert scheduler.overruns == 0
+
+
+def test_poll_drops_frames_early_for_a_lower_rate():
+    scheduler = PeriodicScheduler(15, sleep=no_sleep)
+    released = [scheduler.poll(i / 30.0) is not None for i in range(90)]
+    assert sum(released) == 45
+    assert released[:4] == [True, False, True, False]
+
+
+def test_poll_counts_missed_frames_as_overruns():
+    scheduler = PeriodicScheduler(30, sleep=no_sleep)
+    for frame in (0.0, 1 / 30.0, 4 / 30.0, 5 / 30.0):
+        assert scheduler.poll(frame) is not None
+    assert scheduler.overruns == 1
+    assert scheduler.skipped == 2
@@ -0,0 +1,13 @@
+from simulation.simulator import MissionSimulator
+from simulation.world import Scenario
+
+
+def test_mission_runs_the_real_loops():
+    simulator = MissionSimulator(Scenario.random(0), duration=4.0)
+    result = simulator.run()
+
+    # the flight data capture sampled at the pad's rate and logged every sample, and the detections were shared
+    assert simulator.data.scheduler.rate == 50
+    assert simulator.data.sample_number == simulator.log.getvalue().count('\n') > 150
+    assert simulator.prediction['prediction']['index'] + 1 >= result['detections'] > 0
+    assert result['error_rms'] < 5.0
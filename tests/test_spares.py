@@ -0,0 +1,50 @@
+import json
+import threading
+
+from controller.backends import BACKENDS
+from controller.mission_controller import MissionController
+from data.calibration import CalibrationCache, calibrate
+
+
+class SpareBackend:
+    # events shared by every instance, since the backend is constructed by the mission controller
+    prepared_spare = threading.Event()
+
+    def prepare_spare(self, labels_filepath):
+        self.labels_filepath = labels_filepath
+        SpareBackend.prepared_spare.set()
+
+
+class StillIMU:
+    def getTemperatureCelsius(self):
+        return 41.0
+
+    def getGyroscopeDPS(self):
+        raise AssertionError('a spare must not measure the calibration in flight')
+
+
+def test_spare_prepares_before_takeover(monkeypatch):
+    # only the order is checked: a real computer vision spare still opens the camera and loads the model after
+    # takeover, which takes seconds and is part of its time-to-recovery
+    monkeypatch.setitem(BACKENDS, 'spare', ('tests.test_spares', 'SpareBackend'))
+    controller = MissionController(subsystems=())
+    takeover = threading.Event()
+    loaded = []
+    thread = threading.Thread(target=lambda: loaded.append(controller.load('spare', takeover, 'labels.txt')))
+    thread.start()
+
+    # prepared while still waiting to take over
+    assert SpareBackend.prepared_spare.wait(5)
+    assert not loaded
+    takeover.set()
+    thread.join(5)
+    assert loaded[0].labels_filepath == 'labels.txt'
+
+
+def test_spare_uses_nearest_cached_calibration(tmp_path):
+    filepath = str(tmp_path / 'calibration.json')
+    with open(filepath, 'w') as file:
+        json.dump({'board': {'temperatures': {'25': {'gyro_bias': [1.0, 2.0, 3.0], 'accel_offset': [0.0, 0.0, 0.1],
+                                                     'temperature': 24.0}}}}, file)
+    calibration = calibrate(StillIMU(), None, CalibrationCache(filepath, board='board'), measure=False)
+    assert list(calibration.gyro_bias) == [1.0, 2.0, 3.0]
@@ -0,0 +1,25 @@
+import pytest
+
+from controller.dashboard import Dashboard
+from controller.governor import Throttle
+from controller.stages import StageTimes
+from controller.supervisor import Heartbeats
+
+
+def test_dashboard_shows_each_stage_of_the_loops():
+    stages = StageTimes(['cv', 'controls', 'data'])
+    assert stages.slot('controls') is None
+
+    cv = stages.slot('cv')
+    cv.record('inference', 0.010)
+    cv.record('inference', 0.020)
+    stages.slot('data').record('write', 0.0005)
+
+    # the first time sets the average, later ones move it a tenth of the way
+    assert [stage for stage, _ in cv.averages()] == ['capture', 'preprocess', 'inference']
+    assert cv.averages()[2][1] == pytest.approx(0.011)
+
+    dashboard = Dashboard(Heartbeats(['cv', 'controls', 'data']), Throttle(), stages=stages)
+    lines = dashboard.lines(1.0, 0.0, 20)
+    assert 'cv         capture 0.00ms  preprocess 0.00ms  inference 11.00ms' in lines
+    assert 'data       read 0.00ms  fuse 0.00ms  write 0.50ms' in lines
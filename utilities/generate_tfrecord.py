@@ -3,63 +3,124 @@ from __future__ import division
 from __future__ import print_function
 
 import argparse
+import csv
 import glob
 import io
+import json
+import multiprocessing
 import os
-import pandas as pd
-import subprocess
+import struct
 import sys
 import tensorflow as tf
+import threading
+import time
 import xml.etree.ElementTree as xet
 import hashlib
+import numpy as np
 
 from collections import namedtuple
+from functools import partial
 from object_detection.utils import dataset_util
 from PIL import Image
 from tqdm import tqdm
 
 
-tmp_csv = ".tmpFile.csv"
+column_names = ["filename", "class", "xmin", "ymin", "xmax", "ymax"]
 
+# at module level so the groups can be pickled over to the worker processes
+FilenameObjectGroup = namedtuple("FilenameObjectGroup", ["filename", "object"])
 
-def txt_to_csv(txt_dir, csv_output_file):
-    csv_lines = []
-    for txt_file in tqdm(glob.glob(os.path.join(txt_dir, "*.txt"))):
+
+def label_files(label_dir, txt_or_xml):
+    return sorted(glob.glob(os.path.join(label_dir, "*." + txt_or_xml)))
+
+
+def txt_groups(txt_files):
+    # one label file per image, parsed a line at a time and handed on as soon as it's read
+    for txt_file in txt_files:
+        filename = os.path.splitext(os.path.basename(os.path.normpath(txt_file)))[0] + ".jpg"
+        objects = []
         with open(txt_file, "r") as f:
-            file_lines = f.readlines()
+            for line in f:
+                class_xmin_ymin_xmax_ymax = line.strip("\t\n\r").split()
+                if not class_xmin_ymin_xmax_ymax:
+                    continue
+                objects.append(dict(zip(column_names, (filename,
+                                                       class_xmin_ymin_xmax_ymax[0],
+                                                       int(float(class_xmin_ymin_xmax_ymax[1])),
+                                                       int(float(class_xmin_ymin_xmax_ymax[2])),
+                                                       int(float(class_xmin_ymin_xmax_ymax[3])),
+                                                       int(float(class_xmin_ymin_xmax_ymax[4]))))))
+        if objects:
+            yield FilenameObjectGroup(filename, objects)
+
+
+def xml_filename(xml_file):
+    # the image's filename comes before its objects, so parsing stops as soon as it's read
+    for _, element in xet.iterparse(xml_file, events=("end",)):
+        if element.tag == "filename":
+            return element.text
+    return None
+
+
+def xml_objects(xml_file):
+    # parsed incrementally with each object freed once it's read
+    objects = []
+    for _, element in xet.iterparse(xml_file, events=("end",)):
+        if element.tag == "object":
+            objects.append(dict(zip(column_names, (None,
+                                                   element[0].text,
+                                                   int(element[4][0].text),
+                                                   int(element[4][1].text),
+                                                   int(element[4][2].text),
+                                                   int(element[4][3].text)))))
+            element.clear()
+    return objects
+
+
+def xml_groups(xml_files):
+    # a first pass reads only each file's filename, so an image labelled in more than one file is merged into one
+    # group, handed on at its first file, while the objects are still parsed one group at a time
+    xml_files = list(xml_files)
+    filenames = [xml_filename(xml_file) for xml_file in xml_files]
+    files_by_filename = {}
+    for xml_file, filename in zip(xml_files, filenames):
+        if not filename:
+            raise ValueError("no <filename> in {}".format(xml_file))
+        files_by_filename.setdefault(filename, []).append(xml_file)
+
+    for xml_file, filename in zip(xml_files, filenames):
+        if files_by_filename[filename][0] != xml_file:
+            continue
+        objects = [row for labelled_file in files_by_filename[filename] for row in xml_objects(labelled_file)]
+        if not objects:
+            continue
+        for row in objects:
+            row["filename"] = filename
+        yield FilenameObjectGroup(filename, objects)
+
+
+def label_groups(label_dir, txt_or_xml):
+    files = label_files(label_dir, txt_or_xml)
+    groups = txt_groups(files) if txt_or_xml == "txt" else xml_groups(files)
+    return len(files), groups
+
+
+def write_csv(filename_object_groups, csv_output_file):
+    with open(csv_output_file, "w", newline="") as f:
+        csv_writer = csv.writer(f)
+        csv_writer.writerow(column_names)
+        for filename_object_group in filename_object_groups:
+            for row in filename_object_group.object:
+                csv_writer.writerow([row[column_name] for column_name in column_names])
 
-        for line in file_lines:
-            class_xmin_ymin_xmax_ymax = line.strip("\t\n\r").split()
-            csv_line = (os.path.splitext(os.path.basename(os.path.normpath(txt_file)))[0] + ".jpg",
-                        class_xmin_ymin_xmax_ymax[0],
-                        int(float(class_xmin_ymin_xmax_ymax[1])),
-                        int(float(class_xmin_ymin_xmax_ymax[2])),
-                        int(float(class_xmin_ymin_xmax_ymax[3])),
-                        int(float(class_xmin_ymin_xmax_ymax[4])))
-            csv_lines.append(csv_line)
 
-    column_names = ["filename", "class", "xmin", "ymin", "xmax", "ymax"]
-    txt_df = pd.DataFrame(csv_lines, columns=column_names)
-    txt_df.to_csv(csv_output_file, index=False)
+def txt_to_csv(txt_dir, csv_output_file):
+    write_csv(txt_groups(tqdm(label_files(txt_dir, "txt"))), csv_output_file)
 
 
 def xml_to_csv(xml_dir, csv_output_file):
-    csv_lines = []
-    for xml_file in tqdm(glob.glob(os.path.join(xml_dir, "*.xml"))):
-        tree = xet.parse(xml_file)
-        root = tree.getroot()
-        for xml_member in root.findall("object"):
-            csv_line = (root.find("filename").text,
-                        xml_member[0].text,
-                        int(xml_member[4][0].text),
-                        int(xml_member[4][1].text),
-                        int(xml_member[4][2].text),
-                        int(xml_member[4][3].text))
-            csv_lines.append(csv_line)
-
-    column_names = ["filename", "class", "xmin", "ymin", "xmax", "ymax"]
-    xml_df = pd.DataFrame(csv_lines, columns=column_names)
-    xml_df.to_csv(csv_output_file, index=False)
+    write_csv(xml_groups(tqdm(label_files(xml_dir, "xml"))), csv_output_file)
 
 
 def label_dict_from_pbtxt(pbtxt_path):
@@ -80,17 +141,154 @@ def label_dict_from_pbtxt(pbtxt_path):
     return label_dict
 
 
-def create_tf_example(filename_object_group, img_dir_path, class_dict):
-    with tf.io.gfile.GFile(os.path.join(img_dir_path, "{}".format(filename_object_group.filename)), "rb") as f:
-        encoded_jpg = f.read()
-
-    encoded_jpg_io = io.BytesIO(encoded_jpg)
-    image = Image.open(encoded_jpg_io)
-    width, height = image.size
+# JPEG start of frame markers, which hold the image size, leaving out DHT, JPG, and DAC
+jpeg_sof_markers = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+image_format_features = {"jpeg": b"jpg", "png": b"png"}
+
+
+def probe_header(header):
+    # width, height, and format of a JPEG or PNG from its first bytes, or None if they're not in there
+    if header[:8] == b"\x89PNG\r\n\x1a\n" and len(header) >= 24:
+        width, height = struct.unpack(">II", header[16:24])
+        return width, height, "png"
+    if header[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(header):
+        if header[i] != 0xFF:
+            return None
+        marker = header[i + 1]
+        if marker == 0xFF:
+            i += 1
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            i += 2
+        elif marker in jpeg_sof_markers:
+            height, width = struct.unpack(">HH", header[i + 5:i + 9])
+            return width, height, "jpeg"
+        else:
+            i += 2 + struct.unpack(">H", header[i + 2:i + 4])[0]
+    return None
+
+
+def probe_image(image_path, chunk_size=65536):
+    # reads only as much of the file as it takes to find the size
+    with open(image_path, "rb") as f:
+        header = f.read(chunk_size)
+        while True:
+            probed = probe_header(header)
+            more = f.read(chunk_size) if probed is None else b""
+            if not more:
+                return probed
+            header += more
+
+
+def image_metadata(image_path, encoded=None):
+    if encoded is None:
+        with open(image_path, "rb") as f:
+            encoded = f.read()
+    stat = os.stat(image_path)
+    probed = probe_header(encoded)
+    if probed is None:
+        image = Image.open(io.BytesIO(encoded))
+        probed = image.size + (image.format.lower(),)
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "width": probed[0],
+        "height": probed[1],
+        "format": probed[2],
+        "sha256": hashlib.sha256(encoded).hexdigest()}
+
+
+class ImageCache(object):
+    def __init__(self, cache_path):
+        # image metadata by absolute path, valid while the file's size and modification time are unchanged
+        self.cache_path = cache_path
+        self.entries = {}
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path, "r") as f:
+                self.entries = json.load(f)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, image_path):
+        entry = self.entries.get(os.path.abspath(image_path))
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            entry = None
+        else:
+            if entry is not None and (entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns):
+                entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def update(self, image_path, metadata):
+        self.entries[os.path.abspath(image_path)] = metadata
+
+    def duplicates(self, image_paths):
+        image_paths_by_hash = {}
+        for image_path in image_paths:
+            entry = self.entries.get(os.path.abspath(image_path))
+            if entry is not None:
+                image_paths_by_hash.setdefault(entry["sha256"], []).append(image_path)
+        return [paths for paths in image_paths_by_hash.values() if len(paths) > 1]
+
+    def save(self):
+        if self.cache_path is None:
+            return
+        partial_path = self.cache_path + ".tmp"
+        with open(partial_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(partial_path, self.cache_path)
+
+
+def export_image(encoded_jpg, export):
+    # resize to the model's input size, stretching or fitting it inside black bars, and return the JPEG with the
+    # scale and offset that map pixel coordinates onto it
+    image = Image.open(io.BytesIO(encoded_jpg)).convert("RGB")
+    width, height = export["width"], export["height"]
+    if export["mode"] == "letterbox":
+        scale = min(width / image.width, height / image.height)
+        resized_width = max(1, int(round(image.width * scale)))
+        resized_height = max(1, int(round(image.height * scale)))
+    else:
+        resized_width, resized_height = width, height
+    offset_x, offset_y = (width - resized_width) // 2, (height - resized_height) // 2
+
+    canvas = Image.new("RGB", (width, height))
+    canvas.paste(image.resize((resized_width, resized_height), Image.LANCZOS), (offset_x, offset_y))
+    output = io.BytesIO()
+    canvas.save(output, format="JPEG", quality=export["quality"])
+    return output.getvalue(), (resized_width / image.width, resized_height / image.height, offset_x, offset_y)
+
+
+def create_tf_example(filename_object_group, img_dir_path, class_dict, metadata=None, export=None, encoded_jpg=None):
+    image_path = os.path.join(img_dir_path, "{}".format(filename_object_group.filename))
+    if encoded_jpg is None:
+        with tf.io.gfile.GFile(image_path, "rb") as f:
+            encoded_jpg = f.read()
+
+    # the size comes from the file header instead of decoding the image
+    if metadata is None:
+        metadata = image_metadata(image_path, encoded_jpg)
+    width, height = metadata["width"], metadata["height"]
 
     filename = filename_object_group.filename.encode("utf8")
     source_id = str(int(hashlib.sha256(filename).hexdigest(), 16) % 2**64).encode('utf8')
-    image_format = b"jpg"
+    image_format = image_format_features.get(metadata["format"], metadata["format"].encode("utf8"))
+
+    # store the image at the model's input size if asked, with the boxes moved to match
+    scale_x, scale_y, offset_x, offset_y = 1.0, 1.0, 0, 0
+    image_width, image_height = width, height
+    if export is not None:
+        encoded_jpg, (scale_x, scale_y, offset_x, offset_y) = export_image(encoded_jpg, export)
+        image_width, image_height = export["width"], export["height"]
+        image_format = b"jpg"
     xmins = []
     xmaxs = []
     ymins = []
@@ -98,27 +296,18 @@ def create_tf_example(filename_object_group, img_dir_path, class_dict):
     classes_text = []
     classes = []
 
-    for index, row in filename_object_group.object.iterrows():
-        xmins.append(row["xmin"] / width)
-        xmaxs.append(row["xmax"] / width)
-        ymins.append(row["ymin"] / height)
-        ymaxs.append(row["ymax"] / height)
-
-        if row["xmin"] <= row["xmax"] <= width is False:
-            print("bad x coordinates:", row["filename"])
-            sys.exit(0)
-
-        if row["ymin"] <= row["ymax"] <= width is False:
-            print("bad y coordinates:", row["filename"])
-            sys.exit(0)
-
+    for row in filename_object_group.object:
+        xmins.append((row["xmin"] * scale_x + offset_x) / image_width)
+        xmaxs.append((row["xmax"] * scale_x + offset_x) / image_width)
+        ymins.append((row["ymin"] * scale_y + offset_y) / image_height)
+        ymaxs.append((row["ymax"] * scale_y + offset_y) / image_height)
         classes_text.append(str(row["class"]).encode("utf8"))
         classes.append(class_dict[str(row["class"])])
 
     tf_example = tf.train.Example(features=tf.train.Features(
         feature={
-            "image/height": dataset_util.int64_feature(height),
-            "image/width": dataset_util.int64_feature(width),
+            "image/height": dataset_util.int64_feature(image_height),
+            "image/width": dataset_util.int64_feature(image_width),
             "image/filename": dataset_util.bytes_feature(filename),
             "image/source_id": dataset_util.bytes_feature(source_id),
             "image/encoded": dataset_util.bytes_feature(encoded_jpg),
@@ -133,6 +322,285 @@ def create_tf_example(filename_object_group, img_dir_path, class_dict):
     return tf_example
 
 
+def validate_label_files(label_files, txt_or_xml, img_dir_path, class_dict):
+    # parse a batch of label files and check every box in it at once against its image's size from the file header
+    problems = []
+    rows = []
+    image_sizes = []
+    for label_file in label_files:
+        try:
+            filename_object_groups = list(txt_groups([label_file]) if txt_or_xml == "txt" else xml_groups([label_file]))
+        except (ValueError, IndexError, TypeError, xet.ParseError) as error:
+            problems.append((label_file, "can't parse the labels: {}".format(error)))
+            continue
+
+        for filename_object_group in filename_object_groups:
+            image_path = os.path.join(img_dir_path, filename_object_group.filename)
+            if not os.path.exists(image_path):
+                problems.append((filename_object_group.filename, "missing image"))
+                continue
+            probed = probe_image(image_path)
+            if probed is None:
+                try:
+                    probed = Image.open(image_path).size
+                except OSError:
+                    problems.append((filename_object_group.filename, "can't read the image"))
+                    continue
+            rows.extend(filename_object_group.object)
+            image_sizes.extend([probed[:2]] * len(filename_object_group.object))
+
+    boxes = np.array([[row["xmin"], row["ymin"], row["xmax"], row["ymax"]] for row in rows], dtype=float).reshape(-1, 4)
+    image_sizes = np.array(image_sizes, dtype=float).reshape(-1, 2)
+    classes = np.array([str(row["class"]) for row in rows], dtype=object)
+    checks = [
+        ("box outside the image", (boxes[:, 0] < 0) | (boxes[:, 1] < 0) | (boxes[:, 2] > image_sizes[:, 0]) |
+         (boxes[:, 3] > image_sizes[:, 1])),
+        ("empty box", (boxes[:, 2] <= boxes[:, 0]) | (boxes[:, 3] <= boxes[:, 1])),
+        ("unknown class", ~np.isin(classes, list(class_dict)) if len(classes) else np.zeros(0, dtype=bool))]
+    for reason, bad in checks:
+        for i in np.flatnonzero(bad):
+            problems.append((rows[i]["filename"], "{}: {} {} {} {} {} in {}x{}".format(
+                reason, rows[i]["class"], rows[i]["xmin"], rows[i]["ymin"], rows[i]["xmax"], rows[i]["ymax"],
+                int(image_sizes[i, 0]), int(image_sizes[i, 1]))))
+    return len(label_files), len(rows), problems
+
+
+def validate_annotations(label_dir, txt_or_xml, img_dir_path, class_dict, num_workers=None, batch_size=64):
+    # check every label file in parallel before anything is encoded, so bad labels fail fast
+    files = label_files(label_dir, txt_or_xml)
+    batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+    validate = partial(validate_label_files, txt_or_xml=txt_or_xml, img_dir_path=img_dir_path, class_dict=class_dict)
+
+    start = time.perf_counter()
+    num_files = 0
+    num_boxes = 0
+    problems = []
+    with multiprocessing.Pool(num_workers) as pool:
+        for batch_files, batch_boxes, batch_problems in pool.imap_unordered(validate, batches):
+            num_files += batch_files
+            num_boxes += batch_boxes
+            problems.extend(batch_problems)
+    problems.sort()
+    print("Validated {} label files with {} boxes in {:.1f}s: {} problems".format(
+        num_files, num_boxes, time.perf_counter() - start, len(problems)))
+    for filename, problem in problems:
+        print("{}: {}".format(filename, problem))
+    return problems
+
+
+def shard_index(filename, num_shards):
+    # the same hash as the source id, so an image always lands in the same shard whatever the worker count
+    return int(hashlib.sha256(filename.encode("utf8")).hexdigest(), 16) % num_shards
+
+
+def shard_path(tfrecord, index, num_shards):
+    if num_shards == 1:
+        return tfrecord
+    return "{}-{:05d}-of-{:05d}".format(tfrecord, index, num_shards)
+
+
+def labels_hash(filename_object_group):
+    return hashlib.sha256(json.dumps(filename_object_group.object, sort_keys=True).encode("utf8")).hexdigest()
+
+
+def encode_example(filename_object_group_metadata, img_dir_path, class_dict, num_shards, export=None):
+    # images missing from the cache are probed here, in the worker, from the same bytes that are encoded, and the
+    # metadata sent back to be cached
+    filename_object_group, metadata = filename_object_group_metadata
+    image_path = os.path.join(img_dir_path, filename_object_group.filename)
+    with tf.io.gfile.GFile(image_path, "rb") as f:
+        encoded_jpg = f.read()
+    if metadata is None:
+        metadata = image_metadata(image_path, encoded_jpg)
+    tf_example = create_tf_example(filename_object_group, img_dir_path, class_dict, metadata, export, encoded_jpg)
+    return (filename_object_group.filename, shard_index(filename_object_group.filename, num_shards),
+            tf_example.SerializeToString(), metadata, labels_hash(filename_object_group))
+
+
+def with_metadata(filename_object_groups, img_dir_path, image_cache):
+    for filename_object_group in filename_object_groups:
+        yield filename_object_group, image_cache.lookup(os.path.join(img_dir_path, filename_object_group.filename))
+
+
+def bounded(iterable, pending):
+    # the pool reads its input as fast as it can, so hold it back until results make room
+    for item in iterable:
+        pending.acquire()
+        yield item
+
+
+def encode_examples(filename_object_group_metadatas, img_dir_path, class_dict, num_shards, num_workers=None,
+                    total=None, chunksize=8, export=None):
+    # examples are encoded in parallel and come back in the order they went in, with at most a few chunks per worker
+    # parsed ahead of the encoding
+    encode = partial(encode_example, img_dir_path=img_dir_path, class_dict=class_dict, num_shards=num_shards,
+                     export=export)
+    pending = threading.Semaphore(4 * chunksize * (num_workers or os.cpu_count() or 1))
+    with multiprocessing.Pool(num_workers) as pool:
+        for result in tqdm(pool.imap(encode, bounded(filename_object_group_metadatas, pending), chunksize=chunksize),
+                           total=total):
+            pending.release()
+            yield result
+
+
+def manifest_path(tfrecord):
+    return tfrecord + ".manifest.json"
+
+
+def build_options(class_dict, num_shards, export=None):
+    # anything that changes every example, so a manifest built with other options can't be reused
+    return {"num_shards": num_shards, "class_dict": class_dict, "export": export}
+
+
+def load_manifest(tfrecord):
+    try:
+        with open(manifest_path(tfrecord), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(tfrecord, options, examples, tfrecord_paths):
+    # each example's image and label hashes, the shard it's in, and its place in the label order, and the size of
+    # each shard to tell if it changed since
+    partial_path = manifest_path(tfrecord) + ".tmp"
+    with open(partial_path, "w") as f:
+        json.dump({"options": options, "examples": examples,
+                   "shards": [os.path.getsize(path) for path in tfrecord_paths]}, f)
+    os.replace(partial_path, manifest_path(tfrecord))
+
+
+def report_build(image_cache, image_paths):
+    image_cache.save()
+    print("Image metadata: {} cached, {} probed".format(image_cache.hits, image_cache.misses))
+    for paths in image_cache.duplicates(image_paths):
+        print("duplicate images:", ", ".join(paths))
+
+
+def build_tfrecords(filename_object_groups, img_dir_path, class_dict, tfrecord, num_shards=1, num_workers=None,
+                    total=None, chunksize=8, image_cache=None, export=None):
+    # examples come back in the order of the label files, so every shard's contents and order are the same from run
+    # to run
+    tfrecord_paths = [shard_path(tfrecord, index, num_shards) for index in range(num_shards)]
+    tfrecord_writers = [tf.compat.v1.python_io.TFRecordWriter(path) for path in tfrecord_paths]
+    image_cache = ImageCache(None) if image_cache is None else image_cache
+    image_paths = []
+    examples = {}
+
+    start = time.perf_counter()
+    num_bytes = 0
+    for filename, index, serialized, metadata, labels in encode_examples(
+            with_metadata(filename_object_groups, img_dir_path, image_cache), img_dir_path, class_dict, num_shards,
+            num_workers, total, chunksize, export):
+        image_path = os.path.join(img_dir_path, filename)
+        image_cache.update(image_path, metadata)
+        image_paths.append(image_path)
+        examples[filename] = {"image": metadata["sha256"], "labels": labels, "shard": index, "order": len(examples)}
+        tfrecord_writers[index].write(serialized)
+        num_bytes += len(serialized)
+
+    for tfrecord_writer in tfrecord_writers:
+        tfrecord_writer.close()
+    elapsed = time.perf_counter() - start
+    print("Encoded {} examples into {} shards in {:.1f}s: {:.1f} examples/s, {:.1f} MB/s".format(
+        len(examples), num_shards, elapsed, len(examples) / max(elapsed, 1e-9), num_bytes / 1e6 / max(elapsed, 1e-9)))
+
+    save_manifest(tfrecord, build_options(class_dict, num_shards, export), examples, tfrecord_paths)
+    report_build(image_cache, image_paths)
+    return tfrecord_paths
+
+
+def update_tfrecords(filename_object_groups, img_dir_path, class_dict, tfrecord, num_shards=1, num_workers=None,
+                     total=None, chunksize=8, image_cache=None, export=None):
+    # compare the images and labels against the last build's manifest, re-encode only new or changed examples, and
+    # rewrite only the shards they're in, copying their unchanged records over as they are
+    tfrecord_paths = [shard_path(tfrecord, index, num_shards) for index in range(num_shards)]
+    options = build_options(class_dict, num_shards, export)
+    manifest = load_manifest(tfrecord)
+    if (manifest is None or manifest["options"] != options or
+            [os.path.getsize(path) if os.path.exists(path) else None for path in tfrecord_paths] != manifest["shards"]):
+        print("No manifest matching these options and shards, building everything")
+        return build_tfrecords(filename_object_groups, img_dir_path, class_dict, tfrecord, num_shards, num_workers,
+                               total, chunksize, image_cache, export)
+
+    start = time.perf_counter()
+    image_cache = ImageCache(None) if image_cache is None else image_cache
+    image_paths = []
+    old_examples = manifest["examples"]
+    examples = {}
+    changed = []
+    for filename_object_group in filename_object_groups:
+        filename = filename_object_group.filename
+        image_path = os.path.join(img_dir_path, filename)
+        metadata = image_cache.lookup(image_path)
+        if metadata is None:
+            metadata = image_metadata(image_path)
+            image_cache.update(image_path, metadata)
+        image_paths.append(image_path)
+        examples[filename] = {"image": metadata["sha256"], "labels": labels_hash(filename_object_group),
+                              "shard": shard_index(filename, num_shards), "order": len(examples)}
+        old_example = old_examples.get(filename)
+        if (old_example is None or old_example["image"] != examples[filename]["image"] or
+                old_example["labels"] != examples[filename]["labels"]):
+            changed.append((filename_object_group, metadata))
+    removed = [filename for filename in old_examples if filename not in examples]
+    affected = sorted(set(examples[group.filename]["shard"] for group, _ in changed) |
+                      set(old_examples[filename]["shard"] for filename in removed))
+
+    encoded = {}
+    for filename, _, serialized, _, _ in encode_examples(changed, img_dir_path, class_dict, num_shards, num_workers,
+                                                         len(changed), chunksize, export):
+        encoded[filename] = serialized
+
+    # a shard's records are in the order of its examples in the manifest, which is how they're matched up
+    partial_paths = []
+    for index in affected:
+        old_filenames = sorted((filename for filename, example in old_examples.items() if example["shard"] == index),
+                               key=lambda filename: old_examples[filename]["order"])
+        old_records = list(tf.compat.v1.io.tf_record_iterator(tfrecord_paths[index]))
+        if len(old_records) != len(old_filenames):
+            for partial_path in partial_paths:
+                os.remove(partial_path)
+            raise ValueError("{} doesn't match its manifest, build without --incremental".format(tfrecord_paths[index]))
+
+        records = dict((filename, record) for filename, record in zip(old_filenames, old_records)
+                       if filename in examples and filename not in encoded)
+        records.update((filename, serialized) for filename, serialized in encoded.items()
+                       if examples[filename]["shard"] == index)
+        partial_paths.append(tfrecord_paths[index] + ".tmp")
+        tfrecord_writer = tf.compat.v1.python_io.TFRecordWriter(partial_paths[-1])
+        for filename in sorted(records, key=lambda filename: examples[filename]["order"]):
+            tfrecord_writer.write(records[filename])
+        tfrecord_writer.close()
+
+    for index, partial_path in zip(affected, partial_paths):
+        os.replace(partial_path, tfrecord_paths[index])
+    elapsed = time.perf_counter() - start
+    print("Encoded {} new or changed examples, removed {}, and rewrote {} of {} shards in {:.1f}s".format(
+        len(changed), len(removed), len(affected), num_shards, elapsed))
+
+    save_manifest(tfrecord, options, examples, tfrecord_paths)
+    report_build(image_cache, image_paths)
+    return [tfrecord_paths[index] for index in affected]
+
+
+def benchmark_read(tfrecord_paths, image_height=448, image_width=448):
+    # read, parse, and decode every example and resize it to the model's input size, as a training input pipeline
+    # does on every epoch
+    def decode(record):
+        features = tf.io.parse_single_example(record, {"image/encoded": tf.io.FixedLenFeature([], tf.string)})
+        return tf.image.resize(tf.io.decode_jpeg(features["image/encoded"], channels=3), (image_height, image_width))
+
+    dataset = tf.data.TFRecordDataset(tfrecord_paths).map(decode, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+    start = time.perf_counter()
+    num_examples = sum(1 for _ in dataset)
+    elapsed = time.perf_counter() - start
+    num_bytes = sum(os.path.getsize(path) for path in tfrecord_paths)
+    print("Read {} examples, {:.1f} MB, in {:.1f}s: {:.1f} examples/s, {:.1f} MB/s".format(
+        num_examples, num_bytes / 1e6, elapsed, num_examples / max(elapsed, 1e-9),
+        num_bytes / 1e6 / max(elapsed, 1e-9)))
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Create a TFRecord file for use with the TensorFlow Object Detection API.",
@@ -163,40 +631,85 @@ def main():
         required=True,
         type=str,
         help="TFRecord file to create")
+    parser.add_argument(
+        "--num_shards",
+        default=1,
+        type=int,
+        help="Number of TFRecord files to split the examples across, named <tfrecord>-00000-of-0000N")
+    parser.add_argument(
+        "--num_workers",
+        default=None,
+        type=int,
+        help="Number of processes encoding examples, one per core by default")
+    parser.add_argument(
+        "--image_cache",
+        default=None,
+        type=str,
+        help="JSON file caching each image's size, format, and content hash, <tfrecord>.image_cache.json by default")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Re-encode only new or changed examples and rewrite only their shards, using <tfrecord>.manifest.json")
+    parser.add_argument(
+        "--export_size",
+        default=None,
+        type=int,
+        nargs=2,
+        metavar=("WIDTH", "HEIGHT"),
+        help="Store the images resized to the model's input size, e.g. 448 448 for EfficientDet-Lite2")
+    parser.add_argument(
+        "--export_mode",
+        choices=["letterbox", "stretch"],
+        default="letterbox",
+        type=str,
+        help="Fit the images inside the export size keeping their aspect ratio, or stretch them to it")
+    parser.add_argument(
+        "--jpeg_quality",
+        default=90,
+        type=int,
+        help="JPEG quality of the resized images")
+    parser.add_argument(
+        "--benchmark_read",
+        action="store_true",
+        help="Time reading and decoding the TFRecords back, as a training input pipeline would")
+    parser.add_argument(
+        "--skip_validation",
+        action="store_true",
+        help="Encode without checking the labels and images first")
 
     args = parser.parse_args()
 
     label_dict = label_dict_from_pbtxt(args.pbtxt)
-    tfrecord_writer = tf.compat.v1.python_io.TFRecordWriter(args.tfrecord)
     img_dir_path = os.path.join(args.img_dir)
 
-    if args.txt_or_xml == "txt":
-        txt_to_csv(args.label_dir, tmp_csv)
-    elif args.txt_or_xml == "xml":
-        xml_to_csv(args.label_dir, tmp_csv)
+    # stop before encoding anything if any label is bad
+    if not args.skip_validation and validate_annotations(args.label_dir, args.txt_or_xml, img_dir_path, label_dict,
+                                                         args.num_workers):
+        print("Fix the labels above, or pass --skip_validation to encode anyway")
+        sys.exit(1)
 
-    examples = pd.read_csv(tmp_csv)
+    # annotations stream straight from the label files into the encoder, one image at a time
+    num_label_files, filename_object_groups = label_groups(args.label_dir, args.txt_or_xml)
 
-    try:
-        subprocess.run(["rm", "-rf", tmp_csv],
-                       stdout=subprocess.PIPE,
-                       universal_newlines=True,
-                       check=True)
-    except subprocess.CalledProcessError as error:
-        print(error)
-        sys.exit(1)
+    # image sizes, formats, and content hashes are kept between builds, next to the output rather than in the dataset
+    image_cache = ImageCache(args.image_cache or args.tfrecord + ".image_cache.json")
 
-    gb = examples.groupby("filename")
-    data = namedtuple("data", ["filename", "object"])
-    filename_object_groups = [data(filename, gb.get_group(x)) for filename, x in zip(gb.groups.keys(), gb.groups)]
+    # images resized to the model's input size once here, instead of on every epoch of training
+    export = None
+    if args.export_size is not None:
+        export = {"width": args.export_size[0], "height": args.export_size[1], "mode": args.export_mode,
+                  "quality": args.jpeg_quality}
 
-    for filename_object_group in tqdm(filename_object_groups):
-        tf_example = create_tf_example(filename_object_group, img_dir_path, label_dict)
-        tfrecord_writer.write(tf_example.SerializeToString())
+    build = update_tfrecords if args.incremental else build_tfrecords
+    tfrecord_paths = build(filename_object_groups, img_dir_path, label_dict, args.tfrecord, args.num_shards,
+                           args.num_workers, num_label_files, image_cache=image_cache, export=export)
+    for tfrecord_path in tfrecord_paths:
+        print("Successfully created the TFRecord: " + os.path.join(os.getcwd(), tfrecord_path))
 
-    tfrecord_writer.close()
-    tfrecord_path = os.path.join(os.getcwd(), args.tfrecord)
-    print("Successfully created the TFRecord: " + tfrecord_path)
+    if args.benchmark_read:
+        image_width, image_height = args.export_size if args.export_size is not None else (448, 448)
+        benchmark_read([shard_path(args.tfrecord, index, args.num_shards) for index in range(args.num_shards)],
+                       image_height, image_width)
 
 
 if __name__ == "__main__":